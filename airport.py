@@ -0,0 +1,228 @@
+from typing import List, Optional, Sequence, Tuple
+import argparse
+import math
+import os
+import re
+
+import numpy as np
+
+from projection import get_projection, RadarProjection
+
+PAODAO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'paodao.txt')
+
+
+class Threshold:
+    """跑道入口"""
+    def __init__(self, name: str, longitude: float, latitude: float) -> None:
+        self.name = name            # 跑道号，如05L
+        self.longitude = longitude
+        self.latitude = latitude
+        self.east = 0.0             # 局部平面坐标 m
+        self.north = 0.0
+
+    def __repr__(self) -> str:
+        return f'Threshold({self.name}, {self.longitude}, {self.latitude})'
+
+
+class Runway:
+    """一条跑道，两端各一个入口，沿跑道坐标以第一个入口为原点、指向第二个入口"""
+    def __init__(self, name: str, ends: Tuple[Threshold, Threshold]) -> None:
+        self.name = name            # 跑道左/跑道右
+        self.ends = ends
+        self.length = 0.0           # 跑道长度 m
+        self.direction = (0.0, 1.0) # 沿跑道的单位向量（东, 北）
+
+    @property
+    def designator(self) -> str:
+        """跑道号，如05L/23R"""
+        return '/'.join(end.name for end in self.ends)
+
+    def locate(self, east: np.ndarray, north: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """点相对跑道的坐标，返回(沿跑道偏移, 侧向偏移) m，沿跑道以第一个入口为0"""
+        de, dn = east - self.ends[0].east, north - self.ends[0].north
+        ue, un = self.direction
+        return de * ue + dn * un, dn * ue - de * un
+
+
+class CorridorConfig:
+    """跑道走廊：沿跑道中线向两端延伸，起点宽度half_width，离开跑道后按splay展开"""
+    def __init__(self, approach_length: float = 20000.0, departure_length: float = 10000.0,
+                 half_width: float = 150.0, splay: float = 0.15) -> None:
+        self.approach_length = approach_length      # 进近段长度（入口外） m
+        self.departure_length = departure_length    # 离场段长度（跑道末端外） m
+        self.half_width = half_width                # 跑道处的半宽 m
+        self.splay = splay                          # 每米延伸增加的半宽
+
+    @property
+    def extension(self) -> float:
+        """走廊在跑道两端外延伸的长度，一端的进近区即另一端的离场区"""
+        return max(self.approach_length, self.departure_length)
+
+    def half_width_at(self, along: np.ndarray, length: float) -> np.ndarray:
+        """沿跑道偏移处的走廊半宽"""
+        outside = np.maximum(np.maximum(-along, along - length), 0.0)
+        return self.half_width + self.splay * outside
+
+
+class PlotTags:
+    """批量标记的结果，与输入的点一一对应"""
+    def __init__(self, n: int) -> None:
+        self.runway = np.full(n, -1, dtype=np.int64)        # 所在走廊的跑道序号，-1为不在走廊内
+        self.along = np.full(n, np.nan)                     # 沿跑道偏移 m
+        self.cross = np.full(n, np.nan)                     # 侧向偏移 m
+        self.threshold = np.full(n, -1, dtype=np.int64)     # 最近的跑道入口序号
+        self.distance = np.full(n, np.nan)                  # 到最近跑道入口的距离 m
+
+
+class AirportGeometry:
+    """
+    机场几何：跑道、入口与起降走廊，统一投影到以雷达为中心的局部平面
+    用规则网格索引走廊，批量标记时只对所在网格涉及的走廊做精确判断
+    """
+    def __init__(self, radar: Tuple[float, float], runways: Sequence[Runway],
+                 corridor: Optional[CorridorConfig] = None, cell_size: float = 1000.0) -> None:
+        self.radar = radar                                  # 雷达(经度, 纬度)
+        self.runways = list(runways)
+        self.corridor = corridor or CorridorConfig()
+        self.cell_size = cell_size                          # 网格边长 m
+        self.projection: RadarProjection = get_projection(*radar)
+        self.thresholds: List[Threshold] = [end for runway in self.runways for end in runway.ends]
+        for threshold in self.thresholds:
+            east, north = self.projection.geodetic_to_enu(threshold.longitude, threshold.latitude)
+            threshold.east, threshold.north = float(east), float(north)
+        for runway in self.runways:
+            a, b = runway.ends
+            de, dn = b.east - a.east, b.north - a.north
+            runway.length = math.hypot(de, dn)
+            runway.direction = (de / runway.length, dn / runway.length)
+        self.__build_grid()
+
+    def corridor_polygon(self, runway: Runway) -> np.ndarray:
+        """走廊的多边形顶点（东, 北），形状(8, 2)"""
+        ext, length = self.corridor.extension, runway.length
+        w0 = self.corridor.half_width
+        w1 = float(self.corridor.half_width_at(np.array(-ext), length))
+        along = np.array([-ext, 0.0, length, length + ext, length + ext, length, 0.0, -ext])
+        cross = np.array([w1, w0, w0, w1, -w1, -w0, -w0, -w1])
+        ue, un = runway.direction
+        a = runway.ends[0]
+        return np.stack([a.east + along * ue + cross * un, a.north + along * un - cross * ue], axis=1)
+
+    def __build_grid(self) -> None:
+        """建立网格索引: 每个网格记录可能与之相交的走廊"""
+        polygons = [self.corridor_polygon(runway) for runway in self.runways]
+        if polygons:
+            points = np.concatenate(polygons)
+            self.origin = points.min(axis=0)
+            shape = np.ceil((points.max(axis=0) - self.origin) / self.cell_size).astype(np.int64) + 1
+        else:
+            self.origin, shape = np.zeros(2), np.ones(2, dtype=np.int64)
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.grid = np.zeros(self.shape + (len(self.runways),), dtype=bool)
+        centers_e = self.origin[0] + (np.arange(self.shape[0]) + 0.5) * self.cell_size
+        centers_n = self.origin[1] + (np.arange(self.shape[1]) + 0.5) * self.cell_size
+        ce, cn = np.meshgrid(centers_e, centers_n, indexing='ij')
+        # 网格中心到走廊的判断放宽半个网格对角线，保证不漏
+        margin = self.cell_size * math.sqrt(2) / 2
+        for k, runway in enumerate(self.runways):
+            along, cross = runway.locate(ce, cn)
+            width = self.corridor.half_width_at(along, runway.length)
+            ext = self.corridor.extension
+            self.grid[:, :, k] = (along >= -ext - margin) & (along <= runway.length + ext + margin) \
+                & (np.abs(cross) <= width + margin * (1 + self.corridor.splay))
+
+    def cells(self, east: np.ndarray, north: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """点所在的网格，返回(行, 列, 是否在网格范围内)"""
+        i = np.floor((east - self.origin[0]) / self.cell_size)
+        j = np.floor((north - self.origin[1]) / self.cell_size)
+        inside = (i >= 0) & (i < self.shape[0]) & (j >= 0) & (j < self.shape[1])
+        return np.where(inside, i, 0).astype(np.int64), np.where(inside, j, 0).astype(np.int64), inside
+
+    def tag(self, east: np.ndarray, north: np.ndarray) -> PlotTags:
+        """批量标记点所在的跑道走廊、沿跑道/侧向偏移与最近的跑道入口"""
+        east = np.asarray(east, dtype=np.float64)
+        north = np.asarray(north, dtype=np.float64)
+        result = PlotTags(len(east))
+        if self.thresholds:
+            te = np.array([t.east for t in self.thresholds])
+            tn = np.array([t.north for t in self.thresholds])
+            distance = np.hypot(east[:, None] - te, north[:, None] - tn)
+            finite = ~np.isnan(east) & ~np.isnan(north)
+            nearest = np.argmin(np.where(np.isnan(distance), np.inf, distance), axis=1)
+            result.threshold = np.where(finite, nearest, -1)
+            result.distance = np.where(finite, distance[np.arange(len(east)), nearest], np.nan)
+        with np.errstate(invalid='ignore'):
+            i, j, inside = self.cells(east, north)
+        best = np.full(len(east), np.inf)
+        for k, runway in enumerate(self.runways):
+            # 只对网格涉及该走廊的点做精确判断
+            candidate = np.flatnonzero(inside & self.grid[i, j, k])
+            if len(candidate) == 0:
+                continue
+            along, cross = runway.locate(east[candidate], north[candidate])
+            ext = self.corridor.extension
+            hit = (along >= -ext) & (along <= runway.length + ext) \
+                & (np.abs(cross) <= self.corridor.half_width_at(along, runway.length)) \
+                & (np.abs(cross) < best[candidate])
+            rows = candidate[hit]
+            best[rows] = np.abs(cross[hit])
+            result.runway[rows] = k
+            result.along[rows] = along[hit]
+            result.cross[rows] = cross[hit]
+        return result
+
+
+def load_airport(path: str = PAODAO_PATH, corridor: Optional[CorridorConfig] = None,
+                 cell_size: float = 1000.0) -> AirportGeometry:
+    """读取paodao.txt中的跑道入口与雷达坐标"""
+    runways: List[Runway] = []
+    radar: Optional[Tuple[float, float]] = None
+    section = ''
+    ends: List[Threshold] = []
+    with open(path, 'r', encoding='UTF-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            match = re.match(r'([\d.]+)\s*,\s*([\d.]+)\s*(?:\((.*)\))?', line)
+            if match is None:
+                # 标题行
+                section = line
+                ends = []
+                continue
+            longitude, latitude = float(match.group(1)), float(match.group(2))
+            if section.startswith('跑道'):
+                name = match.group(3).split()[-1] if match.group(3) else f'{section}{len(ends) + 1}'
+                ends.append(Threshold(name, longitude, latitude))
+                if len(ends) == 2:
+                    runways.append(Runway(section, (ends[0], ends[1])))
+            elif section.startswith('雷达'):
+                radar = (longitude, latitude)
+    if radar is None:
+        raise ValueError(f'没有雷达坐标: {path}')
+    return AirportGeometry(radar, runways, corridor, cell_size)
+
+
+_airport: Optional[AirportGeometry] = None
+
+
+def get_airport() -> AirportGeometry:
+    """默认的机场几何（paodao.txt），只读取一次"""
+    global _airport
+    if _airport is None:
+        _airport = load_airport()
+    return _airport
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='机场几何')
+    parser.add_argument('--path', default=PAODAO_PATH)
+    args = parser.parse_args()
+
+    airport = load_airport(args.path)
+    print(f'雷达 {airport.radar}，网格 {airport.shape[0]}x{airport.shape[1]}')
+    for runway in airport.runways:
+        a, b = runway.ends
+        heading = math.degrees(math.atan2(*runway.direction)) % 360
+        print(f'{runway.name} {runway.designator}: 长{runway.length:.0f}m 方向{heading:.1f}° '
+              f'{a.name}({a.east:.0f}, {a.north:.0f}) {b.name}({b.east:.0f}, {b.north:.0f})')
@@ -1,7 +1,13 @@
-from typing import Any, Generator, List
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple, Union
+from multiprocessing import Pool
 import re
+import warnings
 from datetime import datetime
-from openpyxl import Workbook
+
+import numpy as np
+
+from exporter import export
+from timestamps import datetime_to_ns
 
 FILE_PATH = './AWOS202008010000.SJN'
 
@@ -49,26 +55,25 @@ class AutomaticObservationData:
         result.END_SingleData = SingleEndedData.fromSource(sourc_list[4])
         return result
     
+    # 导出的列
+    EXPORT_HEADS: List[str] = ['date_time', 'runway_num', 'TDZ_num', 'MID_num', 'END_num', 
+        'TDZ_DATA_num', 'TDZ_DATA_RVR_1', 'TDZ_DATA_RVR_10', 'TDZ_DATA_MOR_1', 'TDZ_DATA_MOR_10', 'TDZ_DATA_B1', 'TDZ_DATA_windS2', 'TDZ_DATA_windF2', 'TDZ_DATA_winS10', 'TDZ_DATA_windF10', 'TDZ_DATA_windS', 'TDZ_DATA_windF', 'TDZ_DATA_Qnh', 'TDZ_DATA_Qfe', 'TDZ_DATA_Temp', 'TDZ_DATA_Hum', 'TDZ_DATA_Td', 'TDZ_DATA_roadTemp', 'TDZ_DATA_LowCBase', 'TDZ_DATA_MediaCBase', 'TDZ_DATA_HighCBase', 'TDZ_DATA_VV', 'TDZ_DATA_WEA', 'TDZ_DATA_Pi', 'TDZ_DATA_PREC', 
+        'MID_DATA_num', 'MID_DATA_RVR_1', 'MID_DATA_RVR_10', 'MID_DATA_MOR_1', 'MID_DATA_MOR_10', 'MID_DATA_B1', 'MID_DATA_windS2', 'MID_DATA_windF2', 'MID_DATA_winS10', 'MID_DATA_windF10', 'MID_DATA_windS', 'MID_DATA_windF', 'MID_DATA_Qnh', 'MID_DATA_Qfe', 'MID_DATA_Temp', 'MID_DATA_Hum', 'MID_DATA_Td', 'MID_DATA_roadTemp', 'MID_DATA_LowCBase', 'MID_DATA_MediaCBase', 'MID_DATA_HighCBase', 'MID_DATA_VV', 'MID_DATA_WEA', 'MID_DATA_Pi', 'MID_DATA_PREC', 
+        'END_DATA_num', 'END_DATA_RVR_1', 'END_DATA_RVR_10', 'END_DATA_MOR_1', 'END_DATA_MOR_10', 'END_DATA_B1', 'END_DATA_windS2', 'END_DATA_windF2', 'END_DATA_winS10', 'END_DATA_windF10', 'END_DATA_windS', 'END_DATA_windF', 'END_DATA_Qnh', 'END_DATA_Qfe', 'END_DATA_Temp', 'END_DATA_Hum', 'END_DATA_Td', 'END_DATA_roadTemp', 'END_DATA_LowCBase', 'END_DATA_MediaCBase', 'END_DATA_HighCBase', 'END_DATA_VV', 'END_DATA_WEA', 'END_DATA_Pi', 'END_DATA_PREC']
+
+    def dump_json(self) -> Dict[str, Any]:
+        """获取对象的数据，三端数据展开为 端_DATA_字段"""
+        result = {key: getattr(self, key) for key in self.keys()[:5]}
+        for end in ('TDZ', 'MID', 'END'):
+            single: SingleEndedData = getattr(self, end + '_SingleData')
+            for key, value in single.__dict__.items():
+                result[f'{end}_DATA_{key}'] = value
+        return result
+
     @classmethod
-    def to_excel(cls, data_list: List['AutomaticObservationData'], path: str) -> None:
-        """导出Excel"""
-        wb = Workbook()
-        ws = wb.active
-        title_list = ['date_time', 'runway_num', 'TDZ_num', 'MID_num', 'END_num', 
-            'TDZ_DATA_num', 'TDZ_DATA_RVR_1', 'TDZ_DATA_RVR_10', 'TDZ_DATA_MOR_1', 'TDZ_DATA_MOR_10', 'TDZ_DATA_B1', 'TDZ_DATA_windS2', 'TDZ_DATA_windF2', 'TDZ_DATA_winS10', 'TDZ_DATA_windF10', 'TDZ_DATA_windS', 'TDZ_DATA_windF', 'TDZ_DATA_Qnh', 'TDZ_DATA_Qfe', 'TDZ_DATA_Temp', 'TDZ_DATA_Hum', 'TDZ_DATA_Td', 'TDZ_DATA_roadTemp', 'TDZ_DATA_LowCBase', 'TDZ_DATA_MediaCBase', 'TDZ_DATA_HighCBase', 'TDZ_DATA_VV', 'TDZ_DATA_WEA', 'TDZ_DATA_Pi', 'TDZ_DATA_PREC', 
-            'MID_DATA_num', 'MID_DATA_RVR_1', 'MID_DATA_RVR_10', 'MID_DATA_MOR_1', 'MID_DATA_MOR_10', 'MID_DATA_B1', 'MID_DATA_windS2', 'MID_DATA_windF2', 'MID_DATA_winS10', 'MID_DATA_windF10', 'MID_DATA_windS', 'MID_DATA_windF', 'MID_DATA_Qnh', 'MID_DATA_Qfe', 'MID_DATA_Temp', 'MID_DATA_Hum', 'MID_DATA_Td', 'MID_DATA_roadTemp', 'MID_DATA_LowCBase', 'MID_DATA_MediaCBase', 'MID_DATA_HighCBase', 'MID_DATA_VV', 'MID_DATA_WEA', 'MID_DATA_Pi', 'MID_DATA_PREC', 
-            'END_DATA_num', 'END_DATA_RVR_1', 'END_DATA_RVR_10', 'END_DATA_MOR_1', 'END_DATA_MOR_10', 'END_DATA_B1', 'END_DATA_windS2', 'END_DATA_windF2', 'END_DATA_winS10', 'END_DATA_windF10', 'END_DATA_windS', 'END_DATA_windF', 'END_DATA_Qnh', 'END_DATA_Qfe', 'END_DATA_Temp', 'END_DATA_Hum', 'END_DATA_Td', 'END_DATA_roadTemp', 'END_DATA_LowCBase', 'END_DATA_MediaCBase', 'END_DATA_HighCBase', 'END_DATA_VV', 'END_DATA_WEA', 'END_DATA_Pi', 'END_DATA_PREC']
-        for i, title in enumerate(title_list):
-            ws.cell(row=1, column=i+1, value=title)
-        for i, data in enumerate(data_list):
-            for j, title in enumerate(title_list):
-                if j < 5:
-                    value = data[title]
-                else:
-                    index = title[:3] + '_SingleData'
-                    value = data[index][title[9:]]
-                ws.cell(row=i+2, column=j+1, value=value)
-        wb.save(path)
+    def to_excel(cls, data_list: Iterable['AutomaticObservationData'], path: str, format: Optional[str] = None) -> None:
+        """导出Excel，format默认取文件扩展名"""
+        export((data.dump_json() for data in data_list), cls.EXPORT_HEADS, path, format)
 
 class SingleEndedData:
     """单端的自观数据"""
@@ -163,23 +168,184 @@ class SingleEndedData:
         return result
 
 
-def read_data() -> str:
+def read_data(path: str = FILE_PATH) -> str:
     """读取文件数据"""
-    with open(FILE_PATH, 'r', encoding='UTF-8') as f:
+    with open(path, 'r', encoding='UTF-8') as f:
         return f.read()
 
-def analysis_data(source: str) -> Generator:
-    """拆分文件数据为单个数据项"""
-    pattern = r'ZCZC\n.*?\nNNNN'
-    for value in re.findall(pattern, source, re.M | re.S):
-        yield value[5:-5]
+
+def read_lines(paths: Union[str, Iterable[str]]) -> Generator[str, None, None]:
+    """逐行读取一个或多个文件"""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        with open(path, 'r', encoding='UTF-8') as f:
+            yield from f
+
+
+def iter_blocks(lines: Iterable[str]) -> Generator[List[str], None, None]:
+    """逐行扫描ZCZC…NNNN数据块，返回块内的行（不含ZCZC、NNNN）"""
+    block: Optional[List[str]] = None
+    for line in lines:
+        line = line.strip()
+        if line == 'ZCZC':
+            block = []
+        elif line == 'NNNN':
+            if block is not None:
+                yield block
+            block = None
+        elif block is not None and line:
+            block.append(line)
+
+
+def analysis_data(source: Union[str, Iterable[str]]) -> Generator[str, None, None]:
+    """拆分文件数据为单个数据项，source为整个文件的文本或逐行的迭代器"""
+    if isinstance(source, str):
+        source = source.splitlines()
+    for block in iter_blocks(source):
+        yield '\n'.join(block)
+
+
+# 单端数据中的数值字段，按数据行中的顺序（端编号之后，WEA为文本）
+NUMERIC_FIELDS = ['RVR_1', 'RVR_10', 'MOR_1', 'MOR_10', 'B1', 'windS2', 'windF2', 'winS10', 'windF10', 'windS',
+                  'windF', 'Qnh', 'Qfe', 'Temp', 'Hum', 'Td', 'roadTemp', 'LowCBase', 'MediaCBase', 'HighCBase', 'VV']
+TAIL_NUMERIC_FIELDS = ['Pi', 'PREC']
+WEA_INDEX = 1 + len(NUMERIC_FIELDS)     # WEA在数据行中的位置
+LINE_TOKENS = WEA_INDEX + 1 + len(TAIL_NUMERIC_FIELDS)  # 端编号与24个字段，之后的字段忽略
+
+# 端的位置
+END_TDZ = 0
+END_MID = 1
+END_END = 2
+
+# 单端自观测数据的紧凑记录，每个数据块三条（TDZ、MID、END）
+AWOS_DTYPE = np.dtype([
+    ('time', 'i8'),             # 观测时间，纪元以来的纳秒
+    ('runway_num', 'S4'),       # 跑道编号
+    ('end', 'S8'),              # 端的键: TDZ/END为端编号（如05L），MID为两端编号（如05L/23R）
+    ('position', 'u1'),         # END_TDZ/END_MID/END_END
+] + [(name, 'f8') for name in NUMERIC_FIELDS + TAIL_NUMERIC_FIELDS] + [
+    ('WEA', 'S16'),             # 天气现象原文
+    ('WEA_intensity', 'i1'),    # 强度: -1小 0中 1大，2为附近(VC)
+    ('WEA_descriptor', 'S2'),   # 特征: SH阵性 TS雷暴 FZ冻 等
+    ('WEA_phenomena', 'S8'),    # 天气现象: RA雨 SN雪 BR轻雾 等
+])
+
+_WEA_PATTERN = re.compile(r'^(\+|-|VC)?(MI|BC|PR|DR|BL|SH|TS|FZ)?([A-Z]*)$')
+_WEA_INTENSITY = {'-': -1, None: 0, '+': 1, 'VC': 2}
+_wea_cache: Dict[str, Tuple[int, bytes, bytes]] = {}
+
+
+def parse_weather(code: str) -> Tuple[int, bytes, bytes]:
+    """解析天气现象编码，如-SHRA，返回(强度, 特征, 天气现象)"""
+    result = _wea_cache.get(code)
+    if result is None:
+        match = _WEA_PATTERN.match(code)
+        if match is None:
+            result = (0, b'', code.encode()[:8])
+        else:
+            result = (_WEA_INTENSITY[match.group(1)], (match.group(2) or '').encode(), match.group(3).encode())
+        _wea_cache[code] = result
+    return result
+
+
+# 数值字段的预处理: 缺失为nan，去掉P/M前缀（大于/小于）
+_NUMERIC_TABLE = str.maketrans({'P': None, 'M': None})
+
+
+def _to_floats(text: str, count: int) -> np.ndarray:
+    """批量把空格分隔的字段转换为浮点，缺失或无法解析为NaN"""
+    text = text.replace('///', 'nan').translate(_NUMERIC_TABLE)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        result = np.fromstring(text, sep=' ')
+    if len(result) == count:
+        return result
+    # 有无法解析的字段时逐个转换
+    result = np.full(count, np.nan)
+    for i, token in enumerate(text.split()[:count]):
+        try:
+            result[i] = float(token)
+        except ValueError:
+            pass
+    return result
+
+
+def stream_records(lines: Iterable[str], batch_size: int = 65536) -> Generator[np.ndarray, None, None]:
+    """
+    逐块解析自观测数据，每批返回约batch_size条AWOS_DTYPE记录，内存与文件大小无关
+    数据行不足24个字段时缺失的按///处理，多出的字段忽略，格式错误的数据块跳过
+    """
+    numeric_count = len(NUMERIC_FIELDS) + len(TAIL_NUMERIC_FIELDS)
+    heads: List[tuple] = []         # (时间, 跑道编号, 端, 位置, WEA)
+    numbers: List[str] = []         # 每行的数值字段，空格分隔
+    time_cache: Dict[str, int] = {}   # 同一时间组的多个数据块只解析一次时间
+    padding = ['///'] * LINE_TOKENS
+    for block in iter_blocks(lines):
+        if len(block) < 5:
+            continue
+        ns = time_cache.get(block[0])
+        if ns is None:
+            try:
+                date_value = [int(v) for v in block[0].split(':')]
+                ns = datetime_to_ns(datetime(*date_value[:5]))
+            except (ValueError, TypeError):
+                continue
+            if len(time_cache) > 1024:
+                time_cache.clear()
+            time_cache[block[0]] = ns
+        runway = block[1].split()
+        if len(runway) < 4:
+            continue
+        ends = (runway[1], f'{runway[1]}/{runway[3]}', runway[3])
+        for position in (END_TDZ, END_MID, END_END):
+            line = block[2 + position].split()
+            if len(line) < LINE_TOKENS:
+                line += padding[len(line):]
+            heads.append((ns, runway[0], ends[position], position, line[WEA_INDEX]))
+            numbers.append(' '.join(line[1:WEA_INDEX]))
+            numbers.append(' '.join(line[WEA_INDEX + 1:LINE_TOKENS]))
+        if len(heads) >= batch_size:
+            yield _make_records(heads, numbers, numeric_count)
+            heads, numbers = [], []
+    if heads:
+        yield _make_records(heads, numbers, numeric_count)
+
+
+def _make_records(heads: List[tuple], numbers: List[str], numeric_count: int) -> np.ndarray:
+    result = np.zeros(len(heads), dtype=AWOS_DTYPE)
+    times, runway_nums, ends, positions, weathers = zip(*heads)
+    result['time'] = times
+    result['runway_num'] = runway_nums
+    result['end'] = ends
+    result['position'] = positions
+    values = _to_floats(' '.join(numbers), len(heads) * numeric_count).reshape(len(heads), numeric_count)
+    for i, name in enumerate(NUMERIC_FIELDS + TAIL_NUMERIC_FIELDS):
+        result[name] = values[:, i]
+    weathers = ['' if code == '///' else code for code in weathers]
+    result['WEA'] = weathers
+    parsed = [parse_weather(code) if code else (0, b'', b'') for code in weathers]
+    result['WEA_intensity'], result['WEA_descriptor'], result['WEA_phenomena'] = zip(*parsed)
+    return result
+
+
+def _load_file(path: str) -> np.ndarray:
+    batches = list(stream_records(read_lines(path)))
+    return np.concatenate(batches) if batches else np.zeros(0, dtype=AWOS_DTYPE)
+
+
+def load_records(paths: Union[str, Iterable[str]], workers: int = 1) -> np.ndarray:
+    """读取一个或多个自观测文件的全部记录，workers>1时多进程按文件并行解析"""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    if workers > 1 and len(paths) > 1:
+        with Pool(processes=workers) as pool:
+            results = pool.map(_load_file, paths)
+    else:
+        results = [_load_file(path) for path in paths]
+    return np.concatenate(results) if results else np.zeros(0, dtype=AWOS_DTYPE)
 
 
 if __name__ == '__main__':
-    source = read_data()
-    data_list = analysis_data(source)
-    su_list = []
-    for data in data_list:
-        a = AutomaticObservationData.fromSource(data)
-        su_list.append(a)
+    data_list = analysis_data(read_lines(FILE_PATH))
+    su_list = (AutomaticObservationData.fromSource(data) for data in data_list)
     AutomaticObservationData.to_excel(su_list, '自观测.xlsx')
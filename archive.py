@@ -0,0 +1,370 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+import argparse
+import json
+import os
+
+import numpy as np
+
+from exporter import get_exporter, select_columns
+from plane_data import SecondaryRadar048, stream_file
+from plot_batch import empty_batch, plot_times, VALID_CALLSIGN, VALID_ICAO, VALID_SOURCE, VALID_TRACK_NUMBER
+from sensors import source_key
+from timestamps import datetime_to_ns, ns_to_datetime, SECOND_NS
+from track_store import PlaneTrackData, TrackStore, TRACK_TIMEOUT_NS
+
+# 归档格式版本
+ARCHIVE_VERSION = 1
+# 默认的时间分区 1小时
+PARTITION_NS = 3600 * SECOND_NS
+
+CATALOG_FILE = 'catalog.json'   # 段列表与已归档的文件
+INDEX_FILE = 'index.npz'        # 二级索引: 键 -> 段
+
+# 二级索引的键: 名称 -> (有效位, 键的类型)
+INDEX_KEYS = {
+    'ICAO': (VALID_ICAO, 'u4'),
+    'callsign': (VALID_CALLSIGN, 'S8'),
+    'track_number': (VALID_TRACK_NUMBER, 'u2'),
+    'source': (VALID_SOURCE, 'u2'),     # SAC << 8 | SIC
+}
+
+
+def _index_values(plots: np.ndarray, name: str) -> np.ndarray:
+    """点迹中某个键的值，不含无效的"""
+    flag, dtype = INDEX_KEYS[name]
+    mask = (plots['valid'] & flag) != 0
+    if name == 'source':
+        return (plots['SAC'][mask].astype(np.uint16) << 8) | plots['SIC'][mask]
+    return plots[name][mask].astype(dtype)
+
+
+def _save_atomic(path: str, save: Any) -> None:
+    """先写临时文件再替换，中断时不留下写了一半的文件"""
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        save(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+class Segment:
+    """一个段: 同一时间分区内按时间排序的点迹，以及对应的时间数组"""
+    def __init__(self, id: int, name: str, partition: int, start: int, end: int, count: int) -> None:
+        self.id = id
+        self.name = name                # 相对归档目录的路径，不含扩展名
+        self.partition = partition      # 分区号（时间 // 分区长度）
+        self.start = start              # 最早的点迹时间 ns
+        self.end = end                  # 最晚的点迹时间 ns
+        self.count = count              # 点迹数
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class Archive:
+    """
+    点迹归档: 按时间分区的段文件、段内排序的时间索引，以及ICAO/航班号/航迹号/SAC-SIC到段的二级索引
+    查询时只读取时间与键都可能匹配的段，段文件以内存映射读取
+    """
+    def __init__(self, path: str, partition: int = PARTITION_NS) -> None:
+        self.path = path
+        self.partition = partition
+        self.segments: List[Segment] = []
+        self.sources: Dict[str, Dict[str, float]] = {}     # 已归档的文件 -> 大小、修改时间
+        # 键 -> (按键排序的键, 对应的段号)
+        self.index: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            name: (np.zeros(0, dtype=dtype), np.zeros(0, dtype=np.int32)) for name, (_, dtype) in INDEX_KEYS.items()
+        }
+        self.__load()
+
+    def __load(self) -> None:
+        catalog_path = os.path.join(self.path, CATALOG_FILE)
+        if not os.path.exists(catalog_path):
+            return
+        with open(catalog_path, 'r', encoding='UTF-8') as f:
+            catalog = json.load(f)
+        if catalog.get('version') != ARCHIVE_VERSION:
+            raise ValueError(f'不支持的归档版本: {catalog.get("version")}')
+        self.partition = catalog['partition']
+        self.segments = [Segment(**i) for i in catalog['segments']]
+        self.sources = catalog['sources']
+        with np.load(os.path.join(self.path, INDEX_FILE)) as data:
+            self.index = {name: (data[f'{name}_keys'], data[f'{name}_segments']) for name in INDEX_KEYS}
+
+    def __save(self) -> None:
+        """先写段文件，最后写索引与目录，中断时目录中只有完整的段"""
+        os.makedirs(self.path, exist_ok=True)
+        arrays = {}
+        for name, (keys, segments) in self.index.items():
+            arrays[f'{name}_keys'] = keys
+            arrays[f'{name}_segments'] = segments
+        _save_atomic(os.path.join(self.path, INDEX_FILE), lambda f: np.savez(f, **arrays))
+        catalog = {
+            'version': ARCHIVE_VERSION,
+            'partition': self.partition,
+            'segments': [segment.as_dict() for segment in self.segments],
+            'sources': self.sources,
+        }
+        _save_atomic(os.path.join(self.path, CATALOG_FILE),
+                     lambda f: f.write(json.dumps(catalog, ensure_ascii=False, indent=1).encode('UTF-8')))
+
+    def __segment_path(self, segment: Segment, suffix: str = '') -> str:
+        return os.path.join(self.path, segment.name + suffix + '.npy')
+
+    def __write_segment(self, partition: int, plots: np.ndarray, times: np.ndarray) -> Segment:
+        """写入一个段，plots已按时间排序"""
+        id = max([segment.id for segment in self.segments] + [-1]) + 1
+        prefix = ns_to_datetime(partition * self.partition).strftime('%Y%m%d/%H%M')
+        segment = Segment(id, f'{prefix}-{id:06d}', partition, int(times[0]), int(times[-1]), len(plots))
+        os.makedirs(os.path.dirname(self.__segment_path(segment)), exist_ok=True)
+        _save_atomic(self.__segment_path(segment), lambda f: np.save(f, plots))
+        _save_atomic(self.__segment_path(segment, '.time'), lambda f: np.save(f, times))
+        self.segments.append(segment)
+        return segment
+
+    def __add_index(self, segments: List[Segment], plots: List[np.ndarray]) -> None:
+        """把新段中出现的键加入二级索引"""
+        for name in INDEX_KEYS:
+            keys, ids = [self.index[name][0]], [self.index[name][1]]
+            for segment, data in zip(segments, plots):
+                values = np.unique(_index_values(data, name))
+                keys.append(values)
+                ids.append(np.full(len(values), segment.id, dtype=np.int32))
+            keys, ids = np.concatenate(keys), np.concatenate(ids)
+            order = np.lexsort((ids, keys))
+            self.index[name] = (keys[order], ids[order])
+
+    def __remove_index(self, ids: Iterable[int]) -> None:
+        for name, (keys, segments) in self.index.items():
+            keep = ~np.isin(segments, list(ids))
+            self.index[name] = (keys[keep], segments[keep])
+
+    def append(self, plots: np.ndarray, source: Optional[str] = None, save: bool = True) -> List[Segment]:
+        """
+        归档一批点迹，按时间分区写入新的段
+        source 点迹来自的文件，记录后同一文件不再重复归档
+        save 是否写入目录，为False时新的段在之后写入目录时才可见
+        """
+        written = []
+        datas = []
+        if len(plots):
+            times = plot_times(plots)
+            order = np.argsort(times, kind='stable')
+            plots, times = plots[order], times[order]
+            partitions = times // self.partition
+            bounds = np.flatnonzero(np.diff(partitions)) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(plots)]):
+                written.append(self.__write_segment(int(partitions[start]), plots[start:end], times[start:end]))
+                datas.append(plots[start:end])
+            self.__add_index(written, datas)
+        if source is not None:
+            stat = os.stat(source)
+            self.sources[os.path.abspath(source)] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        if save:
+            self.__save()
+        return written
+
+    def contains(self, source: str) -> bool:
+        """该文件（大小、修改时间都未变）是否已归档"""
+        stat = os.stat(source)
+        info = self.sources.get(os.path.abspath(source))
+        return info is not None and info['size'] == stat.st_size and info['mtime'] == stat.st_mtime
+
+    def ingest(self, file_path: str, batch_size: int = 65536) -> int:
+        """
+        解码并归档一个文件（文本或二进制记录），已归档的文件跳过，返回归档的点迹数
+        整个文件归档完才写入目录，中断后重新归档不会重复
+        """
+        if self.contains(file_path):
+            return 0
+        count = 0
+        pending: List[np.ndarray] = []
+        size = 0
+        for batch in stream_file(file_path, batch_size):
+            pending.append(batch)
+            size += len(batch)
+            # 攒够再写，避免段太碎
+            if size >= batch_size * 16:
+                self.append(np.concatenate(pending), save=False)
+                count += size
+                pending, size = [], 0
+        self.append(np.concatenate(pending) if pending else empty_batch(), file_path)
+        return count + size
+
+    def compact(self) -> int:
+        """把同一分区的多个段合并为一个，返回合并掉的段数"""
+        groups: Dict[int, List[Segment]] = {}
+        for segment in self.segments:
+            groups.setdefault(segment.partition, []).append(segment)
+        removed = 0
+        for partition, segments in groups.items():
+            if len(segments) < 2:
+                continue
+            plots = np.concatenate([self.read(segment) for segment in segments])
+            times = plot_times(plots)
+            order = np.argsort(times, kind='stable')
+            merged = self.__write_segment(partition, plots[order], times[order])
+            self.__add_index([merged], [plots])
+            ids = {segment.id for segment in segments}
+            self.__remove_index(ids)
+            self.segments = [segment for segment in self.segments if segment.id not in ids]
+            self.__save()
+            for segment in segments:
+                os.remove(self.__segment_path(segment))
+                os.remove(self.__segment_path(segment, '.time'))
+            removed += len(segments) - 1
+        return removed
+
+    def read(self, segment: Segment) -> np.ndarray:
+        """读取一个段的全部点迹（内存映射）"""
+        return np.load(self.__segment_path(segment), mmap_mode='r')
+
+    def __candidates(self, start: Optional[int], end: Optional[int], keys: Dict[str, Any]) -> List[Segment]:
+        """时间范围与各键都可能匹配的段"""
+        segments = [segment for segment in self.segments
+                    if (start is None or segment.end >= start) and (end is None or segment.start < end)]
+        for name, value in keys.items():
+            index_keys, index_segments = self.index[name]
+            value = np.array(value, dtype=INDEX_KEYS[name][1])
+            lo, hi = np.searchsorted(index_keys, value, 'left'), np.searchsorted(index_keys, value, 'right')
+            ids = set(index_segments[lo:hi].tolist())
+            segments = [segment for segment in segments if segment.id in ids]
+        return segments
+
+    def query(self, start: Optional[int] = None, end: Optional[int] = None, ICAO: Optional[int] = None,
+              callsign: Optional[str] = None, track_number: Optional[int] = None, SAC: Optional[int] = None,
+              SIC: Optional[int] = None) -> np.ndarray:
+        """
+        查询[start, end)内（纳秒时间戳，None为不限）满足所有指定键的点迹，按时间排序
+        SAC与SIC需同时指定
+        """
+        keys: Dict[str, Any] = {}
+        if ICAO is not None:
+            keys['ICAO'] = ICAO
+        if callsign is not None:
+            keys['callsign'] = callsign.encode()
+        if track_number is not None:
+            keys['track_number'] = track_number
+        if SAC is not None or SIC is not None:
+            if SAC is None or SIC is None:
+                raise ValueError('SAC与SIC需同时指定')
+            keys['source'] = source_key(SAC, SIC)
+        results = []
+        for segment in self.__candidates(start, end, keys):
+            times = np.load(self.__segment_path(segment, '.time'), mmap_mode='r')
+            lo = 0 if start is None else int(np.searchsorted(times, start, 'left'))
+            hi = len(times) if end is None else int(np.searchsorted(times, end, 'left'))
+            if lo >= hi:
+                continue
+            plots = self.read(segment)[lo:hi]
+            mask = np.ones(len(plots), dtype=bool)
+            for name, value in keys.items():
+                flag, dtype = INDEX_KEYS[name]
+                if name == 'source':
+                    column = (plots['SAC'].astype(np.uint16) << 8) | plots['SIC']
+                else:
+                    column = plots[name]
+                mask &= ((plots['valid'] & flag) != 0) & (column == np.array(value, dtype=dtype))
+            results.append((times[lo:hi][mask], np.array(plots[mask])))
+        if not results:
+            return empty_batch()
+        times = np.concatenate([i[0] for i in results])
+        plots = np.concatenate([i[1] for i in results])
+        return plots[np.argsort(times, kind='stable')]
+
+    def tracks(self, start: Optional[int] = None, end: Optional[int] = None, timeout: int = TRACK_TIMEOUT_NS,
+               **keys: Any) -> List[PlaneTrackData]:
+        """
+        查询[start, end)内有点迹、满足所有指定键的完整航迹
+        航迹可能超出时间范围，向前后按航迹超时扩展，直到两端都没有同一航迹的点迹
+        """
+        plots = self.query(start, end, **keys)
+        if len(plots) == 0:
+            return []
+        times = plot_times(plots)
+        while True:
+            lo, hi = int(times[0]), int(times[-1])
+            wider = self.query(lo - timeout, hi + timeout + 1, **keys)
+            if len(wider) == len(plots):
+                break
+            plots, times = wider, plot_times(wider)
+        store = TrackStore(timeout)
+        result = store.add_batch(plots) + store.close_all()
+        return [track for track in result
+                if (start is None or track.last_time >= start) and (end is None or track.first_time < end)]
+
+    def summary(self) -> str:
+        if not self.segments:
+            return f'{self.path}: 空'
+        count = sum(segment.count for segment in self.segments)
+        start = min(segment.start for segment in self.segments)
+        end = max(segment.end for segment in self.segments)
+        return (f'{self.path}: {len(self.segments)}段 {count}个点迹 {len(self.sources)}个文件 '
+                f'{ns_to_datetime(start)} ~ {ns_to_datetime(end)} '
+                f'ICAO {len(np.unique(self.index["ICAO"][0]))}个 航班号 {len(np.unique(self.index["callsign"][0]))}个')
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    """ISO格式的时间（UTC）转换为纳秒时间戳"""
+    if value is None:
+        return None
+    return datetime_to_ns(datetime.fromisoformat(value))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='点迹归档与查询')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help='解码数据文件并归档，已归档的文件跳过')
+    p.add_argument('archive')
+    p.add_argument('files', nargs='+', help='文本或二进制记录文件')
+    p.add_argument('--partition', type=float, default=PARTITION_NS / SECOND_NS / 3600, help='时间分区 h（新建时有效）')
+    p = sub.add_parser('query', help='按时间范围与键查询点迹或航迹')
+    p.add_argument('archive')
+    p.add_argument('--start', help='开始时间（含），ISO格式，如2020-08-01T08:00:00')
+    p.add_argument('--end', help='结束时间（不含）')
+    p.add_argument('--icao', help='ICAO码，16进制')
+    p.add_argument('--callsign', help='航班号')
+    p.add_argument('--track-number', type=int)
+    p.add_argument('--sac', type=int)
+    p.add_argument('--sic', type=int)
+    p.add_argument('--tracks', action='store_true', help='返回完整航迹')
+    p.add_argument('--track-timeout', type=float, default=TRACK_TIMEOUT_NS / 1e9, help='航迹超时 s')
+    p.add_argument('-o', '--output', help='导出到文件（xlsx/csv/parquet），不指定时只输出摘要')
+    p = sub.add_parser('info', help='查看归档')
+    p.add_argument('archive')
+    p = sub.add_parser('compact', help='合并同一分区的段')
+    p.add_argument('archive')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        archive = Archive(args.archive, int(args.partition * 3600 * SECOND_NS))
+        for file_path in args.files:
+            print(f'归档{file_path}: {archive.ingest(file_path)}个点迹 -- {datetime.now().time()}')
+        print(archive.summary())
+    elif args.command == 'query':
+        archive = Archive(args.archive)
+        keys = {'ICAO': int(args.icao, 16) if args.icao else None, 'callsign': args.callsign,
+                'track_number': args.track_number, 'SAC': args.sac, 'SIC': args.sic}
+        keys = {k: v for k, v in keys.items() if v is not None}
+        start, end = parse_time(args.start), parse_time(args.end)
+        if args.tracks:
+            tracks = archive.tracks(start, end, int(args.track_timeout * 1e9), **keys)
+            for track in tracks:
+                print(f'{track.flight_num} ICAO={track.plane_ICAO and format(track.plane_ICAO, "06X")} '
+                      f'{ns_to_datetime(track.first_time)} ~ {ns_to_datetime(track.last_time)} {track.count}个点迹')
+            plots = np.concatenate([track.track_data for track in tracks]) if tracks else empty_batch()
+        else:
+            plots = archive.query(start, end, **keys)
+            print(f'{len(plots)}个点迹')
+        if args.output:
+            heads = SecondaryRadar048.EXPORT_HEADS
+            with get_exporter(args.output, heads, types=SecondaryRadar048.EXPORT_TYPES) as exporter:
+                exporter.write_rows(select_columns(SecondaryRadar048.dump_batch(plots), heads))
+    elif args.command == 'info':
+        print(Archive(args.archive).summary())
+    else:
+        archive = Archive(args.archive)
+        print(f'合并掉{archive.compact()}个段')
+        print(archive.summary())
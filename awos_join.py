@@ -0,0 +1,130 @@
+from typing import Any, Dict, Generator, List, Optional, Sequence
+import argparse
+import math
+
+import numpy as np
+
+from airport import AirportGeometry, get_airport
+from exporter import DATETIME, FLOAT, STR
+from flight_phase import PhaseResult, TRACK_NAMES
+from timestamps import ns_to_datetime
+from track_store import PlaneTrackData
+
+# 参与关联的数值字段（AWOS_DTYPE的字段名）
+WEATHER_FIELDS = ['RVR_1', 'RVR_10', 'MOR_1', 'MOR_10', 'windS2', 'windF2', 'winS10', 'windF10', 'windS', 'windF',
+                  'Qnh', 'Qfe', 'Temp', 'Hum', 'Td']
+WEATHER_DTYPE = np.dtype([(name, 'f8') for name in WEATHER_FIELDS])
+
+# 观测的有效期，超过这么久没有新观测视为缺失
+MAX_AGE_NS = 10 * 60 * 10**9
+
+
+class AWOSIndex:
+    """
+    按跑道端建立的自观测时间索引，每个端一组按时间排序的数值列
+    端的键与AWOS_DTYPE的end一致: 着陆端/停止端为跑道号（如05L），中间端为跑道的两个端号（如05L/23R）
+    """
+    def __init__(self, max_age: int = MAX_AGE_NS) -> None:
+        self.max_age = max_age                      # 观测的有效期 ns
+        self.times: Dict[str, np.ndarray] = {}      # 观测时间 ns
+        self.values: Dict[str, np.ndarray] = {}     # WEATHER_DTYPE数组
+
+    @classmethod
+    def from_records(cls, records: np.ndarray, max_age: int = MAX_AGE_NS) -> 'AWOSIndex':
+        """由airport_data.stream_records/load_records的记录建立索引"""
+        result = cls(max_age)
+        if len(records) == 0:
+            return result
+        order = np.lexsort((records['time'], records['end']))
+        records = records[order]
+        ends = records['end']
+        starts = np.flatnonzero(np.r_[True, ends[1:] != ends[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(records)]):
+            key = ends[start].decode()
+            result.times[key] = records['time'][start:end].copy()
+            result.values[key] = np.empty(end - start, dtype=WEATHER_DTYPE)
+            for name in WEATHER_FIELDS:
+                result.values[key][name] = records[name][start:end]
+        return result
+
+    def ends(self) -> List[str]:
+        return list(self.times.keys())
+
+    def lookup(self, end: str, times: np.ndarray) -> np.ndarray:
+        """某个端在各时刻生效的观测（不晚于该时刻的最近一次），没有时为NaN"""
+        times = np.asarray(times, dtype=np.int64)
+        result = np.full(len(times), np.nan, dtype=WEATHER_DTYPE)
+        obs_times = self.times.get(end)
+        if obs_times is None or len(times) == 0:
+            return result
+        i = np.searchsorted(obs_times, times, side='right') - 1
+        ok = (i >= 0) & (times - obs_times[np.maximum(i, 0)] <= self.max_age)
+        result[ok] = self.values[end][i[ok]]
+        return result
+
+    def lookup_many(self, ends: Sequence[str], times: np.ndarray) -> np.ndarray:
+        """各点在各自端、各自时刻生效的观测"""
+        ends = np.asarray(ends, dtype=object)
+        times = np.asarray(times, dtype=np.int64)
+        result = np.full(len(times), np.nan, dtype=WEATHER_DTYPE)
+        for end in set(ends.tolist()):
+            if end is None:
+                continue
+            mask = ends == end
+            result[mask] = self.lookup(end, times[mask])
+        return result
+
+
+def join_movements(tracks: Sequence[PlaneTrackData], phases: PhaseResult, index: AWOSIndex,
+                   airport: Optional[AirportGeometry] = None) -> Generator[Dict[str, Any], None, None]:
+    """
+    把起降时刻在起降跑道端生效的观测关联到每个起降的航迹
+    phases 为classify_tracks(tracks)的结果，没有确定起降时刻或跑道的航迹不输出
+    """
+    airport = airport or get_airport()
+    known = np.flatnonzero((phases.threshold >= 0) & (phases.event_time != 0))
+    ends = [airport.thresholds[phases.threshold[i]].name for i in known]
+    weather = index.lookup_many(ends, phases.event_time[known])
+    for row, i in enumerate(known):
+        track = tracks[i]
+        result = {
+            'flight_num': track.flight_num,
+            'ICAO': hex(track.plane_ICAO) if track.plane_ICAO is not None else None,
+            'kind': TRACK_NAMES[phases.kind[i]],
+            'event_time': ns_to_datetime(int(phases.event_time[i])),
+            'runway': ends[row],
+        }
+        for name in WEATHER_FIELDS:
+            value = float(weather[name][row])
+            result[name] = None if math.isnan(value) else value
+        yield result
+
+
+MOVEMENT_HEADS = ['flight_num', 'ICAO', 'kind', 'event_time', 'runway'] + WEATHER_FIELDS
+MOVEMENT_TYPES = dict({'flight_num': STR, 'ICAO': STR, 'kind': STR, 'event_time': DATETIME, 'runway': STR},
+                      **{name: FLOAT for name in WEATHER_FIELDS})
+
+
+if __name__ == '__main__':
+    from airport_data import load_records
+    from exporter import export
+    from flight_phase import classify_tracks
+    from plane_data import stream_file
+    from track_store import TrackStore
+
+    parser = argparse.ArgumentParser(description='把起降时刻的自观测数据关联到航迹')
+    parser.add_argument('radar', help='雷达数据文件')
+    parser.add_argument('awos', nargs='+', help='自观测.SJN文件')
+    parser.add_argument('-o', '--output', default='起降气象.xlsx', help='输出文件，格式取扩展名')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE_NS / 6e10, help='观测的有效期 min')
+    args = parser.parse_args()
+
+    index = AWOSIndex.from_records(load_records(args.awos), int(args.max_age * 6e10))
+    store = TrackStore()
+    tracks = []
+    for batch in stream_file(args.radar):
+        tracks.extend(store.add_batch(batch))
+    tracks.extend(store.close_all())
+    rows = export(join_movements(tracks, classify_tracks(tracks), index), MOVEMENT_HEADS, args.output,
+                  types=MOVEMENT_TYPES)
+    print(f'{args.output}: {rows}条起降')
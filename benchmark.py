@@ -0,0 +1,171 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from exporter import get_exporter, select_columns
+from flight_phase import classify_tracks, TRACK_LANDING, TRACK_TAKEOFF
+from plane_data import SecondaryRadar048, stream_file, track_plots
+from synthetic import TrafficConfig, write_traffic
+from track_store import PlaneTrackData, TrackStore
+
+# 结果文件的格式版本
+RESULT_VERSION = 1
+
+
+def peak_rss() -> Optional[float]:
+    """进程的峰值常驻内存 MB，不支持的平台为None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux为KB，macOS为字节
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def timed(repeat: int, func: Callable[[], Any]) -> Tuple[float, Any]:
+    """运行repeat次，返回最短耗时 s 与最后一次的结果"""
+    best = float('inf')
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def decode_stage(path: str) -> List[np.ndarray]:
+    return [track_plots(batch) for batch in stream_file(path)]
+
+
+def group_stage(batches: List[np.ndarray]) -> List[PlaneTrackData]:
+    store = TrackStore()
+    tracks = []
+    for batch in batches:
+        tracks.extend(store.add_batch(batch))
+    tracks.extend(store.close_all())
+    return tracks
+
+
+def export_stage(tracks: List[PlaneTrackData], kinds: np.ndarray, directory: str, format: str) -> int:
+    """导出起飞与降落的航迹，返回行数"""
+    heads = SecondaryRadar048.EXPORT_HEADS
+    rows = 0
+    types = SecondaryRadar048.EXPORT_TYPES
+    with get_exporter(os.path.join(directory, f'take.{format}'), heads, format, types) as take, \
+            get_exporter(os.path.join(directory, f'land.{format}'), heads, format, types) as land:
+        for track, kind in zip(tracks, kinds):
+            if kind == TRACK_TAKEOFF:
+                exporter = take
+            elif kind == TRACK_LANDING:
+                exporter = land
+            else:
+                continue
+            exporter.write_rows(select_columns(SecondaryRadar048.dump_batch(track.track_data), heads))
+            rows += track.count
+    return rows
+
+
+def run_benchmark(path: str, repeat: int = 1, format: str = 'csv') -> Dict[str, Any]:
+    """
+    依次测量解码、航迹归类、飞行阶段判断、导出各阶段的耗时
+    每个阶段运行repeat次取最短耗时，吞吐量按文件大小与CAT048点迹数计算
+    """
+    size = os.path.getsize(path)
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    seconds, batches = timed(repeat, lambda: decode_stage(path))
+    records = sum(len(batch) for batch in batches)
+    stages['decode'] = {'seconds': seconds, 'records': records}
+
+    seconds, tracks = timed(repeat, lambda: group_stage(batches))
+    stages['group'] = {'seconds': seconds, 'tracks': len(tracks)}
+
+    seconds, phases = timed(repeat, lambda: classify_tracks(tracks))
+    stages['classify'] = {'seconds': seconds, 'takeoff': int(np.sum(phases.kind == TRACK_TAKEOFF)),
+                          'landing': int(np.sum(phases.kind == TRACK_LANDING))}
+
+    with tempfile.TemporaryDirectory() as directory:
+        seconds, rows = timed(repeat, lambda: export_stage(tracks, phases.kind, directory, format))
+    stages['export'] = {'seconds': seconds, 'rows': rows, 'format': format}
+
+    for stage in stages.values():
+        stage['records_per_s'] = records / stage['seconds'] if stage['seconds'] else None
+        stage['MB_per_s'] = size / 1e6 / stage['seconds'] if stage['seconds'] else None
+    total = sum(stage['seconds'] for stage in stages.values())
+    return {
+        'version': RESULT_VERSION,
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'input': {'path': path, 'bytes': size, 'records': records},
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'repeat': repeat,
+        'stages': stages,
+        'total': {
+            'seconds': total,
+            'records_per_s': records / total if total else None,
+            'MB_per_s': size / 1e6 / total if total else None,
+        },
+        'peak_rss_MB': peak_rss(),
+    }
+
+
+def print_result(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    """打印各阶段的耗时与吞吐量，有基准结果时给出相对基准的耗时比"""
+    print(f"{result['input']['path']}: {result['input']['bytes'] / 1e6:.1f}MB {result['input']['records']}个点迹")
+    rows = list(result['stages'].items()) + [('total', result['total'])]
+    for name, stage in rows:
+        line = f"{name:>10} {stage['seconds']:9.3f}s {stage['records_per_s'] or 0:12.0f}点迹/s {stage['MB_per_s'] or 0:8.2f}MB/s"
+        if baseline is not None:
+            base = baseline['total'] if name == 'total' else baseline['stages'].get(name)
+            if base and base['seconds']:
+                line += f"  x{stage['seconds'] / base['seconds']:.2f}"
+        print(line)
+    if result['peak_rss_MB'] is not None:
+        print(f"峰值内存 {result['peak_rss_MB']:.1f}MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='测量解码、航迹归类、飞行阶段判断与导出的性能')
+    parser.add_argument('input', nargs='?', help='雷达数据文件，不指定时生成合成数据')
+    parser.add_argument('-n', '--aircraft', type=int, default=200, help='合成数据的飞机数')
+    parser.add_argument('-d', '--duration', type=float, default=3600.0, help='合成数据的时长 s')
+    parser.add_argument('--rec', action='store_true', help='合成数据写为二进制记录')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='每个阶段运行的次数，取最短耗时')
+    parser.add_argument('-f', '--format', choices=['xlsx', 'csv', 'parquet'], default='csv', help='导出格式')
+    parser.add_argument('-o', '--output', help='结果保存为JSON')
+    parser.add_argument('--compare', help='与之前保存的JSON结果比较')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.input
+        config = None
+        if path is None:
+            path = os.path.join(directory, 'synthetic.rec' if args.rec else 'synthetic.txt')
+            config = TrafficConfig(args.aircraft, args.duration, seed=args.seed)
+            frames = write_traffic(path, config)
+            print(f'合成数据: {args.aircraft}架飞机 {args.duration:.0f}s {frames}帧')
+        result = run_benchmark(path, args.repeat, args.format)
+        if config is not None:
+            result['input']['synthetic'] = vars(config)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='UTF-8') as f:
+            baseline = json.load(f)
+    print_result(result, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,278 @@
+from typing import BinaryIO, Generator, Iterator, List, Optional, TextIO, Tuple
+import argparse
+import bz2
+import gzip
+import io
+import lzma
+import mmap
+import os
+import struct
+import zlib
+
+from metrics import METRICS
+
+# 压缩格式，按文件开头的魔数识别，与扩展名无关
+GZIP = 'gzip'
+BZIP2 = 'bz2'
+XZ = 'xz'
+ZSTD = 'zstd'
+MAGICS = ((GZIP, b'\x1f\x8b\x08'), (BZIP2, b'BZh'), (XZ, b'\xfd7zXZ\x00'), (ZSTD, b'\x28\xb5\x2f\xfd'))
+EXTENSIONS = {GZIP: '.gz', BZIP2: '.bz2', XZ: '.xz', ZSTD: '.zst'}
+
+# 读取压缩文件的缓冲区大小
+READ_BUFFER = 1024 * 1024
+# 写入压缩文件时每个独立成员（gzip成员、bz2/xz流、zstd帧）的原始数据大小
+MEMBER_SIZE = 16 * 1024 * 1024
+
+# bz2流头之后的第一个数据块的魔数（π的BCD码），与流头一起出现的概率可以忽略
+BZIP2_BLOCK_MAGIC = b'1AY&SY'
+# zstd可跳过帧（如seekable格式的索引）的魔数范围
+ZSTD_SKIPPABLE = 0x184D2A50
+ZSTD_SKIPPABLE_MASK = 0xFFFFFFF0
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """文件的压缩格式，不是压缩文件时为None"""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for codec, magic in MAGICS:
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def strip_extension(path: str) -> str:
+    """去掉压缩文件的扩展名，如 数据.txt.gz -> 数据.txt"""
+    for extension in EXTENSIONS.values():
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError('读取zstd压缩文件需要安装zstandard') from e
+    return zstandard
+
+
+def decompressing(fileobj: BinaryIO, codec: str) -> BinaryIO:
+    """从fileobj的当前位置开始解压，连续的多个成员（流、帧）依次解压为一个数据流"""
+    if codec == GZIP:
+        raw = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif codec == BZIP2:
+        raw = bz2.BZ2File(fileobj, 'rb')
+    elif codec == XZ:
+        raw = lzma.LZMAFile(fileobj, 'rb')
+    elif codec == ZSTD:
+        raw = _zstandard().ZstdDecompressor().stream_reader(fileobj, read_size=READ_BUFFER, read_across_frames=True)
+    else:
+        raise ValueError(f'未知的压缩格式: {codec}')
+    return io.BufferedReader(raw, READ_BUFFER)
+
+
+def open_text(path: str) -> TextIO:
+    """按UTF-8文本打开文件，压缩文件透明地边读边解压"""
+    codec = detect_compression(path)
+    if codec is None:
+        return open(path, 'r', encoding='UTF-8')
+    return io.TextIOWrapper(decompressing(open(path, 'rb', buffering=READ_BUFFER), codec), encoding='UTF-8')
+
+
+class _Slice(io.RawIOBase):
+    """只读取文件当前位置起size个字节"""
+    def __init__(self, file: BinaryIO, size: int) -> None:
+        self.file = file
+        self.remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        data = self.file.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def _zstd_frames(mm: mmap.mmap) -> Iterator[int]:
+    """
+    按帧头与块头逐帧跳过（不解压），返回每一帧的起始位置
+    seekable格式是若干独立的帧加上末尾可跳过帧中的索引，同样逐帧切分
+    """
+    size = len(mm)
+    position = 0
+    while position + 8 <= size:
+        yield position
+        magic, = struct.unpack_from('<I', mm, position)
+        if magic & ZSTD_SKIPPABLE_MASK == ZSTD_SKIPPABLE:
+            position += 8 + struct.unpack_from('<I', mm, position + 4)[0]
+            continue
+        if magic != 0xFD2FB528:
+            raise ValueError(f'zstd帧头错误: {position}')
+        descriptor = mm[position + 4]
+        single_segment = (descriptor >> 5) & 1
+        content_size = (1 if single_segment else 0, 2, 4, 8)[descriptor >> 6]
+        position += 5 + (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 3] + content_size
+        last = False
+        while not last:
+            header = mm[position] | (mm[position + 1] << 8) | (mm[position + 2] << 16)
+            last = bool(header & 1)
+            position += 3 + (1 if (header >> 1) & 3 == 1 else header >> 3)     # RLE块只有1个字节
+        if (descriptor >> 2) & 1:
+            position += 4   # 校验和
+
+
+def _find(mm: mmap.mmap, magic: bytes) -> Iterator[int]:
+    position = mm.find(magic, 1)
+    while position >= 0:
+        yield position
+        position = mm.find(magic, position + 1)
+
+
+def _candidates(mm: mmap.mmap, codec: str) -> Iterator[int]:
+    """可能的成员起始位置（不含0）"""
+    if codec == ZSTD:
+        frames = _zstd_frames(mm)
+        next(frames, None)
+        yield from frames
+    elif codec == GZIP:
+        for position in _find(mm, b'\x1f\x8b\x08'):
+            if position + 10 <= len(mm) and mm[position + 3] & 0xE0 == 0:     # 保留的标志位为0
+                yield position
+    elif codec == BZIP2:
+        for position in _find(mm, b'BZh'):
+            if mm[position + 3:position + 4].isdigit() and mm[position + 4:position + 10] == BZIP2_BLOCK_MAGIC:
+                yield position
+    elif codec == XZ:
+        for position in _find(mm, b'\xfd7zXZ\x00'):
+            flags = mm[position + 6:position + 8]
+            if len(flags) == 2 and struct.unpack_from('<I', mm, position + 8)[0] == zlib.crc32(flags):
+                yield position
+
+
+def _verify(mm: mmap.mmap, position: int, codec: str) -> bool:
+    """gzip的魔数较短，可能出现在压缩数据中，试着解压一小段确认是文本"""
+    if codec != GZIP:
+        return True
+    try:
+        data = zlib.decompressobj(31).decompress(mm[position:position + 65536], 4096)
+    except zlib.error:
+        return False
+    return bool(data) and data.isascii()
+
+
+def split_members(path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    把压缩文件按独立成员（gzip多成员、bz2/xz多流、zstd多帧或seekable格式）的边界切分为约chunk_size字节的若干段
+    每段可以单独解压；只有一个成员的文件无法切分
+    """
+    codec = detect_compression(path)
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        result = []
+        start = 0
+        for position in _candidates(mm, codec):
+            if position - start >= chunk_size and _verify(mm, position, codec):
+                result.append((start, position))
+                start = position
+    result.append((start, size))
+    return result
+
+
+def read_members(path: str, start: int, end: int) -> Generator[str, None, None]:
+    """
+    解压[start, end)范围内的成员，返回其中的行
+    成员边界不一定在行首: 不是第一段时跳过第一个换行之前的部分（属于前一段），
+    结尾读到下一段的第一个换行为止，使每一行恰好属于一段
+    """
+    codec = detect_compression(path)
+    lines = size = 0
+    try:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            reader = decompressing(_Slice(f, end - start), codec)
+            if start > 0 and not reader.readline().endswith(b'\n'):
+                return  # 整段都在一行之内，这一行属于前一段
+            tail = b''
+            for line in reader:
+                if not line.endswith(b'\n'):
+                    tail = line
+                    break
+                lines += 1
+                size += len(line)
+                line = line.strip()
+                if line:
+                    yield line.decode('UTF-8')
+            if end < os.fstat(f.fileno()).st_size:
+                f.seek(end)
+                tail += decompressing(f, codec).readline()
+            if tail:
+                lines += 1
+                size += len(tail)
+            line = tail.strip()
+            if line:
+                yield line.decode('UTF-8')
+    finally:
+        METRICS.inc('read_lines_total', lines)
+        METRICS.inc('read_bytes_total', size)
+
+
+def _compressor(codec: str):
+    if codec == GZIP:
+        return lambda data: gzip.compress(data, 6)
+    if codec == BZIP2:
+        return bz2.compress
+    if codec == XZ:
+        return lzma.compress
+    if codec == ZSTD:
+        return _zstandard().ZstdCompressor(level=3).compress
+    raise ValueError(f'未知的压缩格式: {codec}')
+
+
+def compress_file(src: str, dst: str, codec: str, member_size: int = MEMBER_SIZE) -> int:
+    """
+    按行把文件压缩为多个独立成员，每个成员约member_size字节原始数据，可以被多个进程并行解压
+    标准的gzip/bzip2/xz/zstd工具都能直接解压，返回成员数
+    """
+    compress = _compressor(codec)
+    count = 0
+    with open(src, 'rb') as f, open(dst, 'wb') as out:
+        while True:
+            data = f.read(member_size)
+            if not data:
+                break
+            data += f.readline()    # 对齐到行尾
+            out.write(compress(data))
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='压缩的雷达数据文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('compress', help='压缩为可并行解压的多成员文件')
+    p.add_argument('src')
+    p.add_argument('dst', nargs='?', help='默认为src加上压缩格式的扩展名')
+    p.add_argument('--codec', choices=list(EXTENSIONS), default=GZIP)
+    p.add_argument('--member-size', type=float, default=MEMBER_SIZE / 1024**2, help='每个成员的原始数据大小 MB')
+    p = sub.add_parser('info', help='查看压缩格式与可并行解压的分段')
+    p.add_argument('path')
+    p.add_argument('--chunk-size', type=float, default=64, help='分段大小 MB')
+    args = parser.parse_args()
+
+    if args.command == 'compress':
+        dst = args.dst or args.src + EXTENSIONS[args.codec]
+        count = compress_file(args.src, dst, args.codec, int(args.member_size * 1024**2))
+        print(f'{args.src} -> {dst}: {count}个成员, {os.path.getsize(args.src)} -> {os.path.getsize(dst)}字节')
+    else:
+        codec = detect_compression(args.path)
+        if codec is None:
+            print('不是压缩文件')
+        else:
+            ranges = split_members(args.path, int(args.chunk_size * 1024**2))
+            print(f'{codec}: {len(ranges)}段 {[end - start for start, end in ranges]}')
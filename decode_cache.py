@@ -0,0 +1,216 @@
+from typing import Callable, Generator, Iterable, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from metrics import METRICS
+from plot_batch import CAT048UAP_PATH, DECODER_VERSION, PLOT_DTYPE
+from track_store import PlaneTrackData, TrackStore, TRACK_TIMEOUT_NS
+
+# 缓存格式版本
+CACHE_VERSION = 2
+# 默认的缓存目录与容量
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'radar-decode')
+CACHE_SIZE = 2 * 1024**3
+# 解码并缓存的CAT
+CACHED_CATEGORIES = (48,)
+
+# 文件的键: stat 按路径、大小、修改时间，content 按内容的哈希（文件被复制、移动后仍可命中）
+KEY_STAT = 'stat'
+KEY_CONTENT = 'content'
+
+# 每条航迹的摘要
+TRACK_SUMMARY_DTYPE = np.dtype([
+    ('key', 'i8'),              # 航迹键
+    ('ICAO', 'u4'),             # ICAO码，没有为0
+    ('callsign', 'S8'),         # 航班号，没有为空
+    ('first_time', 'i8'),       # 最早的点迹时间 ns
+    ('last_time', 'i8'),        # 最晚的点迹时间 ns
+    ('count', 'i8'),            # 点迹数
+    ('first_FL', 'f8'),         # 时间上最早的飞行高度，没有为NaN
+    ('last_FL', 'f8'),          # 时间上最晚的飞行高度
+])
+
+
+def decoder_fingerprint(categories: Iterable[int] = CACHED_CATEGORIES) -> str:
+    """解码器的指纹: 解码逻辑版本、UAP表、列结构与解码的CAT，任何一项变化都使缓存失效"""
+    digest = hashlib.sha1()
+    digest.update(f'{CACHE_VERSION}:{DECODER_VERSION}:{PLOT_DTYPE.descr}:{sorted(categories)}'.encode())
+    with open(CAT048UAP_PATH, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def content_hash(path: str, chunk_size: int = 16 * 1024 * 1024) -> str:
+    """文件内容的哈希"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def summarize_tracks(tracks: Iterable[PlaneTrackData]) -> np.ndarray:
+    """航迹的摘要"""
+    rows = [(track.key, track.plane_ICAO or 0, (track.flight_num or '').encode(), track.first_time,
+             track.last_time, track.count, np.nan if track.first_FL is None else track.first_FL,
+             np.nan if track.last_FL is None else track.last_FL) for track in tracks]
+    return np.array(rows, dtype=TRACK_SUMMARY_DTYPE)
+
+
+class DecodeCache:
+    """
+    解码结果的磁盘缓存: 按文件（路径、大小、修改时间或内容哈希）与解码器指纹缓存CAT048的列式数组与航迹摘要
+    总大小超过max_bytes时按最近使用时间淘汰
+    """
+    def __init__(self, path: str = CACHE_DIR, max_bytes: int = CACHE_SIZE, key_mode: str = KEY_STAT,
+                 categories: Iterable[int] = CACHED_CATEGORIES, options: str = '') -> None:
+        if key_mode not in (KEY_STAT, KEY_CONTENT):
+            raise ValueError(f'未知的键: {key_mode}')
+        self.path = path
+        self.max_bytes = max_bytes
+        self.key_mode = key_mode
+        self.fingerprint = decoder_fingerprint(categories) + options     # options 影响解码结果的选项，如去重
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, file_path: str) -> str:
+        """文件在缓存中的键"""
+        if self.key_mode == KEY_CONTENT:
+            identity = content_hash(file_path)
+        else:
+            stat = os.stat(file_path)
+            identity = f'{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+        return hashlib.sha1(f'{self.fingerprint}:{identity}'.encode()).hexdigest()
+
+    def __file(self, key: str, suffix: str) -> str:
+        return os.path.join(self.path, key + suffix)
+
+    def get(self, file_path: str, key: Optional[str] = None) -> Optional[np.ndarray]:
+        """命中时返回缓存的点迹（内存映射，只读），未命中返回None"""
+        key = key or self.key(file_path)
+        data_path = self.__file(key, '.plots')
+        try:
+            size = os.path.getsize(data_path)
+            os.utime(self.__file(key, '.json'))     # 记录最近使用时间
+        except FileNotFoundError:
+            METRICS.inc('cache_misses_total')
+            return None
+        METRICS.inc('cache_hits_total')
+        if size == 0:
+            return np.zeros(0, dtype=PLOT_DTYPE)
+        return np.memmap(data_path, dtype=PLOT_DTYPE, mode='r')
+
+    def tracks(self, file_path: str, key: Optional[str] = None) -> Optional[np.ndarray]:
+        """缓存的航迹摘要，未命中返回None"""
+        try:
+            return np.load(self.__file(key or self.key(file_path), '.tracks.npy'))
+        except FileNotFoundError:
+            return None
+
+    def put(self, file_path: str, batches: Iterable[np.ndarray], key: Optional[str] = None,
+            timeout: int = TRACK_TIMEOUT_NS) -> Generator[np.ndarray, None, None]:
+        """
+        边产生边写入缓存，原样返回每一批
+        全部产生完才生效，中途出错或中止时丢弃写了一半的结果
+        """
+        key = key or self.key(file_path)
+        temp = self.__file(key, f'.plots.{os.getpid()}.tmp')
+        store = TrackStore(timeout)
+        tracks: List[PlaneTrackData] = []
+        done = False
+        try:
+            with open(temp, 'wb') as f:
+                for batch in batches:
+                    f.write(np.ascontiguousarray(batch, dtype=PLOT_DTYPE).tobytes())
+                    tracks.extend(store.add_batch(batch))
+                    yield batch
+            done = True
+        finally:
+            if not done:
+                os.remove(temp)
+        tracks.extend(store.close_all())
+        np.save(self.__file(key, '.tracks.npy'), summarize_tracks(tracks))
+        os.replace(temp, self.__file(key, '.plots'))
+        meta = {'version': CACHE_VERSION, 'file': os.path.abspath(file_path), 'created': time.time(),
+                'plots': os.path.getsize(self.__file(key, '.plots')) // PLOT_DTYPE.itemsize, 'tracks': len(tracks)}
+        with open(self.__file(key, '.json'), 'w', encoding='UTF-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        self.evict()
+
+    def stream(self, file_path: str, decode: Callable[[str], Iterable[np.ndarray]],
+               batch_size: int = 65536) -> Generator[np.ndarray, None, None]:
+        """命中时逐批返回缓存的点迹，未命中时用decode解码并写入缓存"""
+        key = self.key(file_path)
+        plots = self.get(file_path, key)
+        if plots is None:
+            yield from self.put(file_path, decode(file_path), key)
+            return
+        for start in range(0, len(plots), batch_size):
+            yield plots[start:start + batch_size]
+
+    def entries(self) -> List[Tuple[str, int, float]]:
+        """(键, 字节数, 最近使用时间)，按最近使用时间从旧到新"""
+        result = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            try:
+                used = os.path.getmtime(self.__file(key, '.json'))
+                size = sum(os.path.getsize(self.__file(key, suffix)) for suffix in ('.plots', '.tracks.npy', '.json'))
+            except FileNotFoundError:
+                continue    # 正被其它进程淘汰
+            result.append((key, size, used))
+        result.sort(key=lambda entry: entry[2])
+        return result
+
+    def remove(self, key: str) -> None:
+        # 先删除元数据，其它进程看不到元数据即视为未命中
+        for suffix in ('.json', '.plots', '.tracks.npy'):
+            try:
+                os.remove(self.__file(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def evict(self) -> int:
+        """淘汰最久未使用的条目直到总大小不超过max_bytes，返回淘汰的条数"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for key, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+            removed += 1
+        if removed:
+            METRICS.inc('cache_evictions_total', removed)
+        return removed
+
+    def clear(self) -> None:
+        for key, _, _ in self.entries():
+            self.remove(key)
+
+    def summary(self) -> str:
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        return f'{self.path}: {len(entries)}个文件 {total / 1e6:.1f}MB / {self.max_bytes / 1e6:.0f}MB'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='解码结果缓存')
+    parser.add_argument('command', choices=['info', 'clear', 'evict'])
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--cache-size', type=float, default=CACHE_SIZE / 1024**2, help='缓存容量 MB')
+    args = parser.parse_args()
+
+    cache = DecodeCache(args.cache_dir, int(args.cache_size * 1024**2))
+    if args.command == 'clear':
+        cache.clear()
+    elif args.command == 'evict':
+        print(f'淘汰{cache.evict()}条')
+    print(cache.summary())
@@ -0,0 +1,199 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Type
+from abc import ABC, abstractmethod
+import csv
+import os
+
+from openpyxl import Workbook
+
+# Excel单个工作表的最大行数（含表头）
+EXCEL_MAX_ROWS = 1048576
+
+# 列的类型，用于Parquet等有固定列类型的格式
+INT = 'int'
+FLOAT = 'float'
+STR = 'str'
+TIME = 'time'               # datetime.time
+DATETIME = 'datetime'       # datetime.datetime
+
+
+def select_columns(datas: Iterable[Dict[str, Any]], heads: Sequence[str]) -> Iterable[tuple]:
+    """按列选择把字典数据转换为行"""
+    for data in datas:
+        yield tuple(data.get(title) for title in heads)
+
+
+class Exporter(ABC):
+    """导出器基类，按行流式写入，types为列 -> 列的类型，子类须实现write_rows"""
+    extension = ''
+
+    def __init__(self, path: str, heads: Sequence[str], types: Optional[Dict[str, str]] = None) -> None:
+        self.path = path
+        self.heads = list(heads)    # 列选择
+        self.types = types or {}    # 列的类型，没有指定的列由格式自行推断
+        self.rows = 0               # 已写入的数据行数
+
+    @abstractmethod
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        """写入若干行，每行与heads一一对应"""
+
+    def flush(self) -> None:
+        """把已写入的行落盘，不支持时为空操作"""
+        pass
+
+    def close(self) -> None:
+        """完成写入"""
+        pass
+
+    def __enter__(self) -> 'Exporter':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class ExcelExporter(Exporter):
+    """openpyxl只写模式，超过单表行数上限时自动新建工作表"""
+    extension = '.xlsx'
+
+    def __init__(self, path: str, heads: Sequence[str], types: Optional[Dict[str, str]] = None,
+                 max_rows: int = EXCEL_MAX_ROWS) -> None:
+        super().__init__(path, heads, types)
+        self.max_rows = max_rows
+        self.wb = Workbook(write_only=True)
+        self.__new_sheet()
+
+    def __new_sheet(self) -> None:
+        """新建工作表并写入表头"""
+        index = len(self.wb.worksheets)
+        self.ws = self.wb.create_sheet('Sheet' if index == 0 else f'Sheet{index + 1}')
+        self.ws.append(self.heads)
+        self.sheet_rows = 1
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        for row in rows:
+            if self.sheet_rows >= self.max_rows:
+                self.__new_sheet()
+            self.ws.append(row)
+            self.sheet_rows += 1
+            self.rows += 1
+
+    def close(self) -> None:
+        self.wb.save(self.path)
+
+
+class CSVExporter(Exporter):
+    """CSV文件，带BOM以便Excel直接打开，append为True时追加到已有文件之后"""
+    extension = '.csv'
+
+    def __init__(self, path: str, heads: Sequence[str], types: Optional[Dict[str, str]] = None,
+                 append: bool = False) -> None:
+        super().__init__(path, heads, types)
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, 'a', encoding='utf-8', newline='')
+            self.writer = csv.writer(self.file)
+        else:
+            self.file = open(path, 'w', encoding='utf-8-sig', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.heads)
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        for row in rows:
+            self.writer.writerow(['' if v is None else v for v in row])
+            self.rows += 1
+
+    def flush(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetExporter(Exporter):
+    """
+    Parquet列式文件，按行组分批写入，需要pyarrow
+    指定了类型的列按types建立固定的表结构，所有行组一致；其余的列按第一个行组推断，全为空时为字符串
+    """
+    extension = '.parquet'
+
+    def __init__(self, path: str, heads: Sequence[str], types: Optional[Dict[str, str]] = None,
+                 row_group_size: int = 65536) -> None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError('导出Parquet需要安装pyarrow') from e
+        super().__init__(path, heads, types)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.row_group_size = row_group_size
+        arrow_types = {INT: pyarrow.int64(), FLOAT: pyarrow.float64(), STR: pyarrow.string(),
+                       TIME: pyarrow.time64('us'), DATETIME: pyarrow.timestamp('us')}
+        # 列 -> pyarrow类型，未指定类型的列为None，写入第一个行组时确定
+        self.fields: Dict[str, Any] = {title: arrow_types[self.types[title]] if title in self.types else None
+                                       for title in self.heads}
+        self.writer: Any = None
+        self.buffer: List[Sequence[Any]] = []
+
+    def __schema(self, columns: Optional[List[Sequence[Any]]] = None) -> Any:
+        """确定未指定类型的列的类型，返回表结构"""
+        for i, title in enumerate(self.heads):
+            if self.fields[title] is None:
+                inferred = self.pa.array(columns[i]).type if columns is not None else self.pa.null()
+                self.fields[title] = self.pa.string() if self.pa.types.is_null(inferred) else inferred
+        return self.pa.schema([(title, self.fields[title]) for title in self.heads])
+
+    def __flush(self) -> None:
+        """把缓存的行作为一个行组写入"""
+        if not self.buffer:
+            return
+        columns = list(zip(*self.buffer))
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self.__schema(columns))
+        schema = self.writer.schema
+        table = self.pa.table([self.pa.array(column, type=schema.field(title).type)
+                               for title, column in zip(self.heads, columns)], schema=schema)
+        self.writer.write_table(table)
+        self.buffer = []
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> None:
+        for row in rows:
+            self.buffer.append(row)
+            self.rows += 1
+            if len(self.buffer) >= self.row_group_size:
+                self.__flush()
+
+    def close(self) -> None:
+        self.__flush()
+        if self.writer is None:
+            # 没有数据时写入只有表头的空表
+            schema = self.__schema()
+            self.writer = self.pq.ParquetWriter(self.path, schema)
+            self.writer.write_table(schema.empty_table())
+        self.writer.close()
+
+
+EXPORTERS: Dict[str, Type[Exporter]] = {
+    'xlsx': ExcelExporter,
+    'csv': CSVExporter,
+    'parquet': ParquetExporter,
+}
+
+
+def get_exporter(path: str, heads: Sequence[str], format: Optional[str] = None,
+                 types: Optional[Dict[str, str]] = None) -> Exporter:
+    """按格式（默认取文件扩展名）创建导出器，types为列的类型"""
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip('.').lower()
+    exporter = EXPORTERS.get(format)
+    if exporter is None:
+        raise ValueError(f'不支持的导出格式: {format}')
+    return exporter(path, heads, types)
+
+
+def export(datas: Iterable[Dict[str, Any]], heads: Sequence[str], path: str,
+           format: Optional[str] = None, types: Optional[Dict[str, str]] = None) -> int:
+    """把字典数据按列选择导出到文件，返回写入的行数"""
+    with get_exporter(path, heads, format, types) as exporter:
+        exporter.write_rows(select_columns(datas, heads))
+    return exporter.rows
@@ -0,0 +1,195 @@
+from typing import Optional, Sequence
+import argparse
+
+import numpy as np
+
+from airport import AirportGeometry, get_airport
+from plot_batch import empty_batch, plot_times, VALID_FL, VALID_POLAR
+from sensors import get_sensors
+from track_store import PlaneTrackData
+
+# 点迹的飞行阶段
+PHASE_UNKNOWN = 0       # 没有有效高度
+PHASE_GROUND = 1        # 跑道附近贴近地面
+PHASE_CLIMB = 2         # 跑道附近爬升（起飞离场）
+PHASE_APPROACH = 3      # 跑道附近下降（最后进近）
+PHASE_CRUISE = 4        # 其它（平飞或远离机场）
+PHASE_NAMES = ['unknown', 'ground', 'climb', 'approach', 'cruise']
+
+# 航迹的类型
+TRACK_UNKNOWN = 0
+TRACK_TAKEOFF = 1
+TRACK_LANDING = 2
+TRACK_OVERFLIGHT = 3
+TRACK_NAMES = ['unknown', 'takeoff', 'landing', 'overflight']
+
+
+class PhaseConfig:
+    """飞行阶段判断的阈值，高度单位m，与FL字段一致"""
+    def __init__(self, smooth_window: int = 5, field_elevation: float = 479.0, ground_height: float = 100.0,
+                 overflight_FL: float = 2000.0, vertical_rate: float = 2.5, approach_radius: float = 20000.0,
+                 max_extrapolation: float = 600.0) -> None:
+        self.smooth_window = smooth_window          # 平滑高度的滑动窗口（点迹数）
+        self.field_elevation = field_elevation      # 机场标高（西安咸阳）
+        self.ground_height = ground_height          # 高于机场标高不超过该值视为贴近地面
+        self.overflight_FL = overflight_FL          # 最低高度超过该值视为飞越
+        self.vertical_rate = vertical_rate          # 爬升/下降率阈值 m/s（约500ft/min）
+        self.approach_radius = approach_radius      # 在跑道走廊内且离最近跑道入口不超过该距离才判断起降
+        self.max_extrapolation = max_extrapolation  # 没有看到接地时最多外推多久 s
+
+
+class PhaseResult:
+    """
+    飞行阶段判断结果
+    点迹级数组与输入的点迹顺序一致，航迹级数组按航迹键升序
+    """
+    def __init__(self, n: int, keys: np.ndarray) -> None:
+        self.phase = np.zeros(n, dtype=np.uint8)                # 每个点迹的阶段
+        self.smooth_FL = np.full(n, np.nan)                     # 平滑后的高度 m
+        self.vertical_rate = np.full(n, np.nan)                 # 垂直速率 m/s
+        self.keys = keys                                        # 航迹键
+        self.kind = np.zeros(len(keys), dtype=np.uint8)         # 航迹类型
+        self.event_time = np.zeros(len(keys), dtype=np.int64)   # 接地/离地时间 ns，无法确定时为0
+        self.runway = np.full(len(keys), -1, dtype=np.int64)    # 起降的跑道序号，-1为无
+        self.threshold = np.full(len(keys), -1, dtype=np.int64) # 起降方向的跑道入口序号，如05L，-1为无
+
+
+def classify(keys: np.ndarray, times: np.ndarray, FL: np.ndarray, east: np.ndarray, north: np.ndarray,
+             airport: Optional[AirportGeometry] = None, config: Optional[PhaseConfig] = None) -> PhaseResult:
+    """
+    按列判断所有航迹的飞行阶段，不逐条航迹循环
+    keys 每个点迹所属的航迹键，times 点迹时间 ns，FL 高度 m（缺失为NaN）
+    east/north 以雷达为中心的局部平面坐标 m
+    """
+    airport = airport or get_airport()
+    config = config or PhaseConfig()
+    n = len(keys)
+    # 按(航迹, 时间)排序
+    order = np.lexsort((times, keys))
+    k, t, fl = keys[order], times[order], FL[order]
+    new_seg = np.r_[True, k[1:] != k[:-1]] if n else np.zeros(0, dtype=bool)
+    starts = np.flatnonzero(new_seg)
+    result = PhaseResult(n, k[starts])
+    if n == 0:
+        return result
+    seg = np.cumsum(new_seg) - 1
+    seg_start = starts[seg]
+    seg_end = np.r_[starts[1:], n][seg]
+    index = np.arange(n)
+
+    # 航迹内的滑动平均，忽略缺失的高度
+    half = max(config.smooth_window // 2, 1)
+    ok = np.isfinite(fl)
+    sum_fl = np.r_[0.0, np.cumsum(np.where(ok, fl, 0.0))]
+    sum_ok = np.r_[0, np.cumsum(ok)]
+    lo = np.maximum(index - half, seg_start)
+    hi = np.minimum(index + half + 1, seg_end)
+    count = sum_ok[hi] - sum_ok[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        smooth = np.where(count > 0, (sum_fl[hi] - sum_fl[lo]) / count, np.nan)
+        # 航迹内的中心差分
+        dt = (t[hi - 1] - t[lo]) / 1e9
+        rate = np.where(dt > 0, (smooth[hi - 1] - smooth[lo]) / dt, np.nan)
+
+    tags = airport.tag(east[order], north[order])
+    near = (tags.runway >= 0) & (tags.distance <= config.approach_radius)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 沿跑道方向的速度，判断起降方向
+        along_rate = np.where(dt > 0, (tags.along[hi - 1] - tags.along[lo]) / dt, np.nan)
+
+    height = smooth - config.field_elevation
+    phase = np.full(n, PHASE_CRUISE, dtype=np.uint8)
+    phase[near & (rate >= config.vertical_rate)] = PHASE_CLIMB
+    phase[near & (rate <= -config.vertical_rate)] = PHASE_APPROACH
+    phase[near & (height <= config.ground_height) & ~(np.abs(rate) >= config.vertical_rate)] = PHASE_GROUND
+    phase[np.isnan(smooth)] = PHASE_UNKNOWN
+
+    # 航迹级统计
+    climb = np.add.reduceat((phase == PHASE_CLIMB).astype(np.int64), starts)
+    approach = np.add.reduceat((phase == PHASE_APPROACH).astype(np.int64), starts)
+    with np.errstate(invalid='ignore'):
+        min_fl = np.fmin.reduceat(smooth, starts)
+    has_fl = np.isfinite(min_fl)
+    first = np.minimum.reduceat(np.where(np.isnan(smooth), n, index), starts)
+    last = np.maximum.reduceat(np.where(np.isnan(smooth), -1, index), starts)
+    delta = np.where(has_fl, smooth[np.minimum(last, n - 1)] - smooth[np.minimum(first, n - 1)], 0.0)
+
+    kind = np.full(len(starts), TRACK_UNKNOWN, dtype=np.uint8)
+    kind[(climb > approach) | ((climb == approach) & (delta > 0))] = TRACK_TAKEOFF
+    kind[(approach > climb) | ((climb == approach) & (delta < 0))] = TRACK_LANDING
+    kind[has_fl & (min_fl > config.overflight_FL)] = TRACK_OVERFLIGHT
+    kind[~has_fl] = TRACK_UNKNOWN
+
+    # 接地取最早的最低点，离地取最晚的最低点
+    filled = np.where(np.isnan(smooth), np.inf, smooth)
+    low_land = np.lexsort((index, filled, seg))[starts]
+    low_take = np.lexsort((-index, filled, seg))[starts]
+    low = np.where(kind == TRACK_TAKEOFF, low_take, low_land)
+    # 最低点未贴近地面时，按该航迹爬升/下降段的平均垂直速率外推
+    rate_sum = np.add.reduceat(np.where((phase == PHASE_CLIMB) | (phase == PHASE_APPROACH), np.abs(rate), 0.0), starts)
+    mean_rate = rate_sum / np.maximum(climb + approach, 1)
+    low_height = np.maximum(height[low], 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        extra = np.where(low_height <= config.ground_height, 0.0, low_height / mean_rate)
+    known = ((kind == TRACK_TAKEOFF) | (kind == TRACK_LANDING)) & near[low] & np.isfinite(extra) \
+        & (extra <= config.max_extrapolation)
+    sign = np.where(kind == TRACK_TAKEOFF, -1, 1)
+    offset = (sign * np.where(known, extra, 0.0) * 1e9).astype(np.int64)
+    result.event_time = np.where(known, t[low] + offset, 0)
+    runway = np.where(known, tags.runway[low], -1)
+    # 沿跑道正向运动时使用第一个入口，反向时使用第二个入口
+    reverse = ~(along_rate[low] > 0)
+    result.runway = runway
+    result.threshold = np.where(runway >= 0, runway * 2 + reverse, -1)
+    result.kind = kind
+
+    # 还原为输入顺序
+    result.phase[order] = phase
+    result.smooth_FL[order] = smooth
+    result.vertical_rate[order] = rate
+    return result
+
+
+def classify_tracks(tracks: Sequence[PlaneTrackData], airport: Optional[AirportGeometry] = None,
+                    config: Optional[PhaseConfig] = None) -> PhaseResult:
+    """
+    判断若干条航迹的飞行阶段，航迹键为航迹在tracks中的序号
+    点迹级数组对应各航迹track_data依次拼接的结果
+    """
+    airport = airport or get_airport()
+    datas = [track.track_data for track in tracks]
+    batch = np.concatenate(datas) if datas else empty_batch()
+    keys = np.repeat(np.arange(len(datas)), [len(data) for data in datas])
+    valid = batch['valid']
+    times = plot_times(batch)
+    FL = np.where((valid & VALID_FL) != 0, batch['FL'], np.nan)
+    polar = (valid & VALID_POLAR) != 0
+    east, north = get_sensors().to_enu(batch, airport.projection, np.where(polar, batch['rho'], np.nan), FL)
+    return classify(keys, times, FL, east, north, airport, config)
+
+
+if __name__ == '__main__':
+    from plane_data import stream_file
+    from timestamps import ns_to_datetime
+    from track_store import TrackStore
+
+    parser = argparse.ArgumentParser(description='判断航迹的飞行阶段')
+    parser.add_argument('path')
+    parser.add_argument('--overflight', type=float, default=2000.0, help='最低高度超过该值视为飞越 m')
+    parser.add_argument('--vertical-rate', type=float, default=2.5, help='爬升/下降率阈值 m/s')
+    parser.add_argument('--radius', type=float, default=20000.0, help='离跑道入口不超过该距离才判断起降 m')
+    args = parser.parse_args()
+
+    config = PhaseConfig(overflight_FL=args.overflight, vertical_rate=args.vertical_rate,
+                         approach_radius=args.radius)
+    airport = get_airport()
+    store = TrackStore()
+    tracks = []
+    for batch in stream_file(args.path):
+        tracks.extend(store.add_batch(batch))
+    tracks.extend(store.close_all())
+    result = classify_tracks(tracks, airport, config)
+    for i, track in enumerate(tracks):
+        event = ns_to_datetime(int(result.event_time[i])) if result.event_time[i] else ''
+        runway = airport.thresholds[result.threshold[i]].name if result.threshold[i] >= 0 else ''
+        print(track.flight_num, TRACK_NAMES[result.kind[i]], event, runway)
@@ -0,0 +1,235 @@
+from typing import List, Optional
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from exporter import CSVExporter
+from plane_data import SecondaryRadar048, TrackExporter, track_plots
+from plot_batch import PlotBatchBuilder
+from track_store import TrackStore, TRACK_TIMEOUT_NS
+
+# 检查点格式版本
+CHECKPOINT_VERSION = 1
+
+
+class FileFollower:
+    """
+    类似tail -F持续读取正在写入的文本记录文件，只返回完整的行
+    文件被轮转（路径指向新文件）时先读完旧文件再从头读新文件，被截断时从头读
+    停止期间发生的轮转按inode在同一目录中找回旧文件（如 path.1）读完，找不到时提示丢失的数据
+    """
+    def __init__(self, path: str, offset: int = 0, inode: Optional[int] = None,
+                 chunk_size: int = 16 * 1024 * 1024) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.offset = offset        # 已处理到的位置（行边界）
+        self.inode = inode          # 正在读取的文件
+        self.size = offset          # 已知的文件大小（读到过的最远位置）
+        self.file = None
+        self.rotations = 0          # 轮转/截断次数
+        self.lost = 0               # 因旧文件找不到而未读的字节数（至少）
+
+    def __find_predecessor(self) -> Optional[str]:
+        """在同一目录中按inode查找被轮转走的旧文件"""
+        directory, name = os.path.split(os.path.abspath(self.path))
+        candidates = sorted((entry for entry in os.listdir(directory) if entry.startswith(name) and entry != name),
+                            key=lambda entry: (entry != name + '.1', entry))     # 先查 path.1
+        for entry in candidates:
+            try:
+                if os.stat(os.path.join(directory, entry)).st_ino == self.inode:
+                    return os.path.join(directory, entry)
+            except OSError:
+                continue
+        return None
+
+    def __open(self) -> bool:
+        """
+        打开路径当前指向的文件
+        检查点中的文件已不是该文件时先打开找回的旧文件，由read读完后再切换，找不到时从头读新文件
+        """
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        inode = os.fstat(file.fileno()).st_ino
+        if self.inode is not None and inode != self.inode:
+            predecessor = self.__find_predecessor()
+            if predecessor is not None:
+                file.close()
+                print(f'文件在停止期间被轮转，先从位置{self.offset}读完旧文件 {predecessor}', flush=True)
+                self.file = open(predecessor, 'rb')
+                return True
+            lost = max(self.size - self.offset, 0)
+            self.lost += lost
+            self.rotations += 1
+            amount = f'至少{lost}字节' if lost else '字节数未知'
+            print(f'警告: 文件在停止期间被轮转且找不到旧文件（inode {self.inode}），'
+                  f'其中位置{self.offset}之后未读的数据丢失（{amount}）', flush=True)
+            self.offset = 0
+        self.inode = inode
+        self.file = file
+        return True
+
+    def __read_available(self, final: bool = False) -> List[str]:
+        """
+        读取当前文件中已完整写入的行，每次最多chunk_size字节
+        final 文件不会再写入，末尾不完整的行也返回
+        """
+        self.file.seek(self.offset)
+        data = self.file.read(self.chunk_size)
+        end = len(data) if final else data.rfind(b'\n') + 1
+        self.size = max(self.size, self.offset + len(data))
+        if end == 0:
+            return []
+        self.offset += end
+        return [line for line in data[:end].decode('UTF-8').splitlines() if line.strip()]
+
+    def read(self) -> List[str]:
+        """读取新增的完整行"""
+        if self.file is None and not self.__open():
+            return []
+        lines = self.__read_available()
+        if lines:
+            return lines
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return lines    # 旧文件已移走、新文件尚未创建
+        if stat.st_ino != self.inode:
+            # 轮转: 读完旧文件（含末尾不完整的行），切换到新文件
+            lines += self.__read_available(final=True)
+            self.file.close()
+            self.file = None
+            self.offset = self.size = 0
+            self.inode = None
+            self.rotations += 1
+            if self.__open():
+                lines += self.__read_available()
+        elif stat.st_size < self.offset:
+            # 截断: 从头读
+            self.offset = self.size = 0
+            self.rotations += 1
+            lines += self.__read_available()
+        return lines
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Checkpoint:
+    """
+    检查点: 读取位置、未结束航迹的点迹与输出文件的大小
+    先写入输出文件再保存检查点，恢复时把输出截断到检查点记录的大小，避免重复输出
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def save(self, follower: FileFollower, store: TrackStore, outputs: List[str]) -> None:
+        meta = {
+            'version': CHECKPOINT_VERSION,
+            'path': follower.path,
+            'inode': follower.inode,
+            'offset': follower.offset,
+            'size': follower.size,
+            'watermark': store.watermark,
+            'outputs': {path: os.path.getsize(path) if os.path.exists(path) else 0 for path in outputs},
+        }
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), plots=store.snapshot())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+    def load(self, follower: FileFollower, store: TrackStore) -> bool:
+        """恢复读取位置与航迹状态，并截断输出文件，没有检查点时返回False"""
+        if not os.path.exists(self.path):
+            return False
+        with np.load(self.path) as data:
+            meta = json.loads(str(data['meta']))
+            plots = data['plots']
+        if meta.get('version') != CHECKPOINT_VERSION or meta['path'] != follower.path:
+            raise ValueError(f'检查点与当前文件不符: {self.path}')
+        follower.offset, follower.inode = meta['offset'], meta['inode']
+        follower.size = meta.get('size', follower.offset)
+        store.restore(plots, meta['watermark'])
+        for path, size in meta['outputs'].items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        return True
+
+
+def follow(path: str, timeout: int = TRACK_TIMEOUT_NS, poll: float = 1.0, checkpoint_interval: float = 10.0,
+           once: bool = False) -> None:
+    """
+    持续解析正在写入的文本记录文件，航迹结束时追加到 -take.csv / -land.csv
+    定期保存检查点，重启后从检查点继续
+    once 读完当前内容、保存检查点后退出
+    """
+    base = os.path.splitext(path)[0]
+    heads = SecondaryRadar048.EXPORT_HEADS
+    outputs = [base + '-take.csv', base + '-land.csv']
+    follower = FileFollower(path)
+    store = TrackStore(timeout)
+    checkpoint = Checkpoint(base + '.ckpt.npz')
+    if checkpoint.load(follower, store):
+        print(f'从检查点恢复: 位置{follower.offset}，未结束航迹{len(store)}条', flush=True)
+    builder = PlotBatchBuilder()
+    exporter = TrackExporter(CSVExporter(outputs[0], heads, append=True), CSVExporter(outputs[1], heads, append=True))
+    last_save = last_read = time.monotonic()
+    lines: List[str] = []
+    decoded = 0     # lines中已交给builder的行数
+    try:
+        while True:
+            lines = follower.read()
+            decoded = 0
+            for line in lines:
+                builder.append_line(line)
+                decoded += 1
+            if len(builder):
+                exporter.write(store.add_batch(track_plots(builder.flush())))
+            idle = not lines
+            if idle and not once:
+                # 没有新数据时按实际经过的时间推进超时，记录停止写入（如夜间）时航迹也能按时结束并导出
+                exporter.write(store.expire(store.watermark + int((time.monotonic() - last_read) * 1e9)))
+            else:
+                last_read = time.monotonic()
+            if (once and idle) or time.monotonic() - last_save >= checkpoint_interval:
+                exporter.flush()
+                checkpoint.save(follower, store, outputs)
+                last_save = time.monotonic()
+            if once and idle:
+                break
+            if idle:
+                time.sleep(poll)
+    except KeyboardInterrupt:
+        # 读取位置已越过本次读到的所有行，保存检查点前先解码并归类其余的行
+        for line in lines[decoded:]:
+            builder.append_line(line)
+        if len(builder):
+            exporter.write(store.add_batch(track_plots(builder.flush())))
+        exporter.flush()
+        checkpoint.save(follower, store, outputs)
+    finally:
+        exporter.close()
+        follower.close()
+        lost = f'，丢失至少{follower.lost}字节' if follower.lost else ''
+        print(f'读取位置{follower.offset}，轮转/截断{follower.rotations}次{lost}', flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='持续解析正在写入的雷达数据文件，支持轮转与断点续传')
+    parser.add_argument('path', help='文本记录文件')
+    parser.add_argument('--track-timeout', type=float, default=TRACK_TIMEOUT_NS / 1e9, help='航迹超时 s')
+    parser.add_argument('--poll', type=float, default=1.0, help='没有新数据时的轮询间隔 s')
+    parser.add_argument('--checkpoint-interval', type=float, default=10.0, help='保存检查点的间隔 s')
+    parser.add_argument('--once', action='store_true', help='处理完当前内容后保存检查点并退出')
+    args = parser.parse_args()
+
+    follow(args.path, int(args.track_timeout * 1e9), args.poll, args.checkpoint_interval, args.once)
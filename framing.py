@@ -0,0 +1,144 @@
+from typing import Generator, Optional, Set, Tuple
+import threading
+
+from timestamps import ns_to_utc_str
+
+# HDLC地址、控制字段的长度
+HDLC_LEN = 2
+# 数据块头: CAT(1) LEN(2)
+BLOCK_HEADER = 3
+# 最短的记录: 数据块头 + 1字节FSPEC
+MIN_BLOCK = BLOCK_HEADER + 1
+
+# 已知的数据种类，重新同步时只在这些CAT处尝试
+CATEGORIES = frozenset((34, 48))
+
+# 冗余线路送来的相同帧的默认判断窗口 ns
+DEDUP_WINDOW_NS = 2 * 10**9
+
+# 出错的原因
+MALFORMED_LINE = 'line'         # 行格式错误: 缺少字段、不是16进制串、时间格式错误
+MALFORMED_LENGTH = 'length'     # LEN字段与实际数据不符，之后的数据重新同步
+MALFORMED_OVERRUN = 'overrun'   # 数据项（FX扩展、重复次数等）超出记录
+MALFORMED_FRN = 'frn'           # 未定义的FRN
+
+
+def block_length(data: memoryview, start: int) -> int:
+    """start处数据块的LEN字段（包含CAT、LEN本身）"""
+    return (data[start + 1] << 8) | data[start + 2]
+
+
+def tiles(data: memoryview, start: int) -> bool:
+    """从start开始按LEN字段能否恰好切分完整个数据"""
+    size = len(data)
+    while start + BLOCK_HEADER <= size:
+        length = block_length(data, start)
+        if length < BLOCK_HEADER:
+            return False
+        start += length
+    return start == size
+
+
+def frame_start(data: memoryview, hdlc: Optional[bool] = None) -> int:
+    """
+    数据报中第一个ASTERIX数据块的位置
+    hdlc 是否带HDLC地址、控制字段，为None时按哪种方式能恰好切分完整个数据自动判断，
+    两种方式都能切分时（HDLC字段恰好像一个数据块头）看哪种方式的第一个CAT是已知的类别
+    """
+    if hdlc is None:
+        hdlc = tiles(data, HDLC_LEN) and (not tiles(data, 0) or data[0] not in CATEGORIES)
+    return HDLC_LEN if hdlc else 0
+
+
+def resync(data: memoryview, start: int) -> int:
+    """
+    start处的数据块已损坏，找到之后第一个已知CAT、且由此按LEN能恰好切分到结尾的位置
+    :return 找到的位置，找不到时为数据的长度
+    """
+    size = len(data)
+    for position in range(start + 1, size - MIN_BLOCK + 1):
+        if data[position] in CATEGORIES and block_length(data, position) >= MIN_BLOCK and tiles(data, position):
+            return position
+    return size
+
+
+def split_blocks(data: memoryview, start: int = 0) -> Generator[Tuple[int, int, Optional[str]], None, None]:
+    """
+    按LEN字段把数据切分为若干ASTERIX数据块，LEN错误时跳到下一个有效的CAT/LEN边界继续
+    :return (起始位置, 结束位置, 出错的原因)，原因不为None时[起始位置, 结束位置)为被跳过的数据
+    """
+    size = len(data)
+    while start < size:
+        length = block_length(data, start) if start + BLOCK_HEADER <= size else 0
+        if length < MIN_BLOCK or start + length > size:
+            end = resync(data, start)
+            yield start, end, MALFORMED_LENGTH
+            start = end
+            continue
+        yield start, start + length, None
+        start += length
+
+
+class MalformedRecord(ValueError):
+    """无法解析的记录，reason为出错的原因"""
+    def __init__(self, reason: str, message: str = '') -> None:
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class Quarantine:
+    """
+    把无法解析的数据追加到旁路文件，每行为 接收时间 16进制串 原因
+    前两列与文本记录的格式相同，修复后可以直接重新解析，可由多个解码线程共用
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'a', encoding='UTF-8')
+        self.count = 0          # 已写入的条数
+        self.lock = threading.Lock()
+
+    def write(self, recv_time: int, data: memoryview, reason: str) -> None:
+        """写入一帧原始数据"""
+        self.write_line(f'{ns_to_utc_str(recv_time)} {bytes(data).hex()}', reason)
+
+    def write_line(self, line: str, reason: str) -> None:
+        """原样写入一行无法解析的文本"""
+        with self.lock:
+            self.file.write(f'{line.strip()} {reason}\n')
+            self.count += 1
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> 'Quarantine':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class Deduplicator:
+    """
+    丢弃冗余线路送来的相同帧（HDLC字段之后的内容相同）
+    按接收时间分桶的集合，只与当前桶和前一个桶比较，每帧O(1)，内存只与窗口内的帧数有关
+    相隔不超过window的重复帧一定能发现
+    """
+    def __init__(self, window: int = DEDUP_WINDOW_NS) -> None:
+        self.window = window
+        self.bucket: Optional[int] = None   # 当前桶号
+        self.current: Set[bytes] = set()
+        self.previous: Set[bytes] = set()
+
+    def seen(self, recv_time: int, data: memoryview) -> bool:
+        """data在窗口内出现过时返回True，否则记下并返回False"""
+        bucket = recv_time // self.window
+        if self.bucket is None or bucket > self.bucket:
+            # 乱序到达（时间倒退）的帧仍放在当前桶
+            self.previous = self.current if bucket == (self.bucket or 0) + 1 else set()
+            self.current = set()
+            self.bucket = bucket
+        key = bytes(data)
+        if key in self.current or key in self.previous:
+            return True
+        self.current.add(key)
+        return False
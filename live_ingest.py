@@ -0,0 +1,399 @@
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+
+from exporter import CSVExporter
+from flight_phase import classify_tracks, TRACK_LANDING, TRACK_TAKEOFF
+from framing import DEDUP_WINDOW_NS, Deduplicator, frame_start, HDLC_LEN, Quarantine, split_blocks
+from metrics import enable_item_profiler, METRICS, Reporter, serve_prometheus
+from plane_data import read_data, SecondaryRadar048, TrackExporter
+from plot_batch import PlotBatchBuilder
+from scan import PER_SCAN, PER_SECTOR, ScanBatch, ScanBatcher
+from sensors import get_sensors, SensorRegistry
+from timestamps import utc_str_to_ns
+from track_store import PlaneTrackData, TrackStore, TRACK_TIMEOUT_NS
+
+class IngestStats:
+    """实时接收的计数"""
+    def __init__(self) -> None:
+        self.datagrams = 0      # 收到的数据报/数据块
+        self.bytes = 0          # 收到的字节数
+        self.blocks = 0         # ASTERIX数据块
+        self.records = 0        # 解码的CAT048记录
+        self.skipped = 0        # 未订阅的CAT的数据块
+        self.malformed = 0      # 无法解析的数据
+        self.duplicates = 0     # 冗余线路送来的重复数据报
+        self.dropped = 0        # 队列已满被丢弃的数据报
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+    def __str__(self) -> str:
+        return ' '.join(f'{k}={v}' for k, v in self.__dict__.items())
+
+
+class LivePipeline:
+    """
+    实时处理流水线: 接收 -> 有界队列 -> 解码 -> 有界队列 -> 航迹
+    UDP队列满时丢弃并计数，TCP队列满时等待（反压）
+    解码在decoders个线程中进行，航迹处理在一个线程中按顺序进行，事件循环只负责接收与排队
+    scan_batches 按CAT034的正北、扇区消息每个扇区或每圈交出一批ScanBatch，而不是按batch_size，只支持一个解码线程
+    """
+    def __init__(self, on_batch: Callable[[Union[np.ndarray, ScanBatch]], None], hdlc: Optional[bool] = None,
+                 queue_size: int = 4096, batch_size: int = 256, max_delay: float = 0.5,
+                 decoders: int = 1, quarantine: Optional[Quarantine] = None,
+                 sensors: Optional[SensorRegistry] = None, dedup: Optional[Deduplicator] = None,
+                 scan_batches: Optional[str] = None) -> None:
+        if scan_batches and decoders != 1:
+            raise ValueError('按扫描分批只支持一个解码线程')
+        self.on_batch = on_batch        # 航迹处理
+        self.hdlc = hdlc
+        self.quarantine = quarantine    # 无法解析的数据报的旁路文件
+        self.sensors = sensors          # 由CAT034记下各数据源的天线旋转周期
+        self.dedup = dedup              # 丢弃冗余线路的重复数据报，各解码线程共用
+        self.queue_size = queue_size
+        self.batch_size = batch_size    # 攒够多少条点迹交给航迹处理
+        self.max_delay = max_delay      # 点迹最长等待时间 s
+        self.decoders = decoders        # 解码线程数
+        self.scan_batches = scan_batches
+        self.stats = IngestStats()
+        self.lock = threading.Lock()    # 保护各解码线程共用的stats与dedup
+        self.__tasks = []
+
+    async def start(self) -> None:
+        """启动解码与航迹处理"""
+        self.raw_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self.batch_queue: asyncio.Queue = asyncio.Queue(max(self.queue_size // self.batch_size, 1))
+        self.decode_executor = ThreadPoolExecutor(self.decoders, thread_name_prefix='decode')
+        self.track_executor = ThreadPoolExecutor(1, thread_name_prefix='track')
+        self.__tasks = [asyncio.ensure_future(self.__decode_worker()) for _ in range(self.decoders)]
+        self.__tasks.append(asyncio.ensure_future(self.__track_worker()))
+
+    async def stop(self) -> None:
+        """处理完已接收的数据后停止"""
+        await self.raw_queue.join()
+        await self.batch_queue.join()
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        """等待解码与航迹线程中正在进行的处理完成"""
+        if self.__tasks:
+            self.decode_executor.shutdown()
+            self.track_executor.shutdown()
+
+    def submit_nowait(self, data: bytes, recv_time: Optional[int] = None) -> bool:
+        """提交一个数据报，队列满时丢弃"""
+        self.stats.datagrams += 1
+        self.stats.bytes += len(data)
+        try:
+            self.raw_queue.put_nowait((recv_time or time.time_ns(), data))
+            return True
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            return False
+
+    async def submit(self, data: bytes, recv_time: Optional[int] = None) -> None:
+        """提交一个数据块，队列满时等待"""
+        self.stats.datagrams += 1
+        self.stats.bytes += len(data)
+        await self.raw_queue.put((recv_time or time.time_ns(), data))
+
+    def decode(self, builder: PlotBatchBuilder, datagrams: List[Tuple[int, bytes]]) -> None:
+        """
+        解码若干数据报中的所有CAT048记录，损坏的数据块跳过并从下一个有效的数据块继续
+        在解码线程中运行，计数在本地累加后一次合并到stats
+        """
+        duplicates = blocks = skipped = records = 0
+        rejected = builder.rejected
+        for recv_time, data in datagrams:
+            buffer = memoryview(data)
+            first = frame_start(buffer, self.hdlc)
+            if self.dedup is not None:
+                with self.lock:
+                    seen = self.dedup.seen(recv_time, buffer[first:])
+                if seen:
+                    duplicates += 1
+                    continue
+            for start, end, reason in split_blocks(buffer, first):
+                if reason is not None:
+                    builder.reject(reason, recv_time, data)
+                    continue
+                blocks += 1
+                if data[start] != 48:
+                    if data[start] == 34 and builder.services is not None:
+                        builder.append_service_block(recv_time, data, start, end)
+                    skipped += 1
+                    continue
+                records += builder.append_block(recv_time, data, start, end)
+        with self.lock:
+            stats = self.stats
+            stats.duplicates += duplicates
+            stats.blocks += blocks
+            stats.skipped += skipped
+            stats.records += records
+            stats.malformed += builder.rejected - rejected
+
+    def __decode_batch(self, builder: PlotBatchBuilder, datagrams: List[Tuple[int, bytes]]) -> None:
+        with METRICS.timer(stage='decode'):
+            self.decode(builder, datagrams)
+
+    async def __decode_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        batcher = ScanBatcher(self.scan_batches, self.sensors) if self.scan_batches else None
+        builder = PlotBatchBuilder(quarantine=self.quarantine, services=batcher or self.sensors)
+        while True:
+            try:
+                first = await asyncio.wait_for(self.raw_queue.get(), self.max_delay)
+            except asyncio.TimeoutError:
+                first = None
+            recv_time = None
+            if first is not None:
+                # 一次取出队列中已有的数据报（最多batch_size个）交给解码线程，减少线程切换
+                datagrams = [first]
+                while len(datagrams) < self.batch_size and not self.raw_queue.empty():
+                    datagrams.append(self.raw_queue.get_nowait())
+                recv_time = datagrams[-1][0]
+                try:
+                    await loop.run_in_executor(self.decode_executor, self.__decode_batch, builder, datagrams)
+                finally:
+                    for _ in datagrams:
+                        self.raw_queue.task_done()
+            if batcher is not None:
+                # 扇区消息到达即交出该数据源的一批；一段时间没有数据时交出所有点迹
+                if recv_time is None or batcher.ready(builder):
+                    batcher.add(builder.flush())
+                    for batch in batcher.cut() if recv_time is not None else batcher.close():
+                        await self.batch_queue.put(batch)
+            elif len(builder) >= self.batch_size or (recv_time is None and len(builder)) \
+                    or (len(builder) and self.raw_queue.empty()):
+                await self.batch_queue.put(builder.flush())
+
+    async def __track_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.batch_queue.get()
+            try:
+                await loop.run_in_executor(self.track_executor, self.on_batch, batch)
+            finally:
+                self.batch_queue.task_done()
+
+
+class LiveTrackBuilder:
+    """
+    把实时点迹增量归入航迹，结束的航迹按起飞、降落计数
+    指定exporter时结束的航迹同时写入起飞、降落文件
+    """
+    def __init__(self, timeout: int = TRACK_TIMEOUT_NS, exporter: Optional[TrackExporter] = None) -> None:
+        self.store = TrackStore(timeout)
+        self.exporter = exporter
+        self.closed = 0         # 已结束的航迹数
+        self.take = 0           # 已结束的起飞航迹数
+        self.land = 0           # 已结束的降落航迹数
+
+    def add_batch(self, batch: Union[np.ndarray, ScanBatch]) -> None:
+        """归类一批点迹，ScanBatch再以结束它的CAT034消息的接收时间推进航迹超时"""
+        end = None
+        if isinstance(batch, ScanBatch):
+            batch, end = batch.plots, batch.end
+        with METRICS.timer(stage='group'):
+            closed = self.store.add_batch(batch)
+            if end is not None:
+                closed += self.store.advance(end)
+        self.on_closed(closed)
+
+    def on_closed(self, tracks: List[PlaneTrackData]) -> None:
+        """处理结束的航迹"""
+        if not tracks:
+            return
+        if self.exporter is not None:
+            kinds = self.exporter.write(tracks)
+            self.exporter.flush()
+        else:
+            with METRICS.timer(stage='classify'):
+                kinds = classify_tracks(tracks).kind
+        self.closed += len(tracks)
+        self.take += int(np.count_nonzero(kinds == TRACK_TAKEOFF))
+        self.land += int(np.count_nonzero(kinds == TRACK_LANDING))
+
+    def close(self) -> None:
+        """停止接收: 结束所有航迹并关闭输出"""
+        self.on_closed(self.store.close_all())
+        if self.exporter is not None:
+            self.exporter.close()
+
+    def summary(self) -> str:
+        """当前航迹数与已结束的起飞、降落航迹数"""
+        return f'tracks={len(self.store)} closed={self.closed} take={self.take} land={self.land}'
+
+    def as_dict(self) -> Dict[str, int]:
+        return {'tracks': len(self.store), 'closed': self.closed, 'take': self.take, 'land': self.land}
+
+
+class AsterixUDPProtocol(asyncio.DatagramProtocol):
+    """UDP接收"""
+    def __init__(self, pipeline: LivePipeline) -> None:
+        self.pipeline = pipeline
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.pipeline.submit_nowait(data, time.time_ns())
+
+
+async def handle_tcp(pipeline: LivePipeline, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     hdlc: bool = False) -> None:
+    """TCP接收，按数据块的LEN字段分帧，TCP流无法自动判断是否带HDLC字段"""
+    hdlc_len = HDLC_LEN if hdlc else 0
+    try:
+        while True:
+            head = await reader.readexactly(hdlc_len + 3)
+            length = (head[hdlc_len + 1] << 8) | head[hdlc_len + 2]
+            if length < 3:
+                pipeline.stats.malformed += 1
+                break
+            body = await reader.readexactly(length - 3)
+            await pipeline.submit(head + body, time.time_ns())
+    except asyncio.IncompleteReadError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str, udp_port: Optional[int], tcp_port: Optional[int], pipeline: LivePipeline,
+                report: Callable[[], None], interval: float = 10.0) -> None:
+    """启动UDP/TCP接收，定期输出统计"""
+    loop = asyncio.get_running_loop()
+    await pipeline.start()
+    if udp_port is not None:
+        await loop.create_datagram_endpoint(lambda: AsterixUDPProtocol(pipeline), local_addr=(host, udp_port))
+    if tcp_port is not None:
+        await asyncio.start_server(lambda r, w: handle_tcp(pipeline, r, w, bool(pipeline.hdlc)), host, tcp_port)
+    while True:
+        await asyncio.sleep(interval)
+        report()
+
+
+async def replay(path: str, host: str, port: int, speed: float = 1.0, hdlc: bool = True,
+                 protocol: str = 'udp') -> int:
+    """
+    按记录的接收时间回放数据文件，用于测试
+    speed 回放倍速，0为不等待
+    :return 发送的数据条数
+    """
+    loop = asyncio.get_running_loop()
+    if protocol == 'udp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        send = lambda data: sock.sendto(data, (host, port))
+    else:
+        _, writer = await asyncio.open_connection(host, port)
+        send = writer.write
+    start_time = start_clock = None
+    count = 0
+    for line in read_data(path):
+        if not line:
+            continue
+        utc, source = line.split()
+        data = bytes.fromhex(source)
+        if not hdlc:
+            data = data[HDLC_LEN:]
+        if speed > 0:
+            recv_time = utc_str_to_ns(utc)
+            if start_time is None:
+                start_time, start_clock = recv_time, loop.time()
+            delay = start_clock + (recv_time - start_time) / 1e9 / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        send(data)
+        count += 1
+        if protocol != 'udp' and count % 256 == 0:
+            await writer.drain()
+    if protocol == 'udp':
+        sock.close()
+    else:
+        await writer.drain()
+        writer.close()
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ASTERIX实时接收')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('serve', help='接收并实时归类航迹')
+    p.add_argument('--host', default='0.0.0.0')
+    p.add_argument('--udp', type=int, default=None, help='UDP端口')
+    p.add_argument('--tcp', type=int, default=None, help='TCP端口')
+    p.add_argument('--hdlc', choices=['auto', 'yes', 'no'], default='auto', help='是否带HDLC地址、控制字段，auto只适用于UDP，使用--tcp时需指定yes或no')
+    p.add_argument('--queue-size', type=int, default=4096, help='接收队列长度')
+    p.add_argument('--batch-size', type=int, default=256, help='点迹批大小')
+    p.add_argument('--interval', type=float, default=10.0, help='统计输出间隔 s')
+    p.add_argument('--track-timeout', type=float, default=TRACK_TIMEOUT_NS / 1e9, help='航迹超时 s')
+    p.add_argument('--decoders', type=int, default=1, help='解码线程数')
+    p.add_argument('--output', help='结束的起飞、降落航迹追加到 OUTPUT-take.csv / OUTPUT-land.csv')
+    p.add_argument('--metrics-port', type=int, default=None, help='在该端口提供Prometheus格式的/metrics')
+    p.add_argument('--metrics', help='退出时把指标保存为JSON')
+    p.add_argument('--profile-items', type=int, default=0, help='每N条记录采样一条，统计每个数据项的解码耗时')
+    p.add_argument('--quarantine', help='无法解析的数据报追加到该文件')
+    p.add_argument('--dedup', type=float, nargs='?', const=DEDUP_WINDOW_NS / 1e9,
+                   help=f'丢弃冗余线路送来的相同数据报，判断窗口 s，只指定--dedup时为{DEDUP_WINDOW_NS / 1e9:g}')
+    p.add_argument('--scan-batches', choices=[PER_SECTOR, PER_SCAN],
+                   help='按CAT034的正北、扇区消息每个扇区或每圈一批归入航迹，扇区消息的时间推进航迹超时')
+    p = sub.add_parser('replay', help='回放数据文件')
+    p.add_argument('path')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, required=True)
+    p.add_argument('--tcp', action='store_true', help='使用TCP发送')
+    p.add_argument('--speed', type=float, default=1.0, help='回放倍速，0为不等待')
+    p.add_argument('--no-hdlc', action='store_true', help='去掉HDLC地址、控制字段后发送')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if args.udp is None and args.tcp is None:
+            parser.error('至少指定--udp或--tcp')
+        if args.tcp is not None and args.hdlc == 'auto':
+            parser.error('TCP流无法自动判断是否带HDLC字段，使用--tcp时需指定--hdlc yes|no（replay --tcp默认带HDLC字段，对应yes）')
+        hdlc = {'auto': None, 'yes': True, 'no': False}[args.hdlc]
+        if args.profile_items:
+            enable_item_profiler(args.profile_items)
+        exporter = None
+        if args.output:
+            heads = SecondaryRadar048.EXPORT_HEADS
+            exporter = TrackExporter(CSVExporter(args.output + '-take.csv', heads, append=True),
+                                     CSVExporter(args.output + '-land.csv', heads, append=True))
+        tracks = LiveTrackBuilder(int(args.track_timeout * 1e9), exporter)
+        quarantine = Quarantine(args.quarantine) if args.quarantine else None
+        dedup = Deduplicator(int(args.dedup * 1e9)) if args.dedup else None
+        pipeline = LivePipeline(tracks.add_batch, hdlc=hdlc, queue_size=args.queue_size, batch_size=args.batch_size,
+                                decoders=args.decoders, quarantine=quarantine, sensors=get_sensors(), dedup=dedup,
+                                scan_batches=args.scan_batches)
+        METRICS.add_collector(lambda: {f'ingest_{k}': v for k, v in pipeline.stats.as_dict().items()})
+        METRICS.add_collector(lambda: {f'live_{k}': v for k, v in tracks.as_dict().items()})
+        if args.metrics_port is not None:
+            serve_prometheus(args.metrics_port, args.host)
+        reporter = Reporter(0)
+
+        def report() -> None:
+            print(f'{datetime.now().time()} {pipeline.stats} {tracks.summary()}', flush=True)
+            reporter.report()
+        try:
+            asyncio.run(serve(args.host, args.udp, args.tcp, pipeline, report, args.interval))
+        except KeyboardInterrupt:
+            pipeline.shutdown()
+            tracks.close()
+            report()
+            if args.metrics:
+                METRICS.dump(args.metrics)
+        finally:
+            if quarantine is not None:
+                quarantine.close()
+    else:
+        count = asyncio.run(replay(args.path, args.host, args.port, args.speed, not args.no_hdlc,
+                                   'tcp' if args.tcp else 'udp'))
+        print(f'发送{count}条')
@@ -0,0 +1,291 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import sys
+import threading
+import time
+
+from uap import CompiledUAP, FSPEC_BITS
+
+# 延迟直方图的桶上界 s，1-2-5序列
+LATENCY_BUCKETS = tuple(m * 10.0 ** e for e in range(-7, 3) for m in (1, 2, 5))
+
+# 标签: ((名称, 值), ...)，按名称排序
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = '') -> str:
+    """Prometheus格式的标签"""
+    items = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return '{' + ','.join(items) + '}' if items else ''
+
+
+class Histogram:
+    """固定桶的直方图"""
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # 最后一个为超过最大桶的
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估计分位数"""
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return float('inf')
+
+    def merge(self, other: 'Histogram') -> None:
+        """合并桶相同的另一个直方图"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(桶上界, 累计数)，最后为+Inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((repr(bound), total))
+        result.append(('+Inf', self.count))
+        return result
+
+
+class Metrics:
+    """
+    计数器与延迟直方图，按(名称, 标签)区分
+    只在批级别计时，逐条的计数由各处先在本地累加再合并，开销可以忽略
+    可由多个线程（如实时接收的解码线程）同时写入
+    """
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.collectors: List[Callable[[], Dict[str, float]]] = []   # 输出时才读取的值，如实时接收的计数
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """计数器加value"""
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """直方图记录一个值"""
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str = 'stage_seconds', **labels: Any) -> Iterator[None]:
+        """记录一段代码的耗时 s"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]) -> None:
+        self.collectors.append(collector)
+
+    def take(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], Histogram]]:
+        """取出并清空计数器与直方图，用于把子进程中的增量交给主进程合并"""
+        with self.lock:
+            counters, histograms = self.counters, self.histograms
+            self.counters, self.histograms = {}, {}
+        return counters, histograms
+
+    def merge(self, counters: Dict[Tuple[str, Labels], float],
+              histograms: Dict[Tuple[str, Labels], Histogram]) -> None:
+        """合并take取出的增量"""
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = other
+                else:
+                    histogram.merge(other)
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.histograms.clear()
+        self.started = time.time()
+
+    def __collected(self) -> List[Tuple[str, float]]:
+        return [(name, value) for collector in self.collectors for name, value in collector().items()]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """全部指标，用于保存为JSON"""
+        return {
+            'started': self.started,
+            'uptime': time.time() - self.started,
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(list(self.counters.items()))]
+                        + [{'name': name, 'labels': {}, 'value': value} for name, value in self.__collected()],
+            'histograms': [{'name': name, 'labels': dict(labels), 'count': h.count, 'sum': h.sum,
+                            'p50': h.quantile(0.5), 'p99': h.quantile(0.99), 'buckets': dict(h.cumulative())}
+                           for (name, labels), h in sorted(list(self.histograms.items()))],
+        }
+
+    def dump(self, path: str) -> None:
+        """保存为JSON"""
+        with open(path, 'w', encoding='UTF-8') as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+
+    def prometheus(self, prefix: str = 'radar_') -> str:
+        """Prometheus文本格式"""
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(list(self.counters.items())):
+            if name not in typed:
+                lines.append(f'# TYPE {prefix}{name} counter')
+                typed.add(name)
+            lines.append(f'{prefix}{name}{_format_labels(labels)} {value}')
+        for name, value in self.__collected():
+            lines.append(f'# TYPE {prefix}{name} gauge')
+            lines.append(f'{prefix}{name} {value}')
+        for (name, labels), histogram in sorted(list(self.histograms.items())):
+            if name not in typed:
+                lines.append(f'# TYPE {prefix}{name} histogram')
+                typed.add(name)
+            for bound, count in histogram.cumulative():
+                le = 'le="%s"' % bound
+                lines.append(f'{prefix}{name}_bucket{_format_labels(labels, le)} {count}')
+            lines.append(f'{prefix}{name}_sum{_format_labels(labels)} {histogram.sum}')
+            lines.append(f'{prefix}{name}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """简要的文本摘要: 计数器与各直方图的次数、平均、p99"""
+        lines = []
+        counters = ' '.join(f'{name}{_format_labels(labels)}={value:g}'
+                            for (name, labels), value in sorted(list(self.counters.items())))
+        if counters:
+            lines.append(counters)
+        for (name, labels), h in sorted(list(self.histograms.items())):
+            if h.count:
+                lines.append(f'{name}{_format_labels(labels)} n={h.count} total={h.sum:.3f}s '
+                             f'mean={h.sum / h.count * 1e3:.3f}ms p99<={h.quantile(0.99) * 1e3:.3f}ms')
+        return '\n'.join(lines)
+
+
+# 全局的指标
+METRICS = Metrics()
+
+
+def count_fspecs(fspecs: Dict[bytes, int], uap: CompiledUAP, metrics: Metrics = METRICS) -> None:
+    """
+    由各FSPEC出现的次数统计每个数据项出现与跳过（没有解码函数）的次数
+    逐条只需按FSPEC计数，不增加逐个数据项的开销
+    """
+    count = len(uap.entries)
+    for fspec, n in fspecs.items():
+        for i, value in enumerate(fspec):
+            for bit in FSPEC_BITS[value]:
+                frn = i * 7 + bit
+                entry = uap.entries[frn] if frn < count else None
+                item = uap.items_by_FRN[frn] if entry is not None else f'FRN{frn}'
+                metrics.inc('items_total', n, cat=uap.CAT, item=item)
+                if entry is None or entry[2] is None:
+                    metrics.inc('items_skipped_total', n, cat=uap.CAT, item=item)
+
+
+class ItemProfiler:
+    """
+    采样的数据项解码耗时: 每every条记录取一条，记入item_decode_seconds直方图，用于查看哪些数据项最耗时
+    按列解码时各数据项一批只计时一次，批中每条被采样的记录都记为该批每条记录的平均耗时
+    """
+    def __init__(self, every: int = 100, metrics: Metrics = METRICS) -> None:
+        self.every = max(every, 1)
+        self.metrics = metrics
+        self.__count = 0
+
+    def record(self, CAT: int, costs: List[Tuple[str, int]], records: int = 1) -> None:
+        """记录一批records条记录中各数据项每条记录的耗时 ns"""
+        samples = (self.__count + records) // self.every - self.__count // self.every
+        self.__count += records
+        for _ in range(samples):
+            for item, ns in costs:
+                self.metrics.observe('item_decode_seconds', ns / 1e9, cat=CAT, item=item)
+
+
+# 数据项解码耗时的采样，None为不采样
+PROFILER: Optional[ItemProfiler] = None
+
+
+def enable_item_profiler(every: int = 100) -> ItemProfiler:
+    """开启数据项解码耗时的采样，之后创建的解码器生效"""
+    global PROFILER
+    PROFILER = ItemProfiler(every)
+    return PROFILER
+
+
+def get_profiler() -> Optional[ItemProfiler]:
+    """当前的数据项解码耗时采样，没有开启时为None"""
+    return PROFILER
+
+
+class Reporter:
+    """定期把指标摘要输出到stderr"""
+    def __init__(self, interval: float = 10.0, metrics: Metrics = METRICS) -> None:
+        self.interval = interval
+        self.metrics = metrics
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def __run(self) -> None:
+        while not self.__stop.wait(self.interval):
+            self.report()
+
+    def report(self) -> None:
+        print(f'--- {time.strftime("%H:%M:%S")} ---\n{self.metrics.summary()}', file=sys.stderr, flush=True)
+
+    def start(self) -> 'Reporter':
+        if self.interval > 0:
+            self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.__stop.set()
+
+
+def serve_prometheus(port: int, host: str = '0.0.0.0', metrics: Metrics = METRICS) -> HTTPServer:
+    """在后台线程提供Prometheus文本格式的/metrics"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode('UTF-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass    # 不输出访问日志
+
+    server = HTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,111 @@
+from typing import Dict, Generator, Iterable, List, Tuple
+from functools import partial
+from multiprocessing import Pool
+import os
+
+import numpy as np
+
+from framing import Deduplicator
+from metrics import Histogram, Labels, METRICS
+from plot_batch import decode_frames, decode_lines, empty_batch
+from recording import RecordingReader, is_recording
+from compressed import detect_compression, read_members, split_members
+
+# 大文件切分的默认块大小
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# 一个解码任务: (文件路径, 起始字节, 结束字节)
+Task = Tuple[str, int, int]
+# 子进程中指标的增量: (计数器, 直方图)
+MetricsDelta = Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], Histogram]]
+
+
+def split_file(path: str, chunk_size: int = CHUNK_SIZE) -> List[Task]:
+    """
+    把文件按字节范围切分成若干块，文本文件对齐到行首，二进制记录按时间索引对齐到帧
+    压缩文件按独立成员的边界切分，每块在子进程中各自解压
+    """
+    if is_recording(path):
+        with RecordingReader(path) as reader:
+            return [(path, start, end) for start, end in reader.split(chunk_size)]
+    if detect_compression(path) is not None:
+        return [(path, start, end) for start, end in split_members(path, chunk_size)]
+    size = os.path.getsize(path)
+    result = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            end = start + chunk_size
+            if end < size:
+                f.seek(end)
+                f.readline()            # 移动到下一行行首
+                end = f.tell()
+            else:
+                end = size
+            result.append((path, start, end))
+            start = end
+    return result
+
+
+def read_range(path: str, start: int, end: int) -> Generator[str, None, None]:
+    """读取文件中[start, end)范围内的行"""
+    lines = size = 0
+    try:
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                lines += 1
+                size += len(line)
+                line = line.strip()
+                if line:
+                    yield line.decode('UTF-8')
+    finally:
+        METRICS.inc('read_lines_total', lines)
+        METRICS.inc('read_bytes_total', size)
+
+
+def _init_worker() -> None:
+    """子进程: 丢弃fork时从主进程继承的指标，之后只交出本进程的增量"""
+    METRICS.take()
+
+
+def decode_task(task: Task, dedup_window: int = 0) -> Tuple[np.ndarray, MetricsDelta]:
+    """
+    子进程: 解码一块数据，返回列式数组而不是逐条对象，以及解码过程中指标的增量
+    dedup_window 不为0时丢弃块内冗余线路的重复帧
+    """
+    path, start, end = task
+    dedup = Deduplicator(dedup_window) if dedup_window else None
+    if is_recording(path):
+        METRICS.inc('read_bytes_total', end - start)
+        with RecordingReader(path) as reader:
+            batch = decode_frames(reader.frames(start, end), dedup=dedup)
+    elif detect_compression(path) is not None:
+        batch = decode_lines(read_members(path, start, end), dedup=dedup)
+    else:
+        batch = decode_lines(read_range(path, start, end), dedup=dedup)
+    return batch, METRICS.take()
+
+
+def decode_files(files: Iterable[str], workers: int, chunk_size: int = CHUNK_SIZE,
+                 dedup_window: int = 0) -> Generator[Tuple[str, np.ndarray], None, None]:
+    """
+    多进程解码多个文件，整文件与大文件的分块一起分配给进程池
+    结果按文件顺序、文件内按原始行序返回；去重在各块内进行，块边界两侧的重复帧会保留
+    子进程中的记录数、出错数、读取量等指标合并到主进程的METRICS
+    :return (文件路径, 该文件的全部CAT048数据的列式数组)
+    """
+    file_tasks = [(path, split_file(path, chunk_size)) for path in files]
+    tasks = [task for _, items in file_tasks for task in items]
+    with Pool(processes=workers, initializer=_init_worker) as pool:
+        results = pool.imap(partial(decode_task, dedup_window=dedup_window), tasks)
+        for path, items in file_tasks:
+            batches = []
+            for _ in items:
+                batch, (counters, histograms) = next(results)
+                METRICS.merge(counters, histograms)
+                batches.append(batch)
+            yield path, np.concatenate(batches) if batches else empty_batch()
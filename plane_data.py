@@ -1,52 +1,44 @@
-from typing import Any, Generator, List, Tuple, Dict, Optional
+from typing import Any, Callable, Generator, Iterable, List, Tuple, Dict, Optional, Type, Union
 from datetime import datetime, time
-from openpyxl import Workbook
-import math
+import numpy as np
+import argparse
+import struct
 import os
 
+from uap import CompiledUAP
+from framing import (DEDUP_WINDOW_NS, Deduplicator, HDLC_LEN, MALFORMED_FRN, MALFORMED_LENGTH, MALFORMED_LINE,
+                     MALFORMED_OVERRUN, MalformedRecord, MIN_BLOCK, Quarantine)
+from exporter import DATETIME, export, Exporter, FLOAT, get_exporter, INT, select_columns, STR, TIME
+from recording import RecordingReader, is_recording
+from compressed import open_text, strip_extension
+from airport import get_airport
+from flight_phase import classify_tracks, PhaseConfig, TRACK_LANDING, TRACK_NAMES, TRACK_TAKEOFF
+from metrics import enable_item_profiler, METRICS, Reporter
+from scan import PER_SCAN, PER_SECTOR, scan_frames, scan_lines, ScanBatch
+from sensors import get_sensors, load_sensors, SensorRegistry, set_sensors
+from track_store import PlaneTrackData, TrackStore, TRACK_TIMEOUT_NS
+from timestamps import ns_to_datetime, resolve_tod, ticks_to_time, utc_str_to_ns
+from plot_batch import (CAT034UAP_PATH, CAT048_BATCH_UAP, decode_frames, decode_lines, decode_record, stream_frames,
+                        stream_lines, VALID_CALLSIGN, VALID_CARTESIAN, VALID_FL, VALID_ICAO, VALID_POLAR, VALID_SOURCE,
+                        VALID_TIME, VALID_TRACK_NUMBER, VALID_VELOCITY)
+
 # FILE_PATH = './DATASAMPLE.txt'
 FILE_DIR_PATH = './radardata'
-# CAT048UAP_PATH = './CAT048UAP.xlsx'
 
 
 def read_data(path: str) -> Generator[str, None, None]:
-    """读取数据"""
-    with open(path, 'r', encoding='UTF-8') as f:
-        for line in f:
-            yield line.strip()
-
-
-def trans_stap_to_time(stap: float) -> time:
-    """将时间戳转换成time对象"""
-    hour, minute, second, microsec = 0, 0, 0, 0
-    hour = int(stap // 3600)
-    stap -= 3600 * hour
-    hour %= 24
-    minute = int(stap // 60)
-    stap -= 60 * minute
-    second = int(stap // 1)
-    stap -= 1 * second
-    microsec = int(stap * 1e6)
-    return time(hour=hour, minute=minute, second=second, microsecond=microsec)
-
-
-# def load_UAP() -> List['CAT048UAPItem']:
-#     """从Excel中读取UAP表"""
-#     result = []
-#     work_book = load_workbook(CAT048UAP_PATH, read_only=True, data_only=True)
-#     sheet = work_book.active
-#     for FRN, DataItem, DataItemDesc, Length in list(sheet.values)[1:]:
-#         result.append(CAT048UAPItem(FRN, DataItem, DataItemDesc, Length))
-#     return result
-
-
-# class CAT048UAPItem:
-#     """UAP表中的一项"""
-#     def __init__(self, FRN: int, DataItem: str, DataItemDescription: str, Length: str) -> None:
-#         self.FRN = FRN
-#         self.DataItem = DataItem
-#         self.DataItemDescription = DataItemDescription
-#         self.Length = Length
+    """读取数据，gzip/bz2/xz/zstd压缩的文件边读边解压"""
+    lines = size = 0
+    try:
+        with open_text(path) as f:
+            for line in f:
+                lines += 1
+                size += len(line)
+                yield line.strip()
+    finally:
+        METRICS.inc('read_lines_total', lines)
+        METRICS.inc('read_bytes_total', size)
+
 
 class Coordinate:
     """坐标经纬度"""
@@ -58,231 +50,218 @@ class Coordinate:
         return f'({self.longitude}, {self.latitude})'
 
 # 雷达坐标
-RADAR_COOR = Coordinate(108.70702428342517,34.403288161891325)
+RADAR_COOR = Coordinate(*get_airport().radar)
+
+# 原始16进制串中CAT字段的位置（HDLC地址、控制字段之后）
+CAT_HEX_OFFSET = 4
 
 
 class SecondaryRadar:
     """二次雷达数据 基类"""
+    decoders: Dict[int, Type['SecondaryRadar']] = {}        # CAT -> 解码类
+    lazy_decoders: Dict[int, Type['SecondaryRadar']] = {}   # CAT -> 按需解码的类
+
     def __init__(self, source: str) -> None:
         soc = source.split()
-        self.recv_time: datetime = self._read_utc_str(soc[0])   # 接收到数据的时间
-        self.__source: str = soc[1]
+        try:
+            self.recv_ns: int = utc_str_to_ns(soc[0])   # 接收到数据的时间，纳秒时间戳
+            self._buffer: memoryview = memoryview(bytes.fromhex(soc[1]))    # 原始数据，只转换一次
+        except (ValueError, IndexError):
+            raise MalformedRecord(MALFORMED_LINE, f'无法解析的行: {source!r}') from None
+        self._offset: int = 0                                           # 当前读取位置（字节）
         self.__analysis()
     
     @classmethod
-    def get_cat(cls, source: str) -> int:
-        """获取原数据的CAT"""
-        return cls(source).CAT
-    
-    def __analysis(self) -> None:
-        """分析数据"""
-        self.HDLC_address = self._read_bits(1)  # HDLC地址字段
-        self.HDLC_control = self._read_bits(1)  # HDLC控制字段
-        self.CAT = self._read_bits(1)          # CAT数据种类
-        self.LEN = self._read_bits(2)          # 数据帧的总长度
-        self.FSPEC, _ = self._read_bits_bin_FX()   # UAP表的数据索引
-
-    def _read_utc_str(self, utc: str) -> datetime:
-        """解析时间"""
-        day, month, year, hour, minute, second = 0, 0, 0, 0, 0, 0
-        date_str, sec_str = utc.split(':')
-        day = int(date_str[-2:])        # 日
-        month = int(date_str[-4:-2])    # 月
-        year = int(date_str[:-4])       # 年
-        sec = float(sec_str)
-        hour = int(sec // 3600)          # 时
-        sec -= 3600 * hour
-        hour %= 24  # TODO 超过24h 处理
-        minute = int(sec // 60)          # 分
-        sec -= 60 * minute
-        second = int(sec // 1)           # 秒
-        sec -= 1 * second
-        microsecond = int(sec * 1e6)
-        return datetime(year=year, month=month, day=day,
-                        hour=hour, minute=minute, second=second, microsecond=microsecond)
-
-    def _read_bits(self, bits: int) -> int:
-        """从数据中读取bits个比特"""
-        soc = self._read_bits_str(bits)
-        return int(soc, 16)
-
-    def _read_bits_str(self, bits: int) -> str:
-        """读取bits个比特，返回原始16进制串"""
-        soc = self.__source[:bits*2]
-        self.__source = self.__source[bits*2:]
-        return soc
-    
-    def _read_bits_bin(self, bits: int) -> str:
-        """读取bits个比特，返回01串"""
-        length = bits * 8
-        soce = self._read_bits(bits)
-        result = bin(soce)[2:]
-        return '0' * (length - len(result)) + result
-
-    def _read_bits_FX(self, min: int = 1, step: int = 1) -> Tuple[int, int]:
-        """
-        依据FX位读取若干个比特
-        至少读取min个
-        一次步进step个比特
-        :return 读取的数据，实际读取的比特数
-        """
-        soc, read_num = self._read_bits_str_FX(min, step)
-        return int(soc, 16), read_num
-    
-    def _read_bits_str_FX(self, min: int = 1, step: int = 1) -> Tuple[str, int]:
+    def register(cls, CAT: int, lazy: bool = False) -> Callable[[Type['SecondaryRadar']], Type['SecondaryRadar']]:
+        """注册某个CAT的解码类，lazy为按需解码的类"""
+        def wrapper(decoder: Type['SecondaryRadar']) -> Type['SecondaryRadar']:
+            (cls.lazy_decoders if lazy else cls.decoders)[CAT] = decoder
+            return decoder
+        return wrapper
+
+    @staticmethod
+    def get_cat(source: str) -> int:
+        """获取原数据的CAT，只读取CAT字段，不解析整条数据"""
+        start = source.index(' ') + 1 + CAT_HEX_OFFSET
+        return int(source[start:start + 2], 16)
+
+    @classmethod
+    def parse(cls, source: str, categories: Optional[Iterable[int]] = None,
+              lazy: bool = False) -> Optional['SecondaryRadar']:
         """
-        依据FX位读取若干个比特
-        至少读取min个
-        一次步进step个
-        :return 读取的数据的16进制串，实际读取的比特数
+        按CAT分发给对应的解码类，只解析一次
+        categories 需要的CAT，为None时解析所有已注册的CAT
+        lazy 优先使用按需解码的类，读取字段时才解码对应的数据项
+        :return 解码结果，未注册或不需要的CAT、无法解析的数据返回None（计入malformed_total）
         """
-        read_num = 0
-        result_list = []
-        result_list.append(self._read_bits_str(min))
-        read_num += min
-        while (int(result_list[-1], 16) & 1) != 0:
-            result_list.append(self._read_bits_str(step))
-            read_num += step
-        soc = ''.join(result_list)
-        return soc, read_num
+        try:
+            CAT = cls.get_cat(source)
+        except ValueError:
+            METRICS.inc('malformed_total', reason=MALFORMED_LINE)
+            return None
+        if categories is not None and CAT not in categories:
+            return None
+        decoder = (lazy and cls.lazy_decoders.get(CAT)) or cls.decoders.get(CAT)
+        if decoder is None:
+            return None
+        try:
+            return decoder(source)
+        except MalformedRecord as e:
+            METRICS.inc('malformed_total', reason=e.reason)
+            return None
     
-    def _read_bits_bin_FX(self, min: int = 1, step: int = 1) -> Tuple[str, int]:
+    def __analysis(self) -> None:
+        """分析数据"""
+        buffer = self._buffer
+        if len(buffer) < HDLC_LEN + MIN_BLOCK:
+            raise MalformedRecord(MALFORMED_LENGTH, f'数据过短: {len(buffer)}字节')
+        self.HDLC_address = buffer[0]           # HDLC地址字段
+        self.HDLC_control = buffer[1]           # HDLC控制字段
+        self.CAT = buffer[2]                    # CAT数据种类
+        self.LEN = (buffer[3] << 8) | buffer[4] # 数据帧的总长度
+        self._offset = self._fspec_offset = 5               # UAP表的数据索引的位置
+        self._end = HDLC_LEN + self.LEN                     # 记录最远的结束位置
+        if self.LEN < MIN_BLOCK or self._end > len(buffer):
+            raise MalformedRecord(MALFORMED_LENGTH, f'LEN字段与数据长度不符: {self.LEN}')
+        try:
+            self._fspec_len = self._skip_bits_FX()
+        except IndexError:
+            raise MalformedRecord(MALFORMED_OVERRUN, 'FSPEC超出数据') from None
+
+    @property
+    def FSPEC(self) -> str:
+        """UAP表的数据索引，01串"""
+        start = self._fspec_offset
+        value = int.from_bytes(self._buffer[start:start + self._fspec_len], 'big')
+        return format(value, f'0{self._fspec_len * 8}b')
+
+    def _decode_UAP(self, uap: CompiledUAP) -> None:
+        """根据FSPEC和UAP表设置字段值，数据项超出LEN字段的范围时抛出MalformedRecord"""
+        try:
+            self._offset = uap.decode(self, self._buffer, self._fspec_offset, self._offset)
+        except (IndexError, struct.error):
+            raise MalformedRecord(MALFORMED_OVERRUN, f'CAT{self.CAT:03d}数据项超出数据') from None
+        except ValueError as e:
+            raise MalformedRecord(MALFORMED_FRN, str(e)) from None
+        if self._offset > self._end:
+            raise MalformedRecord(MALFORMED_OVERRUN, f'CAT{self.CAT:03d}数据项超出LEN字段的范围')
+
+    @property
+    def recv_time(self) -> datetime:
+        """接收到数据的时间，用到时才创建datetime"""
+        return ns_to_datetime(self.recv_ns)
+
+    @property
+    def data_time(self) -> time:
+        """数据包产生的时间，用到时才创建time，没有Time-of-Day时不存在"""
+        try:
+            return ticks_to_time(self.tod)
+        except AttributeError:
+            raise AttributeError('data_time') from None
+
+    @property
+    def plot_ns(self) -> int:
+        """数据包产生的时间，结合接收时间还原日期后的纳秒时间戳"""
+        return resolve_tod(self.recv_ns, self.tod)
+
+    def _scan_FX(self, min: int = 1, step: int = 1) -> int:
         """
-        依据FX位读取若干个比特
-        至少读取min个
-        一次步进step个
-        :return 读取的数据的01串，实际读取的比特数
+        依据FX位计算字段长度，不移动读取位置
+        至少min个字节，一次步进step个字节
+        :return 字段的字节数
         """
-        soce, num = self._read_bits_FX(min, step)
-        length = num * 8
-        result = bin(soce)[2:]
-        return '0' * (length - len(result)) + result, num
+        buffer = self._buffer
+        end = self._offset + min
+        while buffer[end - 1] & 1:
+            end += step
+        return end - self._offset
+
+    def _skip_bits_FX(self, min: int = 1, step: int = 1) -> int:
+        """依据FX位跳过若干个字节，返回跳过的字节数"""
+        read_num = self._scan_FX(min, step)
+        self._offset += read_num
+        return read_num
     
     def dump_json(self) -> Dict[str, Any]:
         pass
 
 
+# CAT048列式数组的列 -> SecondaryRadar048的字段，按各数据项的有效位设置
+RECORD_FIELDS: Tuple[Tuple[int, Tuple[Tuple[str, str], ...]], ...] = (
+    (VALID_SOURCE, (('SAC', 'SAC'), ('SIC', 'SIC'))),                       # 区域码、雷达的编码
+    (VALID_TIME, (('tod', 'tod'),)),                                        # 数据包产生的时间，1/128 s
+    (VALID_POLAR, (('rho', 'polar_diameter'), ('theta', 'polar_angle'))),   # 极径m、极角°
+    (VALID_FL, (('FL', 'FL'),)),                                            # 飞行高度 m
+    (VALID_ICAO, (('ICAO', 'ICAO'),)),                                      # 飞机的ICAO码
+    (VALID_CALLSIGN, (('callsign', 'flight_num'),)),                        # 航班号
+    (VALID_TRACK_NUMBER, (('track_number', 'track_number'),)),              # 航迹号
+    (VALID_CARTESIAN, (('X', 'position_X'), ('Y', 'position_Y'))),          # X、Y坐标，单位m
+    (VALID_VELOCITY, (('ground_speed', 'polar_track_velocity'),             # 极坐标的轨道速度 m/s
+                      ('heading', 'polar_track_heading'))),                 # 速度的方向 °
+)
+
+
+@SecondaryRadar.register(48)
 class SecondaryRadar048(SecondaryRadar):
-    """二次雷达数据CAT048"""
-    # CAT048UAP: List[CAT048UAPItem] = load_UAP()         # 完整的UAP表
+    """二次雷达数据CAT048，与列式解码共用plot_batch中按列转换的解码函数"""
+    UAP: CompiledUAP = CAT048_BATCH_UAP     # 完整的UAP表
 
     def __init__(self, source: str) -> None:
         super().__init__(source)
-        self.__set_UAP_Item()
-    
-    def __set_UAP_Item(self) -> None:
-        """根据FSPEC和UAP设置字段值"""
-        # Data SOurce Identifier: SAC SIC
-        if self.FSPEC[1-1] == '1':
-            self.SAC = self._read_bits(1)      # 区域码
-            self.SIC = self._read_bits(1)      # 雷达的编码
-        # Time-of-Day
-        if self.FSPEC[2-1] == '1':
-            stap = self._read_bits(3) / 128
-            self.data_time = trans_stap_to_time(stap)  # 数据包产生的时间
-        # Target Report Descriptor
-        if self.FSPEC[3-1] == '1':
-            self._read_bits_str_FX()
-        # Measured Position in Slant Polar Coordinates
-        if self.FSPEC[4-1] == '1':
-            self.polar_diameter = self._read_bits(2) / 256 * 1852       # 极径m
-            self.polar_angle = self._read_bits(2) * 360 / (1<<16)       # 极角°
-        # Mode-3/A Code in Octal Representation
-        if self.FSPEC[5-1] == '1':
-            self._read_bits_str(2)
-        # Flight Level in Binary Representation
-        if self.FSPEC[6-1] == '1':
-            tap = self._read_bits(2)
-            if tap < (1<<14):
-                self.FL = tap / 4 * 30.48      # 飞行高度 m
-        # Radar Plot Characteristics
-        if self.FSPEC[7-1] == '1':
-            rpc, _ = self._read_bits_bin_FX()
-            for v in rpc:
-                if v == '1':
-                    self._read_bits_str(1)
-
-        if len(self.FSPEC) <= 8:
-            return
-        
-        # Aircraft Address
-        if self.FSPEC[8+1-1] == '1':
-            self.ICAO = self._read_bits(3)  # 飞机的ICAO码
-
-        # Aircraft Identification
-        if self.FSPEC[9+1-1] == '1':
-            self.flight_num = ''            # 航班号
-            temp = self._read_bits_bin(6)
-            index = 0
-            while index < len(temp):
-                c = int(temp[index:index+6], 2)
-                index += 6
-                if 1 <= c <= 26:
-                    self.flight_num += chr(ord('A') + c - 1)
-                elif 48 <= c <= 57:
-                    self.flight_num += chr(ord('0') + c - 48)
-                # else: # 意外情况c=32
-                #     self.flight_num += ' '
-        # Mode S MB Data
-        if self.FSPEC[10+1-1] == '1':
-            MB_len = self._read_bits(1)
-            self._read_bits_str(8 * MB_len)
-        # Track Number
-        if self.FSPEC[11+1-1] == '1':
-            self.track_number = self._read_bits(2) # 航迹号
-        # Calculatede Position in Cartesian Coordinates
-        if self.FSPEC[12+1-1] == '1':
-            self.position_X = self._read_bits(2) / 128 * 1852  # X坐标，单位m
-            self.position_Y = self._read_bits(2) / 128 * 1852  # Y坐标，单位m
-        # Calculated Track Velocity in Polar Representation
-        if self.FSPEC[13+1-1] == '1':
-            self.polar_track_velocity = self._read_bits(2) * 1852 / (1<<14)   # 极坐标的轨道速度 m/s
-            self.polar_track_heading = self._read_bits(2) * 360 / (1<<16)      # 速度的方向 °
-        # Track Status
-        if self.FSPEC[14+1-1] == '1':
-            self._read_bits_str_FX()
-
-        if len(self.FSPEC) <= 16:
-            return
+        self._set_fields(decode_record(self._buffer, self._locate_items(whole=True)))
+
+    def _locate_items(self, whole: bool = False) -> Dict[str, int]:
+        """
+        定位需要解码的数据项，数据项超出LEN字段的范围时抛出MalformedRecord
+        whole 处理完整条记录，读取位置移到记录末尾
+        """
+        try:
+            items, end = self.UAP.locate(self._buffer, self._fspec_offset, self._offset, whole)
+        except (IndexError, struct.error):
+            raise MalformedRecord(MALFORMED_OVERRUN, 'CAT048数据项超出数据') from None
+        except ValueError as e:
+            raise MalformedRecord(MALFORMED_FRN, str(e)) from None
+        if end > self._end:
+            raise MalformedRecord(MALFORMED_OVERRUN, 'CAT048数据项超出LEN字段的范围')
+        if whole:
+            self._offset = end
+        return items
+
+    def _set_fields(self, row: np.ndarray) -> None:
+        """把decode_record解码的一行中有效的列设置为字段"""
+        valid = int(row['valid'][0])
+        for flag, fields in RECORD_FIELDS:
+            if valid & flag:
+                for column, name in fields:
+                    value = row[column][0].item()
+                    setattr(self, name, value.decode() if isinstance(value, bytes) else value)
 
-        # Track QUality
-        if self.FSPEC[15+2-1] == '1':
-            self._read_bits_str(4)
-        # Warning/Error Conditions
-        if self.FSPEC[16+2-1] == '1':
-            self._read_bits_str_FX()
-        # Mode-3/A Code Confidence Indicator
-        if self.FSPEC[17+2-1] == '1':
-            self._read_bits_str(2)
-        # Mode-C Code and Confidence Indicator
-        if self.FSPEC[18+2-1] == '1':
-            self._read_bits_str(4)
-        # Height Measured by 3D Radar
-        # if self.FSPEC[19+2-1] == '1':
-        #     self.D3_height = self._read_bits(2) * 25 * 0.3 # 三维雷达测定的目标高度，使用平均海平面作为0基准面
-    
     def calculate_coor(self) -> Optional[Coordinate]:
-        """计算经纬度"""
-        if hasattr(self, 'polar_diameter') and hasattr(self, 'polar_angle'):
-            c = self.polar_diameter / 6371000 * 180 / math.pi
-            a = math.acos(math.cos(90 - RADAR_COOR.latitude) * math.cos(c) + math.sin(90 - RADAR_COOR.latitude) * math.sin(c) * math.cos(self.polar_angle))
-            t = math.asin(math.sin(c) * math.sin(self.polar_angle) / math.sin(a))
-            return Coordinate(RADAR_COOR.longitude + t, RADAR_COOR.latitude - a)
-        return None
+        """按数据源的雷达站址与距离偏差计算经纬度"""
+        if '_coor' not in self.__dict__:
+            if hasattr(self, 'polar_diameter') and hasattr(self, 'polar_angle'):
+                sensors = get_sensors()
+                sensor = sensors.get(self.SAC, self.SIC) if hasattr(self, 'SAC') else sensors.fallback
+                self._coor = Coordinate(*sensor.projection.to_coor(self.polar_diameter - sensor.range_bias,
+                                                                   self.polar_angle, getattr(self, 'FL', None)))
+            else:
+                self._coor = None
+        return self._coor
 
     def dump_json(self) -> Dict[str, Any]:
         """获取对象的数据"""
-        member = dir(self)
+        member = self.__dict__
+        coor = self.calculate_coor()
         return {
-            "recv_time": self.recv_time if 'recv_time' in member else None,
+            "recv_time": self.recv_time if 'recv_ns' in member else None,
             "HDLC_address": self.HDLC_address if 'HDLC_address' in member else None,
             "HDLC_control": self.HDLC_control if 'HDLC_control' in member else None,
             "CAT": self.CAT if 'CAT' in member else None,
             "LEN": self.LEN if 'LEN' in member else None,
-            "FSPEC": self.FSPEC if 'FSPEC' in member else None,
+            "FSPEC": self.FSPEC if '_fspec_len' in member else None,
             "SAC": self.SAC if 'SAC' in member else None,
             "SIC": self.SIC if 'SIC' in member else None,
-            "Time-of-Day": self.data_time if 'data_time' in member else None,
+            "Time-of-Day": self.data_time if 'tod' in member else None,
             "polar diameter": self.polar_diameter if 'polar_diameter' in member else None,
             "polar angle": self.polar_angle if 'polar_angle' in member else None,
             "FL": self.FL if 'FL' in member else None,
@@ -294,236 +273,481 @@ class SecondaryRadar048(SecondaryRadar):
             "polar track velocity": self.polar_track_velocity if 'polar_track_velocity' in member else None,
             "polar track heading": self.polar_track_heading if 'polar_track_heading' in member else None,
             # "3D height": self.D3_height if 'D3_height' in member else None,
-            "longitude": self.calculate_coor().longitude if self.calculate_coor() != None else None,
-            "latitude": self.calculate_coor().latitude if self.calculate_coor() != None else None,
+            "longitude": coor.longitude if coor != None else None,
+            "latitude": coor.latitude if coor != None else None,
         }
     
+    @staticmethod
+    def dump_batch(batch: np.ndarray) -> Generator[Dict[str, Any], None, None]:
+        """逐行获取列式数据，字段与dump_json一致，经纬度按各数据源的雷达站址换算"""
+        longitudes, latitudes = get_sensors().to_geodetic(batch)
+        for row, longitude, latitude in zip(batch.tolist(), longitudes.tolist(), latitudes.tolist()):
+            (recv_time, SAC, SIC, valid, tod, plot_time, rho, theta, FL, ICAO, callsign,
+             track_number, X, Y, ground_speed, heading) = row
+            coor = Coordinate(longitude, latitude) if valid & VALID_POLAR else None
+            yield {
+                "CAT": 48,
+                "SAC": SAC if valid & VALID_SOURCE else None,
+                "SIC": SIC if valid & VALID_SOURCE else None,
+                "recv_time": ns_to_datetime(recv_time),
+                "Time-of-Day": ticks_to_time(tod) if valid & VALID_TIME else None,
+                "polar diameter": rho if valid & VALID_POLAR else None,
+                "polar angle": theta if valid & VALID_POLAR else None,
+                "FL": FL if valid & VALID_FL else None,
+                "ICAO": ICAO if valid & VALID_ICAO else None,
+                "flight_num": callsign.decode() if valid & VALID_CALLSIGN else None,
+                "track number": track_number if valid & VALID_TRACK_NUMBER else None,
+                "polar track velocity": ground_speed if valid & VALID_VELOCITY else None,
+                "polar track heading": heading if valid & VALID_VELOCITY else None,
+                "longitude": coor.longitude if coor != None else None,
+                "latitude": coor.latitude if coor != None else None,
+            }
+
+    # 导出的列
+    EXPORT_HEADS: List[str] = [
+        # "recv_time",
+        # "HDLC_address",
+        # "HDLC_control",
+        "CAT",
+        # "LEN",
+        # "FSPEC",
+        "SAC",
+        "SIC",
+        "Time-of-Day",
+        # "polar diameter",
+        # "polar angle",
+        "longitude",
+        "latitude",
+        "FL",
+        "ICAO",
+        "flight_num",
+        "track number",
+        # "position X",
+        # "position Y",
+        "polar track velocity",
+        "polar track heading",
+    ]
+
+    # dump_json中各列的类型
+    EXPORT_TYPES: Dict[str, str] = {
+        "recv_time": DATETIME,
+        "HDLC_address": INT,
+        "HDLC_control": INT,
+        "CAT": INT,
+        "LEN": INT,
+        "FSPEC": STR,
+        "SAC": INT,
+        "SIC": INT,
+        "Time-of-Day": TIME,
+        "polar diameter": FLOAT,
+        "polar angle": FLOAT,
+        "longitude": FLOAT,
+        "latitude": FLOAT,
+        "FL": FLOAT,
+        "ICAO": INT,
+        "flight_num": STR,
+        "track number": INT,
+        "position X": FLOAT,
+        "position Y": FLOAT,
+        "polar track velocity": FLOAT,
+        "polar track heading": FLOAT,
+    }
+
     @classmethod
-    def load_excel(cls, datas: List['SecondaryRadar048'], path: str) -> None:
-        """把结果写入文件"""
-        heads = [
-            # "recv_time",
-            # "HDLC_address",
-            # "HDLC_control",
-            "CAT",
-            # "LEN",
-            # "FSPEC",
-            "SAC",
-            "SIC",
-            "Time-of-Day",
-            # "polar diameter",
-            # "polar angle",
-            "longitude",
-            "latitude",
-            "FL",
-            "ICAO",
-            "flight_num",
-            "track number",
-            # "position X",
-            # "position Y",
-            "polar track velocity",
-            "polar track heading",
-        ]
-        wb = Workbook()
-        ws = wb.active
-        for i, title in enumerate(heads):
-            ws.cell(row=1, column=i+1, value=title)
-        for i, data in enumerate(datas):
-            json_data = data.dump_json()
-            for j, title in enumerate(heads):
-                ws.cell(row=i+2, column=j+1, value=json_data[title])
-        wb.save(path)  
+    def load_excel(cls, datas: Any, path: str, format: Optional[str] = None) -> None:
+        """把结果写入文件，datas为对象列表或列式数组，format默认取文件扩展名"""
+        if isinstance(datas, np.ndarray):
+            json_datas = cls.dump_batch(datas)
+        else:
+            json_datas = (data.dump_json() for data in datas)
+        with METRICS.timer(stage='export'):
+            export(json_datas, cls.EXPORT_HEADS, path, format, cls.EXPORT_TYPES)
+
+
+class LazyField:
+    """按需解码的字段: 第一次读取时解码对应的数据项，结果保存在实例中，之后直接读取实例的属性"""
+    def __init__(self, item: str) -> None:
+        self.item = item
+        self.name = ''
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, record: Optional['LazySecondaryRadar048'], owner: type) -> Any:
+        if record is None:
+            return self
+        offset = record._items.pop(self.item, None)
+        if offset is not None:
+            record._decode_item(self.item, offset)
+        try:
+            return record.__dict__[self.name]
+        except KeyError:
+            # 没有该数据项，或数据项存在但值无效（如FL超出范围）
+            raise AttributeError(self.name) from None
+
+
+@SecondaryRadar.register(48, lazy=True)
+class LazySecondaryRadar048(SecondaryRadar048):
+    """
+    按需解码的CAT048: 构造时只解析FSPEC并记录各数据项的位置
+    第一次读取某个字段时才解码对应的数据项，不存在的字段与SecondaryRadar048一样抛出AttributeError
+    """
+    SAC = LazyField('I048/010')
+    SIC = LazyField('I048/010')
+    tod = LazyField('I048/140')
+    polar_diameter = LazyField('I048/040')
+    polar_angle = LazyField('I048/040')
+    FL = LazyField('I048/090')
+    ICAO = LazyField('I048/220')
+    flight_num = LazyField('I048/240')
+    track_number = LazyField('I048/161')
+    position_X = LazyField('I048/042')
+    position_Y = LazyField('I048/042')
+    polar_track_velocity = LazyField('I048/200')
+    polar_track_heading = LazyField('I048/200')
+
+    def __init__(self, source: str) -> None:
+        SecondaryRadar.__init__(self, source)
+        # 尚未解码的数据项 -> 起始位置，与完整解码一样检查数据项不超出LEN字段的范围，之后按需解码时不会读到记录之外
+        self._items = self._locate_items()
 
+    def _decode_item(self, item: str, offset: int) -> None:
+        """解码一个数据项"""
+        self._set_fields(decode_record(self._buffer, {item: offset}))
 
+    def decode_all(self) -> None:
+        """解码所有尚未解码的数据项"""
+        self._set_fields(decode_record(self._buffer, self._items))
+        self._items.clear()
+
+    def dump_json(self) -> Dict[str, Any]:
+        self.decode_all()
+        return super().dump_json()
+
+
+def _decode_I034_010(record: 'SecondaryRadar034', buffer: memoryview, offset: int) -> None:
+    """Data Source Identifier"""
+    record.SAC = buffer[offset]          # 区域码
+    record.SIC = buffer[offset + 1]      # 雷达的编码
+
+
+def _decode_I034_000(record: 'SecondaryRadar034', buffer: memoryview, offset: int) -> None:
+    """Message Type"""
+    record.message_type = buffer[offset]     # 消息类型
+
+
+def _decode_I034_030(record: 'SecondaryRadar034', buffer: memoryview, offset: int) -> None:
+    """Time-of-Day"""
+    record.tod = int.from_bytes(buffer[offset:offset + 3], 'big')  # 数据包产生的时间，1/128 s
+
+
+def _decode_I034_020(record: 'SecondaryRadar034', buffer: memoryview, offset: int) -> None:
+    """Sector Number"""
+    record.sector_number = buffer[offset]    # 扇区号
+
+
+def _decode_I034_041(record: 'SecondaryRadar034', buffer: memoryview, offset: int) -> None:
+    """Antenna Rotation Period"""
+    record.antenna_rotation_period = ((buffer[offset] << 8) | buffer[offset + 1]) / 128     # 天线旋转周期 s
+
+
+# CAT034需要解码的数据项，其余数据项按长度跳过
+CAT034_DECODERS = {
+    'I034/010': _decode_I034_010,
+    'I034/000': _decode_I034_000,
+    'I034/030': _decode_I034_030,
+    'I034/020': _decode_I034_020,
+    'I034/041': _decode_I034_041,
+}
+
+
+@SecondaryRadar.register(34)
 class SecondaryRadar034(SecondaryRadar):
     """二次雷达数据CAT034"""
+    UAP: CompiledUAP = CompiledUAP.from_file(34, CAT034UAP_PATH, CAT034_DECODERS)    # 完整的UAP表
+
     def __init__(self, source: str) -> None:
         super().__init__(source)
-        self.__set_UAP_Item()
-
-    def __set_UAP_Item(self) -> None:
-        """根据FSPEC和UAP设置字段值"""
-        # Data Source Identifier
-        if self.FSPEC[1-1] == '1':
-            self.SAC = self._read_bits(1)      # 区域码
-            self.SIC =self._read_bits(1)       # 雷达的编码
-        # Message Type
-        if self.FSPEC[2-1] == '1':
-            self.message_type = self._read_bits(1) # 消息类型
-        # Time-of-Day
-        if self.FSPEC[3-1] == '1':
-            stap = self._read_bits(3) / 128
-            self.data_time = trans_stap_to_time(stap)   # 数据包产生的时间
-        # Sector Number
-        if self.FSPEC[4-1] == '1':
-            self.sector_number = self._read_bits(1)    # 扇区号
-        # Antenna Rotation Period
-        # if self.FSPEC[5-1] == '1':
-        #     self.antenna_rotation_period = self._read_bits(2) / 128    # 天线旋转周期 s
-        # # System Configuration and Status
-        # if self.FSPEC[6-1] == '1':
-        #     rpc, _ = self._read_bits_bin_FX()
-        #     for v in rpc:
-        #         if v == '1':
-        #             self._read_bits_str(1)
-        # # System Processing Mode
-        # if self.FSPEC[7-1] == '1':
-        #     rpc, _ = self._read_bits_bin_FX()
-        #     for v in rpc:
-        #         if v == '1':
-        #             self._read_bits_str(1)
-        
-        # if len(self.FSPEC) <= 8:
-        #     return
-        
-        # # Message Count Values
-        # if self.FSPEC[8+1-1] == '1':
-        #     rep = self._read_bits(1)
-        #     self._read_bits_str(2 * rep)
-        # # Generic Polar Window
-        # if self.FSPEC[9+1-1] == '1':
-        #     self._read_bits_str(8)
-        # # Data Filter
-        # if self.FSPEC[10+1-1] == '1':
-        #     self._read_bits_str(1)
-        # # 3D-Position of Date Source
-        # if self.FSPEC[11+1-1] == '1':
-        #     self._read_bits_str(8)
-        # # Collimation Error
-        # if self.FSPEC[12+1-1] == '1':
-        #     self._read_bits_str(2)
+        self._decode_UAP(self.UAP)
 
     def dump_json(self) -> Dict[str, Any]:
         """获取对象的数据"""
-        member = dir(self)
+        member = self.__dict__
         return {
-            "recv_time": self.recv_time if 'recv_time' in member else None,
+            "recv_time": self.recv_time if 'recv_ns' in member else None,
             "HDLC_address": self.HDLC_address if 'HDLC_address' in member else None,
             "HDLC_control": self.HDLC_control if 'HDLC_control' in member else None,
             "CAT": self.CAT if 'CAT' in member else None,
             "LEN": self.LEN if 'LEN' in member else None,
-            "FSPEC": self.FSPEC if 'FSPEC' in member else None,
+            "FSPEC": self.FSPEC if '_fspec_len' in member else None,
             "SAC": self.SAC if 'SAC' in member else None,
             "SIC": self.SIC if 'SIC' in member else None,
-            "Time-of-Day": self.data_time if 'data_time' in member else None,
+            "Time-of-Day": self.data_time if 'tod' in member else None,
             "Message Type": self.message_type if 'message_type' in member else None,
             "Sector Number": self.sector_number if 'sector_number' in member else None,
-            # "Antenna Rotation Period": self.antenna_rotation_period if 'antenna_rotation_period' in member else None,
+            "Antenna Rotation Period": self.antenna_rotation_period if 'antenna_rotation_period' in member else None,
         }
 
-    @classmethod
-    def load_excel(cls, datas: List['SecondaryRadar034'], path: str) -> None:
-        """把结果写入文件"""
-        heads = [
-            "recv_time",
-            "HDLC_address",
-            "HDLC_control",
-            "CAT",
-            "LEN",
-            "FSPEC",
-            "SAC",
-            "SIC",
-            "Time-of-Day",
-            "Message Type",
-            "Sector Number",
-            # "Antenna Rotation Period",
-        ]
-        wb = Workbook()
-        ws = wb.active
-        for i, title in enumerate(heads):
-            ws.cell(row=1, column=i+1, value=title)
-        for i, data in enumerate(datas):
-            json_data = data.dump_json()
-            for j, title in enumerate(heads):
-                ws.cell(row=i+2, column=j+1, value=json_data[title])
-        wb.save(path)  
-
-
-class PlaneTrackData:
-    """飞机的一条航迹数据"""
-    def __init__(self, ICAO: int, flight_num: int) -> None:
-        self.plane_ICAO = ICAO              # 飞机的ICAO码
-        self.flight_num = flight_num          # 航班号
-        self.track_data: List[SecondaryRadar048] = []   # 该航迹的所有数据
-    
-    def add_data(self, data: SecondaryRadar048) -> None:
-        """补充数据"""
-        self.track_data.append(data)
-    
-    def __sort(self) -> None:
-        self.track_data.sort(key=lambda x: x.data_time)
-    
-    def min_FL(self) -> float:
-        """飞机的最低飞行高度"""
-        fl_list = [i.FL for i in self.track_data if hasattr(i, 'FL')] + [99999999]
-        return min(fl_list)
-    
-    def max_FL(self) -> float:
-        """飞机的最高飞行高度"""
-        fl_list = [i.FL for i in self.track_data if hasattr(i, 'FL')] + [-99999999]
-        return max(fl_list)
-    
-    def is_land(self) -> bool:
-        """飞机是否降落"""
-        start_fl = -1
-        end_fl = -1
-        for i in self.track_data:
-            if hasattr(i, 'FL'):
-                end_fl = i.FL
-                if start_fl == -1:
-                    start_fl = i.FL
-        if end_fl - start_fl < 0:
-            return True
-        else:
-            return False
+    # 导出的列
+    EXPORT_HEADS: List[str] = [
+        "recv_time",
+        "HDLC_address",
+        "HDLC_control",
+        "CAT",
+        "LEN",
+        "FSPEC",
+        "SAC",
+        "SIC",
+        "Time-of-Day",
+        "Message Type",
+        "Sector Number",
+        "Antenna Rotation Period",
+    ]
+
+    # dump_json中各列的类型
+    EXPORT_TYPES: Dict[str, str] = {
+        "recv_time": DATETIME,
+        "HDLC_address": INT,
+        "HDLC_control": INT,
+        "CAT": INT,
+        "LEN": INT,
+        "FSPEC": STR,
+        "SAC": INT,
+        "SIC": INT,
+        "Time-of-Day": TIME,
+        "Message Type": INT,
+        "Sector Number": INT,
+        "Antenna Rotation Period": FLOAT,
+    }
 
+    @classmethod
+    def load_excel(cls, datas: Iterable['SecondaryRadar034'], path: str, format: Optional[str] = None) -> None:
+        """把结果写入文件，format默认取文件扩展名"""
+        export((data.dump_json() for data in datas), cls.EXPORT_HEADS, path, format, cls.EXPORT_TYPES)
+
+
+def timed_batches(batches: Iterable[np.ndarray], stage: str = 'decode') -> Generator[np.ndarray, None, None]:
+    """记录产生每一批数据的耗时"""
+    iterator = iter(batches)
+    while True:
+        with METRICS.timer(stage=stage):
+            batch = next(iterator, None)
+        if batch is None:
+            return
+        yield batch
+
+
+def stream_file(file_path: str, batch_size: int = 4096, quarantine: Optional[Quarantine] = None,
+                sensors: Optional[SensorRegistry] = None,
+                dedup: Optional[Deduplicator] = None) -> Generator[np.ndarray, None, None]:
+    """
+    单进程逐批解码一个文件（文本或二进制记录）中的CAT048数据
+    quarantine 无法解析的行或帧写入的旁路文件，不指定时只计数
+    sensors 由CAT034记下各数据源的天线旋转周期，dedup 丢弃冗余线路的重复帧
+    """
+    if is_recording(file_path):
+        METRICS.inc('read_bytes_total', os.path.getsize(file_path))
+        with RecordingReader(file_path) as reader:
+            yield from timed_batches(stream_frames(reader, batch_size, quarantine, sensors, dedup))
+    else:
+        yield from timed_batches(stream_lines(read_data(file_path), batch_size, quarantine, sensors, dedup))
+
+
+def scan_file(file_path: str, per: str = PER_SECTOR, quarantine: Optional[Quarantine] = None,
+              sensors: Optional[SensorRegistry] = None,
+              dedup: Optional[Deduplicator] = None) -> Generator[ScanBatch, None, None]:
+    """单进程按CAT034的正北、扇区消息逐个扫描或扇区解码一个文件中的CAT048数据"""
+    if is_recording(file_path):
+        METRICS.inc('read_bytes_total', os.path.getsize(file_path))
+        with RecordingReader(file_path) as reader:
+            yield from timed_batches(scan_frames(reader, per, sensors, quarantine=quarantine, dedup=dedup))
+    else:
+        yield from timed_batches(scan_lines(read_data(file_path), per, sensors, quarantine=quarantine, dedup=dedup))
+
+
+def decode_file(file_path: str, quarantine: Optional[Quarantine] = None, sensors: Optional[SensorRegistry] = None,
+                dedup: Optional[Deduplicator] = None) -> np.ndarray:
+    """单进程解码一个文件（文本或二进制记录）中的CAT048数据，返回列式数组"""
+    if is_recording(file_path):
+        with RecordingReader(file_path) as reader:
+            return decode_frames(reader, quarantine=quarantine, sensors=sensors, dedup=dedup)
+    return decode_lines(read_data(file_path), quarantine=quarantine, sensors=sensors, dedup=dedup)
+
+
+class TrackExporter:
+    """把结束的航迹判断飞行阶段后分别写入起飞、降落文件，飞越的航迹不导出"""
+    def __init__(self, take: Exporter, land: Exporter, config: Optional[PhaseConfig] = None) -> None:
+        self.take = take
+        self.land = land
+        self.config = config
+        self.airport = get_airport()
+
+    def write(self, tracks: List[PlaneTrackData]) -> np.ndarray:
+        """写入若干条结束的航迹，返回各航迹的飞行阶段"""
+        if not tracks:
+            return np.empty(0, np.uint8)
+        heads = SecondaryRadar048.EXPORT_HEADS
+        with METRICS.timer(stage='classify'):
+            kinds = classify_tracks(tracks, self.airport, self.config).kind
+        METRICS.inc('tracks_closed_total', len(tracks))
+        with METRICS.timer(stage='export'):
+            for track, kind in zip(tracks, kinds):
+                if kind == TRACK_TAKEOFF:
+                    exporter = self.take
+                elif kind == TRACK_LANDING:
+                    exporter = self.land
+                else:
+                    continue
+                exporter.write_rows(select_columns(SecondaryRadar048.dump_batch(track.track_data), heads))
+                METRICS.inc('exported_rows_total', track.count, kind=TRACK_NAMES[kind])
+        return kinds
+
+    def flush(self) -> None:
+        self.take.flush()
+        self.land.flush()
+
+    def close(self) -> None:
+        self.take.close()
+        self.land.close()
+
+    def __enter__(self) -> 'TrackExporter':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+# 参与航迹归类的点迹必须有的字段
+TRACK_REQUIRED = VALID_CALLSIGN | VALID_ICAO
+
+
+def track_plots(batch: np.ndarray) -> np.ndarray:
+    """只保留有航班号与ICAO码的点迹"""
+    return batch[(batch['valid'] & TRACK_REQUIRED) == TRACK_REQUIRED]
+
+
+def export_file(file_path: str, batches: Iterable[Union[np.ndarray, ScanBatch]], format: str = 'xlsx',
+                timeout: int = TRACK_TIMEOUT_NS, config: Optional[PhaseConfig] = None) -> None:
+    """
+    把一个文件的数据逐批归入航迹，航迹结束即判断飞行阶段并导出到起飞或降落表格
+    batches 列式数组、逐批的列式数组或逐个扫描/扇区的ScanBatch，后者以结束的CAT034消息的接收时间推进航迹超时
+    """
+    if isinstance(batches, np.ndarray):
+        batches = [batches]
+    heads = SecondaryRadar048.EXPORT_HEADS
+    file_name_take = os.path.splitext(strip_extension(file_path))[0] + f'-take.{format}'
+    file_name_land = os.path.splitext(strip_extension(file_path))[0] + f'-land.{format}'
+    store = TrackStore(timeout)
+    types = SecondaryRadar048.EXPORT_TYPES
+    with TrackExporter(get_exporter(file_name_take, heads, format, types),
+                       get_exporter(file_name_land, heads, format, types), config) as exporter:
+        for batch in batches:
+            end = None
+            if isinstance(batch, ScanBatch):
+                batch, end = batch.plots, batch.end
+            with METRICS.timer(stage='group'):
+                closed = store.add_batch(track_plots(batch))
+                if end is not None:
+                    closed += store.advance(end)
+            exporter.write(closed)
+        exporter.write(store.close_all())
 
 
 if __name__ == '__main__':
-    files = [os.path.join(FILE_DIR_PATH, i) for i in os.listdir(FILE_DIR_PATH) if not i.endswith('.xlsx')]
+    from decode_cache import CACHE_DIR, CACHE_SIZE, DecodeCache, KEY_CONTENT, KEY_STAT
+
+    parser = argparse.ArgumentParser(description='雷达数据分析 CAT048')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='并行解码的进程数，0为CPU核数，默认1（单进程）')
+    parser.add_argument('--chunk-size', type=int, default=64,
+                        help='并行模式下大文件切分的块大小，单位MB，默认64')
+    parser.add_argument('-f', '--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx',
+                        help='导出格式，默认xlsx')
+    parser.add_argument('--track-timeout', type=float, default=TRACK_TIMEOUT_NS / 1e9,
+                        help='航迹超时，超过这么久没有新点迹即结束航迹，单位s，默认120')
+    parser.add_argument('--metrics', help='结束时把指标保存为JSON')
+    parser.add_argument('--report-interval', type=float, default=10.0,
+                        help='定期输出指标摘要到stderr的间隔，单位s，0为只在结束时输出，默认10')
+    parser.add_argument('--profile-items', type=int, default=0,
+                        help='每N条记录采样一条，统计每个数据项的解码耗时，0为不采样（单进程时有效）')
+    parser.add_argument('--quarantine',
+                        help='无法解析的行或帧追加到该文件（单进程时有效），不指定时只计数并跳过')
+    parser.add_argument('--cache', nargs='?', const=CACHE_DIR,
+                        help=f'缓存解码结果的目录，未变化的文件不再解码，只指定--cache时为{CACHE_DIR}')
+    parser.add_argument('--cache-size', type=float, default=CACHE_SIZE / 1024**2, help='缓存容量，单位MB')
+    parser.add_argument('--cache-key', choices=[KEY_STAT, KEY_CONTENT], default=KEY_STAT,
+                        help='stat按路径、大小、修改时间判断文件是否变化，content按内容哈希')
+    parser.add_argument('--sensors', help='传感器登记表（SAC SIC 经度 纬度 [高度] [距离偏差] [名称]），默认sensors.txt')
+    parser.add_argument('--dedup', type=float, nargs='?', const=DEDUP_WINDOW_NS / 1e9,
+                        help=f'丢弃冗余线路送来的相同帧，判断窗口 s，只指定--dedup时为{DEDUP_WINDOW_NS / 1e9:g}')
+    parser.add_argument('--scan-batches', choices=[PER_SECTOR, PER_SCAN],
+                        help='按CAT034的正北、扇区消息每个扇区或每圈一批归入航迹，扇区消息的时间推进航迹超时（单进程、不缓存时有效）')
+    args = parser.parse_args()
+    if args.quarantine and args.workers != 1:
+        parser.error('--quarantine只支持单进程（-j 1）')
+    if args.scan_batches and (args.workers != 1 or args.cache):
+        parser.error('--scan-batches只支持单进程（-j 1）且不能与--cache同时使用')
+
+    files = [os.path.join(FILE_DIR_PATH, i) for i in os.listdir(FILE_DIR_PATH) if not i.endswith(('.xlsx', '.csv', '.parquet'))]
+    if args.quarantine:
+        # 旁路文件在数据目录中时不作为输入
+        files = [i for i in files if os.path.abspath(i) != os.path.abspath(args.quarantine)]
     
     files.sort()
-
-    track_map: Dict[int, PlaneTrackData] = {}
-
-    # data_list_048: List[SecondaryRadar048] = []
-    data_tmp: List[SecondaryRadar048] = []
-    for file_path in files:
-        print(f"开始解析{file_path} -- {datetime.now().time()}")
-        data_tmp.clear()
-        track_map.clear()
-
-        # 读取
-        for data in read_data(file_path):
-            cat = SecondaryRadar.get_cat(data)
-            if cat == 48:
-                a = SecondaryRadar048(data)
-                data_tmp.append(a)
-        # 归类
-        for data in data_tmp:
-            if hasattr(data, 'flight_num') and hasattr(data, 'ICAO'):
-                plane_track_data = track_map.get(data.flight_num, None)
-                if plane_track_data == None:
-                        track_map[data.flight_num] = plane_track_data = PlaneTrackData(data.ICAO, data.flight_num)
-                plane_track_data.add_data(data)
-
-        # data_list_048.extend(data_tmp)
-        
-        # 筛选掉最低高度超过3000m的
-        track_keys = [i for i in track_map.keys()]
-        for key in track_keys:
-            if track_map[key].min_FL() > 2000:
-                track_map.pop(key)
-
-        data_list_take = []
-        data_list_land = []
-        for data in track_map.values():
-            if data.is_land():
-                data_list_land.extend(data.track_data)
-            else:
-                data_list_take.extend(data.track_data)
-        
-        file_name_take = os.path.splitext(file_path)[0] + '-take.xlsx'
-        file_name_land = os.path.splitext(file_path)[0] + '-land.xlsx'
-        SecondaryRadar048.load_excel(data_list_take, file_name_take)
-        SecondaryRadar048.load_excel(data_list_land, file_name_land)
+    timeout = int(args.track_timeout * 1e9)
+    if args.profile_items:
+        enable_item_profiler(args.profile_items)
+    reporter = Reporter(args.report_interval).start()
+    if args.sensors:
+        set_sensors(load_sensors(args.sensors))
+    sensors = get_sensors()
+    dedup_window = int(args.dedup * 1e9) if args.dedup else 0
+    # 去重后的结果与未去重的不同，分开缓存
+    cache = DecodeCache(args.cache, int(args.cache_size * 1024**2), args.cache_key,
+                        options=f'dedup={dedup_window}' if dedup_window else '') if args.cache else None
+
+    if args.workers == 1:
+        quarantine = Quarantine(args.quarantine) if args.quarantine else None
+        # 每个文件单独去重
+        if args.scan_batches:
+            decode = lambda path: scan_file(path, args.scan_batches, quarantine, sensors,
+                                            Deduplicator(dedup_window) if dedup_window else None)
+        else:
+            decode = lambda path: stream_file(path, quarantine=quarantine, sensors=sensors,
+                                              dedup=Deduplicator(dedup_window) if dedup_window else None)
+        try:
+            for file_path in files:
+                print(f"开始解析{file_path} -- {datetime.now().time()}")
+                batches = cache.stream(file_path, decode) if cache else decode(file_path)
+                export_file(file_path, batches, args.format, timeout)
+        finally:
+            if quarantine is not None:
+                quarantine.close()
+                print(f"{quarantine.count}条无法解析的数据已写入{quarantine.path}")
+    else:
+        from parallel import decode_files
+        workers = args.workers or os.cpu_count()
+        if cache:
+            # 命中缓存的文件直接导出，只并行解码未命中的
+            keys = {file_path: cache.key(file_path) for file_path in files}
+            misses = []
+            for file_path in files:
+                data_tmp = cache.get(file_path, keys[file_path])
+                if data_tmp is None:
+                    misses.append(file_path)
+                else:
+                    print(f"导出{file_path}（缓存） -- {datetime.now().time()}")
+                    export_file(file_path, data_tmp, args.format, timeout)
+            files = misses
+        print(f"并行解析{len(files)}个文件，{workers}个进程 -- {datetime.now().time()}")
+        # 解码在子进程中进行，只记录整体耗时
+        for file_path, data_tmp in timed_batches(decode_files(files, workers, args.chunk_size * 1024 * 1024,
+                                                              dedup_window)):
+            if cache:
+                data_tmp = np.concatenate(list(cache.put(file_path, [data_tmp], keys[file_path])))
+            print(f"导出{file_path} -- {datetime.now().time()}")
+            export_file(file_path, data_tmp, args.format, timeout)
+    reporter.stop()
+    reporter.report()
+    if args.metrics:
+        METRICS.dump(args.metrics)
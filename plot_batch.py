@@ -0,0 +1,615 @@
+from typing import Dict, Generator, Iterable, List, Optional, Tuple, TYPE_CHECKING, Union
+import os
+import struct
+import time
+
+import numpy as np
+
+from framing import (BLOCK_HEADER, Deduplicator, frame_start, HDLC_LEN, MALFORMED_FRN, MALFORMED_LINE,
+                     MALFORMED_OVERRUN, MalformedRecord, MIN_BLOCK, Quarantine, split_blocks)
+from uap import CompiledUAP, load_UAP, PLAN_CACHE_SIZE, Step
+from metrics import count_fspecs, get_profiler, ItemProfiler, METRICS
+from timestamps import resolve_tod, utc_str_to_ns
+
+if TYPE_CHECKING:
+    from scan import ScanBatcher
+    from sensors import SensorRegistry
+
+CAT048UAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CAT048UAP.txt')
+CAT034UAP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CAT034UAP.txt')
+
+# 解码逻辑的版本，解码结果变化时递增，使已缓存的结果失效
+DECODER_VERSION = 1
+
+# 有效位，标记某条数据包含哪些字段
+VALID_SOURCE = 1 << 0           # SAC/SIC
+VALID_TIME = 1 << 1             # Time-of-Day
+VALID_POLAR = 1 << 2            # 极坐标
+VALID_FL = 1 << 3               # 飞行高度
+VALID_ICAO = 1 << 4             # ICAO码
+VALID_CALLSIGN = 1 << 5         # 航班号
+VALID_TRACK_NUMBER = 1 << 6     # 航迹号
+VALID_CARTESIAN = 1 << 7        # 直角坐标
+VALID_VELOCITY = 1 << 8         # 速度与航向
+VALID_SECTOR = 1 << 9           # 扇区号（CAT034）
+VALID_ROTATION = 1 << 10        # 天线旋转周期（CAT034）
+
+# CAT048点迹的列式结构，缺失的浮点字段为NaN，整数字段为0，以valid为准
+PLOT_DTYPE = np.dtype([
+    ('recv_time', 'i8'),        # 接收时间，纪元以来的纳秒
+    ('SAC', 'u1'),              # 区域码
+    ('SIC', 'u1'),              # 雷达的编码
+    ('valid', 'u2'),            # 有效位
+    ('tod', 'u4'),              # Time-of-Day 原始值，单位1/128 s
+    ('plot_time', 'i8'),        # 数据包产生的时间，结合接收时间还原的纳秒时间戳
+    ('rho', 'f8'),              # 极径 m
+    ('theta', 'f8'),            # 极角 °
+    ('FL', 'f8'),               # 飞行高度 m
+    ('ICAO', 'u4'),             # 飞机的ICAO码
+    ('callsign', 'S8'),         # 航班号
+    ('track_number', 'u2'),     # 航迹号
+    ('X', 'f8'),                # X坐标 m
+    ('Y', 'f8'),                # Y坐标 m
+    ('ground_speed', 'f8'),     # 极坐标的轨道速度 m/s
+    ('heading', 'f8'),          # 速度的方向 °
+])
+
+_FLOAT_FIELDS = [name for name in PLOT_DTYPE.names if PLOT_DTYPE[name].kind == 'f']
+
+
+def empty_batch(size: int = 0) -> np.ndarray:
+    """创建空的点迹数组，浮点字段填充NaN"""
+    result = np.zeros(size, dtype=PLOT_DTYPE)
+    for name in _FLOAT_FIELDS:
+        result[name] = np.nan
+    return result
+
+
+def plot_times(batch: np.ndarray) -> np.ndarray:
+    """点迹的时间，有Time-of-Day时取数据包产生的时间，否则取接收时间"""
+    return np.where((batch['valid'] & VALID_TIME) != 0, batch['plot_time'], batch['recv_time'])
+
+
+# 6位字符编码 -> ASCII，空格等其它字符丢弃（为0）
+IA5_TABLE = np.zeros(64, dtype=np.uint8)
+IA5_TABLE[1:27] = np.arange(ord('A'), ord('Z') + 1)
+IA5_TABLE[48:58] = np.arange(ord('0'), ord('9') + 1)
+
+
+def decode_callsigns(raw: np.ndarray) -> np.ndarray:
+    """批量解码航班号，raw 形状(n, 6)的原始字节，返回S8数组"""
+    value = np.zeros(len(raw), dtype=np.uint64)
+    for i in range(6):
+        value = (value << np.uint64(8)) | raw[:, i].astype(np.uint64)
+    shifts = np.arange(42, -1, -6, dtype=np.uint64)
+    chars = IA5_TABLE[((value[:, None] >> shifts) & np.uint64(0x3f)).astype(np.intp)]
+    # 丢弃的字符移到末尾
+    chars = np.take_along_axis(chars, np.argsort(chars == 0, axis=1, kind='stable'), axis=1)
+    return np.ascontiguousarray(chars).view('S8').ravel()
+
+
+# CAT034 I034/000 消息类型
+NORTH_MARKER = 1            # 天线经过正北
+SECTOR_CROSSING = 2         # 天线经过扇区边界
+
+
+class ServiceMessage:
+    """一条CAT034服务消息，逐条解码时复用"""
+    __slots__ = ('SAC', 'SIC', 'message_type', 'sector', 'tod', 'rotation_period', 'flags')
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.SAC = self.SIC = 0
+        self.message_type = 0
+        self.sector = 0.0               # 扇区的方位 °
+        self.tod = 0                    # Time-of-Day 原始值，单位1/128 s
+        self.rotation_period = 0.0      # 天线旋转周期 s
+        self.flags = 0                  # 有效位
+
+
+def _fill_I034_010(message: ServiceMessage, buffer: memoryview, offset: int) -> None:
+    """Data Source Identifier"""
+    message.SAC = buffer[offset]
+    message.SIC = buffer[offset + 1]
+    message.flags |= VALID_SOURCE
+
+
+def _fill_I034_000(message: ServiceMessage, buffer: memoryview, offset: int) -> None:
+    """Message Type"""
+    message.message_type = buffer[offset]
+
+
+def _fill_I034_030(message: ServiceMessage, buffer: memoryview, offset: int) -> None:
+    """Time-of-Day"""
+    message.tod = int.from_bytes(buffer[offset:offset + 3], 'big')
+    message.flags |= VALID_TIME
+
+
+def _fill_I034_020(message: ServiceMessage, buffer: memoryview, offset: int) -> None:
+    """Sector Number"""
+    message.sector = buffer[offset] * 360 / 256
+    message.flags |= VALID_SECTOR
+
+
+def _fill_I034_041(message: ServiceMessage, buffer: memoryview, offset: int) -> None:
+    """Antenna Rotation Period"""
+    message.rotation_period = ((buffer[offset] << 8) | buffer[offset + 1]) / 128
+    message.flags |= VALID_ROTATION
+
+
+# 解码的CAT034数据项
+CAT034_FILLERS = {
+    'I034/010': _fill_I034_010,
+    'I034/000': _fill_I034_000,
+    'I034/030': _fill_I034_030,
+    'I034/020': _fill_I034_020,
+    'I034/041': _fill_I034_041,
+}
+
+CAT034_BATCH_UAP = CompiledUAP(34, load_UAP(CAT034UAP_PATH), CAT034_FILLERS)
+
+
+def _u16(raw: np.ndarray, i: int) -> np.ndarray:
+    """原始字节中第i、i+1字节组成的无符号16位整数"""
+    return (raw[:, i].astype(np.int64) << 8) | raw[:, i + 1]
+
+
+def _u24(raw: np.ndarray) -> np.ndarray:
+    return (raw[:, 0].astype(np.int64) << 16) | (raw[:, 1].astype(np.int64) << 8) | raw[:, 2]
+
+
+def _column_I048_010(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Data Source Identifier"""
+    data['SAC'][rows] = raw[:, 0]
+    data['SIC'][rows] = raw[:, 1]
+    return np.full(len(rows), VALID_SOURCE)
+
+
+def _column_I048_140(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Time-of-Day"""
+    data['tod'][rows] = _u24(raw)
+    return np.full(len(rows), VALID_TIME)
+
+
+def _column_I048_040(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Measured Position in Slant Polar Coordinates"""
+    data['rho'][rows] = _u16(raw, 0) / 256 * 1852
+    data['theta'][rows] = _u16(raw, 2) * 360 / (1<<16)
+    return np.full(len(rows), VALID_POLAR)
+
+
+def _column_I048_090(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Flight Level in Binary Representation"""
+    tap = _u16(raw, 0)
+    ok = tap < (1<<14)
+    data['FL'][rows[ok]] = tap[ok] / 4 * 30.48
+    return np.where(ok, VALID_FL, 0)
+
+
+def _column_I048_220(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Aircraft Address"""
+    data['ICAO'][rows] = _u24(raw)
+    return np.full(len(rows), VALID_ICAO)
+
+
+def _column_I048_240(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Aircraft Identification"""
+    data['callsign'][rows] = decode_callsigns(raw)
+    return np.full(len(rows), VALID_CALLSIGN)
+
+
+def _column_I048_161(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Track Number"""
+    data['track_number'][rows] = _u16(raw, 0)
+    return np.full(len(rows), VALID_TRACK_NUMBER)
+
+
+def _column_I048_042(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Calculated Position in Cartesian Coordinates"""
+    data['X'][rows] = _u16(raw, 0) / 128 * 1852
+    data['Y'][rows] = _u16(raw, 2) / 128 * 1852
+    return np.full(len(rows), VALID_CARTESIAN)
+
+
+def _column_I048_200(data: np.ndarray, rows: np.ndarray, raw: np.ndarray) -> np.ndarray:
+    """Calculated Track Velocity in Polar Representation"""
+    data['ground_speed'][rows] = _u16(raw, 0) * 1852 / (1<<14)
+    data['heading'][rows] = _u16(raw, 2) * 360 / (1<<16)
+    return np.full(len(rows), VALID_VELOCITY)
+
+
+# 按列批量解码的CAT048数据项: 数据项 -> (字节数, 转换函数)，转换函数返回每行的有效位
+CAT048_COLUMNS = {
+    'I048/010': (2, _column_I048_010),
+    'I048/140': (3, _column_I048_140),
+    'I048/040': (4, _column_I048_040),
+    'I048/090': (2, _column_I048_090),
+    'I048/220': (3, _column_I048_220),
+    'I048/240': (6, _column_I048_240),
+    'I048/161': (2, _column_I048_161),
+    'I048/042': (4, _column_I048_042),
+    'I048/200': (4, _column_I048_200),
+}
+
+# 各列由哪个数据项解码，recv_time总是有，valid随解码的数据项置位
+COLUMN_ITEMS = {
+    'SAC': 'I048/010',
+    'SIC': 'I048/010',
+    'tod': 'I048/140',
+    'plot_time': 'I048/140',
+    'rho': 'I048/040',
+    'theta': 'I048/040',
+    'FL': 'I048/090',
+    'ICAO': 'I048/220',
+    'callsign': 'I048/240',
+    'track_number': 'I048/161',
+    'X': 'I048/042',
+    'Y': 'I048/042',
+    'ground_speed': 'I048/200',
+    'heading': 'I048/200',
+}
+
+
+# CAT048的UAP表，解码函数为按列转换的CAT048_COLUMNS
+CAT048_BATCH_UAP = CompiledUAP(48, load_UAP(CAT048UAP_PATH), CAT048_COLUMNS)
+
+# 只有一条记录时的行号
+_FIRST_ROW = np.zeros(1, dtype=np.intp)
+
+
+def decode_record(buffer: bytes, positions: Dict[str, int]) -> np.ndarray:
+    """按列解码一条记录中位于positions的CAT048数据项，返回只有一行的列式数组，用于逐条解码的对象"""
+    result = empty_batch(1)
+    valid = 0
+    for item, offset in positions.items():
+        width, convert = CAT048_COLUMNS[item]
+        raw = np.frombuffer(buffer, np.uint8, width, offset).reshape(1, width)
+        valid |= int(convert(result, _FIRST_ROW, raw)[0])
+    result['valid'] = valid
+    return result
+
+
+def resolve_plot_time(data: np.ndarray) -> None:
+    """批量还原数据包产生的时间"""
+    mask = (data['valid'] & VALID_TIME) != 0
+    data['plot_time'] = np.where(mask, resolve_tod(data['recv_time'], data['tod'].astype(np.int64)), 0)
+
+
+class PlotBatchBuilder:
+    """
+    批量解码CAT048数据: 逐条只按FSPEC定位各数据项，交出数据时按列向量化转换
+    相同FSPEC的定位步骤只编排一次，定长数据项合并跳过，只有变长数据项需要计算长度
+    无法解析的记录不加入、计数并可写入旁路文件，之后从下一个数据块继续
+    services 指定时同时解码CAT034，逐条交给它的observe(接收时间, 消息)，如传感器登记表或按扫描分批
+    dedup 丢弃冗余线路送来的相同帧
+    columns 只解码这些列，为None时解码全部列
+    """
+    def __init__(self, uap: Optional[CompiledUAP] = None, profiler: Optional[ItemProfiler] = None,
+                 quarantine: Optional[Quarantine] = None,
+                 services: Union['SensorRegistry', 'ScanBatcher', None] = None,
+                 dedup: Optional[Deduplicator] = None, columns: Optional[Iterable[str]] = None) -> None:
+        self.uap = uap or CAT048_BATCH_UAP
+        if columns is None:
+            items = set(self.uap.decoders)
+        else:
+            items = set()
+            for column in columns:
+                if column in ('recv_time', 'valid'):
+                    continue
+                if column not in COLUMN_ITEMS:
+                    raise ValueError(f'未知的列: {column}')
+                items.add(COLUMN_ITEMS[column])
+        self.items = tuple(sorted(items))               # 需要解码的数据项
+        self.profiler = profiler or get_profiler()      # 数据项解码耗时的采样
+        self.quarantine = quarantine                    # 无法解析的数据的旁路文件
+        self.categories: Dict[int, int] = {}            # 其它CAT -> 数据块数，交出数据时计入指标
+        self.fspecs: Dict[bytes, int] = {}              # FSPEC -> 记录数
+        self.malformed: Dict[str, int] = {}             # 出错的原因 -> 次数
+        self.rejected = 0                               # 累计无法解析的次数
+        self.services = services
+        self.dedup = dedup
+        self.duplicates = 0                             # 重复的帧数，交出数据时计入指标
+        self.__plans: Dict[bytes, Tuple[Step, ...]] = {}    # FSPEC -> 定位步骤
+        self.__message = ServiceMessage()
+        self.__quarantined: Optional[bytes] = None      # 最近写入旁路文件的数据，同一帧只写一次
+        self.__reset()
+
+    def __reset(self) -> None:
+        self.__buffers: List[bytes] = []
+        self.__last: Optional[bytes] = None     # 最近保存的帧
+        self.__size = 0                         # 已保存的字节数
+        self.__recv_times: List[int] = []
+        # 数据项 -> 每条记录中该数据项在所有数据拼接后的位置，没有为-1
+        self.__positions: Dict[str, List[int]] = {item: [] for item in self.items}
+
+    def reject(self, reason: str, recv_time: int = 0, buffer: Optional[bytes] = None,
+               line: Optional[str] = None) -> None:
+        """记录一次无法解析的数据，有旁路文件时写入原始的行或帧"""
+        self.malformed[reason] = self.malformed.get(reason, 0) + 1
+        self.rejected += 1
+        if self.quarantine is None:
+            return
+        if line is not None:
+            self.quarantine.write_line(line, reason)
+        elif buffer is not None and buffer is not self.__quarantined:
+            self.quarantine.write(recv_time, buffer, reason)
+            self.__quarantined = buffer
+
+    def append_line(self, line: str) -> int:
+        """
+        解码一行 YYYYMMDD:秒 16进制串 格式的数据
+        :return 加入的CAT048记录数
+        """
+        soc = line.split()
+        if not soc:
+            return 0
+        try:
+            recv_time = utc_str_to_ns(soc[0])
+            buffer = bytes.fromhex(soc[1])
+        except (ValueError, IndexError):
+            self.reject(MALFORMED_LINE, line=line)
+            return 0
+        return self.append_frame(recv_time, buffer)
+
+    def append_frame(self, recv_time: int, buffer: bytes, start: int = HDLC_LEN) -> int:
+        """
+        解码一帧数据中的所有数据块，默认带HDLC地址、控制字段
+        LEN错误的数据块跳到下一个有效的CAT/LEN边界继续
+        :return 加入的CAT048记录数
+        """
+        if not isinstance(buffer, bytes):
+            buffer = bytes(buffer)      # 交出数据时才解码，不引用调用方的缓冲区
+        if self.dedup is not None and self.dedup.seen(recv_time, memoryview(buffer)[start:]):
+            self.duplicates += 1
+            return 0
+        size = len(buffer)
+        if start + MIN_BLOCK <= size and start + ((buffer[start + 1] << 8) | buffer[start + 2]) == size:
+            # 常见情况: 一帧恰好是一个数据块
+            CAT = buffer[start]
+            if CAT == 48:
+                return self.append_block(recv_time, buffer, start, size)
+            self.categories[CAT] = self.categories.get(CAT, 0) + 1
+            if CAT == 34 and self.services is not None:
+                self.append_service_block(recv_time, buffer, start, size)
+            return 0
+        count = 0
+        for block_start, block_end, reason in split_blocks(memoryview(buffer), start):
+            if reason is not None:
+                self.reject(reason, recv_time, buffer)
+                continue
+            CAT = buffer[block_start]
+            if CAT == 48:
+                count += self.append_block(recv_time, buffer, block_start, block_end)
+                continue
+            self.categories[CAT] = self.categories.get(CAT, 0) + 1
+            if CAT == 34 and self.services is not None:
+                self.append_service_block(recv_time, buffer, block_start, block_end)
+        return count
+
+    def append_service_block(self, recv_time: int, buffer: bytes, start: int, end: int) -> None:
+        """解码[start, end)范围内一个CAT034数据块，逐条交给services"""
+        message = self.__message
+        offset = start + BLOCK_HEADER
+        try:
+            while offset < end:
+                message.clear()
+                fspec_offset = offset
+                while buffer[offset] & 1:
+                    offset += 1
+                offset = CAT034_BATCH_UAP.decode(message, buffer, fspec_offset, offset + 1)
+                if offset > end:
+                    raise MalformedRecord(MALFORMED_OVERRUN)
+                self.services.observe(recv_time, message)
+        except (IndexError, struct.error):
+            self.reject(MALFORMED_OVERRUN, recv_time, buffer)
+        except MalformedRecord as e:
+            self.reject(e.reason, recv_time, buffer)
+        except ValueError:
+            self.reject(MALFORMED_FRN, recv_time, buffer)
+
+    def append_block(self, recv_time: int, buffer: bytes, start: int, end: int) -> int:
+        """
+        解码[start, end)范围内一个CAT048数据块中的所有记录，同一帧的各数据块应传入同一个buffer
+        某条记录无法解析时，数据块中之后的记录无法定位，跳到数据块末尾
+        :return 加入的记录数
+        """
+        offset = start + BLOCK_HEADER
+        count = 0
+        try:
+            while offset < end:
+                offset = self.append(recv_time, buffer, offset, end)
+                count += 1
+        except MalformedRecord as e:
+            self.reject(e.reason, recv_time, buffer)
+        return count
+
+    def __keep(self, buffer: bytes) -> int:
+        """保存一帧数据用于交出时解码，同一帧只保存一次，返回该帧在所有数据拼接后的起始位置"""
+        if buffer is not self.__last:
+            self.__last = buffer
+            self.__buffers.append(buffer)
+            self.__size += len(buffer)
+        return self.__size - len(buffer)
+
+    def append(self, recv_time: int, buffer: bytes, fspec_offset: int = HDLC_LEN + BLOCK_HEADER,
+               end: Optional[int] = None) -> int:
+        """
+        定位一条CAT048记录中所需的数据项，默认为带HDLC地址、控制字段的整帧数据
+        fspec_offset 记录的FSPEC起始位置，end 记录最远的结束位置（数据块的末尾），默认为数据的末尾
+        记录超出end时抛出MalformedRecord，不加入
+        :return 记录的结束位置
+        """
+        try:
+            offset = fspec_offset
+            while buffer[offset] & 1:
+                offset += 1
+            offset += 1
+            fspec = bytes(buffer[fspec_offset:offset])
+            steps = self.__plans.get(fspec)
+            if steps is None:
+                # 需要记录的长度以定位同一数据块中的下一条记录，处理到记录末尾，只记下所需数据项的位置
+                if len(self.__plans) >= PLAN_CACHE_SIZE:
+                    self.__plans.clear()
+                steps = self.__plans[fspec] = self.uap.plan(fspec, self.items, whole=True)
+            found = {}
+            for hits, skip, sizer in steps:
+                for item, delta in hits:
+                    found[item] = offset + delta
+                offset += skip
+                if sizer is not None:
+                    offset += sizer(buffer, offset)
+        except (IndexError, struct.error):
+            reason = MALFORMED_OVERRUN
+        except ValueError:
+            reason = MALFORMED_FRN
+        else:
+            if offset <= (len(buffer) if end is None else end):
+                self.fspecs[fspec] = self.fspecs.get(fspec, 0) + 1
+                base = self.__keep(buffer)
+                for item, positions in self.__positions.items():
+                    position = found.get(item, -1)
+                    positions.append(position if position < 0 else position + base)
+                self.__recv_times.append(recv_time)
+                return offset
+            reason = MALFORMED_OVERRUN
+        raise MalformedRecord(reason, f'CAT048记录无法解析: {reason}')
+
+    def __len__(self) -> int:
+        return len(self.__recv_times)
+
+    def __publish(self) -> None:
+        """把本地累计的计数计入指标"""
+        # CAT048的记录数即各FSPEC的记录数之和
+        self.categories[48] = self.categories.get(48, 0) + sum(self.fspecs.values())
+        for CAT, count in self.categories.items():
+            METRICS.inc('records_total', count, cat=CAT)
+        for reason, count in self.malformed.items():
+            METRICS.inc('malformed_total', count, reason=reason)
+        if self.duplicates:
+            METRICS.inc('duplicates_total', self.duplicates)
+            self.duplicates = 0
+        count_fspecs(self.fspecs, self.uap)
+        self.categories.clear()
+        self.fspecs.clear()
+        self.malformed.clear()
+
+    def flush(self) -> np.ndarray:
+        """按列转换已加入的记录，返回列式数组并清空"""
+        result = empty_batch(len(self.__recv_times))
+        result['recv_time'] = self.__recv_times
+        data = np.frombuffer(b''.join(self.__buffers), dtype=np.uint8)
+        valid = np.zeros(len(result), dtype=np.uint16)
+        costs: List[Tuple[str, int]] = []
+        clock = time.perf_counter_ns
+        for item, positions in self.__positions.items():
+            offsets = np.array(positions, dtype=np.int64)
+            rows = np.flatnonzero(offsets >= 0)
+            if len(rows) == 0:
+                continue
+            start = clock()
+            width, convert = CAT048_COLUMNS[item]
+            raw = data[offsets[rows, None] + np.arange(width)]
+            valid[rows] |= convert(result, rows, raw).astype(np.uint16)
+            costs.append((item, (clock() - start) // len(rows)))
+        result['valid'] = valid
+        resolve_plot_time(result)
+        if self.profiler is not None and costs:
+            self.profiler.record(48, costs, len(result))
+        self.__publish()
+        self.__reset()
+        return result
+
+    def finish(self) -> np.ndarray:
+        """返回已加入的数据"""
+        return self.flush()
+
+
+class ColumnProjector(PlotBatchBuilder):
+    """
+    只解码指定列的批量解码，用于只需少数字段的筛选，其余列保持缺失（valid中不置位）
+    hdlc 帧是否带HDLC地址、控制字段，为None时与实时接收一样按frame_start自动判断
+    """
+    def __init__(self, columns: Iterable[str], uap: Optional[CompiledUAP] = None,
+                 hdlc: Optional[bool] = None) -> None:
+        super().__init__(uap, columns=columns)
+        self.hdlc = hdlc
+
+    def append_frame(self, recv_time: int, buffer: bytes, start: Optional[int] = None) -> int:
+        """
+        定位一帧数据中所有数据块的CAT048记录，LEN错误的数据块跳到下一个有效的CAT/LEN边界继续
+        :return 加入的记录数
+        """
+        if start is None:
+            start = frame_start(memoryview(buffer), self.hdlc)
+        return super().append_frame(recv_time, buffer, start)
+
+
+def decode_lines(lines: Iterable[str], quarantine: Optional[Quarantine] = None,
+                 sensors: Optional['SensorRegistry'] = None, dedup: Optional[Deduplicator] = None) -> np.ndarray:
+    """把若干行原始数据中的CAT048解码为列式数组"""
+    builder = PlotBatchBuilder(quarantine=quarantine, services=sensors, dedup=dedup)
+    for line in lines:
+        builder.append_line(line)
+    return builder.finish()
+
+
+def decode_frames(frames: Iterable[Tuple[int, memoryview]], quarantine: Optional[Quarantine] = None,
+                  sensors: Optional['SensorRegistry'] = None, dedup: Optional[Deduplicator] = None) -> np.ndarray:
+    """把若干帧（接收时间, 带HDLC字段的原始数据）中的CAT048解码为列式数组"""
+    builder = PlotBatchBuilder(quarantine=quarantine, services=sensors, dedup=dedup)
+    for recv_time, buffer in frames:
+        builder.append_frame(recv_time, buffer)
+    return builder.finish()
+
+
+def stream_lines(lines: Iterable[str], batch_size: int = 4096, quarantine: Optional[Quarantine] = None,
+                 sensors: Optional['SensorRegistry'] = None,
+                 dedup: Optional[Deduplicator] = None) -> Generator[np.ndarray, None, None]:
+    """逐批解码若干行原始数据中的CAT048，每批约batch_size条"""
+    builder = PlotBatchBuilder(quarantine=quarantine, services=sensors, dedup=dedup)
+    for line in lines:
+        if builder.append_line(line) and len(builder) >= batch_size:
+            yield builder.flush()
+    if len(builder):
+        yield builder.flush()
+
+
+def stream_frames(frames: Iterable[Tuple[int, memoryview]], batch_size: int = 4096,
+                  quarantine: Optional[Quarantine] = None, sensors: Optional['SensorRegistry'] = None,
+                  dedup: Optional[Deduplicator] = None) -> Generator[np.ndarray, None, None]:
+    """逐批解码若干帧中的CAT048，每批约batch_size条"""
+    builder = PlotBatchBuilder(quarantine=quarantine, services=sensors, dedup=dedup)
+    for recv_time, buffer in frames:
+        if builder.append_frame(recv_time, buffer) and len(builder) >= batch_size:
+            yield builder.flush()
+    if len(builder):
+        yield builder.flush()
+
+
+def project_lines(lines: Iterable[str], columns: Iterable[str]) -> np.ndarray:
+    """只解码若干行原始数据中CAT048的指定列，其余列保持缺失（valid中不置位）"""
+    projector = ColumnProjector(columns)
+    for line in lines:
+        projector.append_line(line)
+    return projector.flush()
+
+
+def project_frames(frames: Iterable[Tuple[int, memoryview]], columns: Iterable[str]) -> np.ndarray:
+    """只解码若干帧中CAT048的指定列"""
+    projector = ColumnProjector(columns)
+    for recv_time, buffer in frames:
+        projector.append_frame(recv_time, buffer)
+    return projector.flush()
+
+
+def stream_projected(lines: Iterable[str], columns: Iterable[str],
+                     batch_size: int = 4096) -> Generator[np.ndarray, None, None]:
+    """逐批只解码若干行原始数据中CAT048的指定列，每批约batch_size条"""
+    projector = ColumnProjector(columns)
+    for line in lines:
+        if projector.append_line(line) and len(projector) >= batch_size:
+            yield projector.flush()
+    if len(projector):
+        yield projector.flush()
@@ -0,0 +1,110 @@
+from typing import Dict, Optional, Tuple, Union
+import math
+
+import numpy as np
+
+# WGS-84 椭球参数
+WGS84_A = 6378137.0                 # 长半轴 m
+WGS84_F = 1 / 298.257223563         # 扁率
+WGS84_E2 = WGS84_F * (2 - WGS84_F)  # 第一偏心率的平方
+
+ArrayLike = Union[float, np.ndarray]
+
+
+def gaussian_radius(latitude: float) -> float:
+    """WGS-84椭球在某纬度处的高斯平均曲率半径 m"""
+    sin_lat = math.sin(math.radians(latitude))
+    w2 = 1 - WGS84_E2 * sin_lat * sin_lat
+    M = WGS84_A * (1 - WGS84_E2) / (w2 ** 1.5)     # 子午圈曲率半径
+    N = WGS84_A / math.sqrt(w2)                     # 卯酉圈曲率半径
+    return math.sqrt(M * N)
+
+
+class RadarProjection:
+    """
+    雷达极坐标（斜距、方位角、高度）到经纬度的转换
+    以雷达站所在纬度的高斯曲率半径作局部球面近似，雷达站的三角函数只计算一次
+    """
+    def __init__(self, longitude: float, latitude: float, height: float = 0.0) -> None:
+        self.longitude = longitude      # 雷达经度 °
+        self.latitude = latitude        # 雷达纬度 °
+        self.height = height            # 雷达天线高度 m
+        self.radius = gaussian_radius(latitude)
+        self.lon_rad = math.radians(longitude)
+        self.sin_lat = math.sin(math.radians(latitude))
+        self.cos_lat = math.cos(math.radians(latitude))
+        self.radar_r = self.radius + height     # 地心到雷达的距离
+
+    def ground_angle(self, rho: ArrayLike, FL: ArrayLike) -> np.ndarray:
+        """由斜距与目标高度计算地心角（弧度），高度缺失时按雷达高度"""
+        rho = np.asarray(rho, dtype=np.float64)
+        FL = np.asarray(FL, dtype=np.float64)
+        target_r = self.radius + np.where(np.isnan(FL), self.height, FL)
+        cos_c = (self.radar_r ** 2 + target_r ** 2 - rho ** 2) / (2 * self.radar_r * target_r)
+        return np.arccos(np.clip(cos_c, -1.0, 1.0))
+
+    def to_geodetic(self, rho: ArrayLike, theta: ArrayLike,
+                    FL: Optional[ArrayLike] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量转换
+        rho 斜距 m，theta 方位角 °（正北顺时针），FL 目标高度 m
+        :return (经度数组, 纬度数组) °
+        """
+        if FL is None:
+            FL = np.full(np.shape(rho), np.nan)
+        c = self.ground_angle(rho, FL)
+        az = np.radians(np.asarray(theta, dtype=np.float64))
+        sin_c, cos_c = np.sin(c), np.cos(c)
+        sin_lat2 = self.sin_lat * cos_c + self.cos_lat * sin_c * np.cos(az)
+        lat2 = np.arcsin(np.clip(sin_lat2, -1.0, 1.0))
+        lon2 = self.lon_rad + np.arctan2(np.sin(az) * sin_c * self.cos_lat,
+                                         cos_c - self.sin_lat * sin_lat2)
+        return np.degrees(lon2), np.degrees(lat2)
+
+    def to_enu(self, rho: ArrayLike, theta: ArrayLike,
+               FL: Optional[ArrayLike] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量转换到以雷达为中心的局部平面（方位等距），与geodetic_to_enu一致
+        :return (东向数组, 北向数组) m
+        """
+        if FL is None:
+            FL = np.full(np.shape(rho), np.nan)
+        d = self.radius * self.ground_angle(rho, FL)
+        az = np.radians(np.asarray(theta, dtype=np.float64))
+        return d * np.sin(az), d * np.cos(az)
+
+    def geodetic_to_enu(self, longitude: ArrayLike, latitude: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+        """经纬度转换到以雷达为中心的局部平面，返回(东向, 北向) m"""
+        lat = np.radians(np.asarray(latitude, dtype=np.float64))
+        dlon = np.radians(np.asarray(longitude, dtype=np.float64)) - self.lon_rad
+        sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+        cos_c = self.sin_lat * sin_lat + self.cos_lat * cos_lat * np.cos(dlon)
+        c = np.arccos(np.clip(cos_c, -1.0, 1.0))
+        az = np.arctan2(np.sin(dlon) * cos_lat, self.cos_lat * sin_lat - self.sin_lat * cos_lat * np.cos(dlon))
+        d = self.radius * c
+        return d * np.sin(az), d * np.cos(az)
+
+    def to_coor(self, rho: float, theta: float, FL: Optional[float] = None) -> Tuple[float, float]:
+        """单点转换，与to_geodetic结果一致，返回(经度, 纬度) °"""
+        target_r = self.radius + (self.height if FL is None or math.isnan(FL) else FL)
+        cos_c = (self.radar_r ** 2 + target_r ** 2 - rho ** 2) / (2 * self.radar_r * target_r)
+        c = math.acos(min(1.0, max(-1.0, cos_c)))
+        az = math.radians(theta)
+        sin_c, cos_c = math.sin(c), math.cos(c)
+        sin_lat2 = self.sin_lat * cos_c + self.cos_lat * sin_c * math.cos(az)
+        lat2 = math.asin(min(1.0, max(-1.0, sin_lat2)))
+        lon2 = self.lon_rad + math.atan2(math.sin(az) * sin_c * self.cos_lat,
+                                         cos_c - self.sin_lat * sin_lat2)
+        return math.degrees(lon2), math.degrees(lat2)
+
+
+_projections: Dict[Tuple[float, float, float], RadarProjection] = {}
+
+
+def get_projection(longitude: float, latitude: float, height: float = 0.0) -> RadarProjection:
+    """获取某个雷达站的转换对象，每个雷达站只创建一次"""
+    key = (longitude, latitude, height)
+    result = _projections.get(key)
+    if result is None:
+        result = _projections[key] = RadarProjection(longitude, latitude, height)
+    return result
@@ -0,0 +1,213 @@
+from typing import BinaryIO, Generator, List, Optional, Tuple
+import argparse
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from compressed import open_text
+from framing import MALFORMED_LINE, Quarantine
+from metrics import METRICS
+from timestamps import utc_str_to_ns
+
+# 二进制记录文件
+#   文件头: 魔数(8) 版本(u16) 保留(u16) 索引间隔(u32)
+#   数据帧: 接收时间(i64 纳秒) 长度(u32) 原始数据(含HDLC地址、控制字段)
+#   索引块: 每隔N帧记录一次 (接收时间 i64, 帧起始位置 u64)，写在所有数据帧之后
+#   文件尾: 索引块位置(u64) 索引条数(u64) 魔数(8)
+RECORDING_EXT = '.rec'
+MAGIC = b'ASTXREC1'
+VERSION = 1
+HEADER = struct.Struct('<8sHHI')
+FRAME = struct.Struct('<qI')
+TRAILER = struct.Struct('<QQ8s')
+INDEX_DTYPE = np.dtype([('recv_time', '<i8'), ('offset', '<u8')])
+INDEX_INTERVAL = 1024
+
+# 一帧: (接收时间 纳秒, 原始数据)
+Frame = Tuple[int, memoryview]
+
+
+class RecordingWriter:
+    """写入二进制记录文件"""
+    def __init__(self, path: str, index_interval: int = INDEX_INTERVAL) -> None:
+        self.path = path
+        self.index_interval = index_interval
+        self.file: BinaryIO = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, index_interval))
+        self.count = 0                          # 已写入的帧数
+        self.index: List[Tuple[int, int]] = []  # 时间索引
+
+    def write(self, recv_time: int, data: bytes) -> None:
+        """写入一帧"""
+        if self.index_interval and self.count % self.index_interval == 0:
+            self.index.append((recv_time, self.file.tell()))
+        self.file.write(FRAME.pack(recv_time, len(data)))
+        self.file.write(data)
+        self.count += 1
+
+    def close(self) -> None:
+        """写入索引块与文件尾"""
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.file.write(TRAILER.pack(index_offset, len(self.index), MAGIC))
+        self.file.close()
+
+    def __enter__(self) -> 'RecordingWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class RecordingReader:
+    """
+    内存映射读取二进制记录文件，逐帧返回原始数据的memoryview切片（不复制）
+    关闭后仍持有的切片会让映射保留到切片释放为止
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mm)
+        magic, version, _, self.index_interval = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'不是二进制记录文件: {path}')
+        self.end = len(self.buffer)         # 数据帧的结束位置
+        self.index: Optional[np.ndarray] = None
+        if self.end >= HEADER.size + TRAILER.size:
+            index_offset, count, magic = TRAILER.unpack_from(self.buffer, self.end - TRAILER.size)
+            if magic == MAGIC and index_offset + count * INDEX_DTYPE.itemsize + TRAILER.size == self.end:
+                index_end = index_offset + count * INDEX_DTYPE.itemsize
+                self.index = np.frombuffer(bytes(self.buffer[index_offset:index_end]), dtype=INDEX_DTYPE)
+                self.end = index_offset
+        # 没有文件尾（写入未完成）时，读到最后一个完整的帧为止
+
+    def frames(self, start: int = HEADER.size, end: Optional[int] = None) -> Generator[Frame, None, None]:
+        """读取[start, end)范围内的帧，start必须是帧的起始位置"""
+        buffer = self.buffer
+        end = self.end if end is None else min(end, self.end)
+        unpack = FRAME.unpack_from
+        size = FRAME.size
+        offset = start
+        while offset + size <= end:
+            recv_time, length = unpack(buffer, offset)
+            offset += size
+            if offset + length > self.end:
+                break   # 不完整的帧
+            yield recv_time, buffer[offset:offset + length]
+            offset += length
+
+    def __iter__(self) -> Generator[Frame, None, None]:
+        return self.frames()
+
+    def seek_time(self, recv_time: int) -> int:
+        """通过索引找到不晚于recv_time的最近索引帧位置"""
+        if self.index is None or len(self.index) == 0:
+            return HEADER.size
+        i = int(np.searchsorted(self.index['recv_time'], recv_time, side='right')) - 1
+        return int(self.index['offset'][max(i, 0)])
+
+    def window(self, start_time: int, end_time: int) -> Generator[Frame, None, None]:
+        """读取接收时间在[start_time, end_time)内的帧"""
+        for recv_time, data in self.frames(self.seek_time(start_time)):
+            if recv_time >= end_time:
+                break
+            if recv_time >= start_time:
+                yield recv_time, data
+
+    def split(self, chunk_size: int) -> List[Tuple[int, int]]:
+        """按索引把文件切分为约chunk_size字节的若干段，边界对齐到帧"""
+        if self.index is None or len(self.index) == 0:
+            return [(HEADER.size, self.end)]
+        offsets = [int(i) for i in self.index['offset']] + [self.end]
+        result = []
+        start = offsets[0]
+        for offset in offsets[1:]:
+            if offset - start >= chunk_size or offset == self.end:
+                result.append((start, offset))
+                start = offset
+        return result
+
+    def close(self) -> None:
+        self.buffer.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            pass    # 仍有未释放的帧切片，映射在切片释放后由垃圾回收关闭
+        self.file.close()
+
+    def __enter__(self) -> 'RecordingReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def is_recording(path: str) -> bool:
+    """是否为二进制记录文件"""
+    return path.endswith(RECORDING_EXT)
+
+
+def convert_text(src: str, dst: str, index_interval: int = INDEX_INTERVAL,
+                 quarantine: Optional[Quarantine] = None) -> Tuple[int, int]:
+    """
+    把 YYYYMMDD:秒 16进制串 格式的文本记录转换为二进制记录
+    缺少字段、时间格式错误或不是16进制的行跳过并计数，有旁路文件时原样写入
+    :return (帧数, 跳过的行数)
+    """
+    skipped = 0
+    with open_text(src) as f, RecordingWriter(dst, index_interval) as writer:
+        for line in f:
+            soc = line.split()
+            if not soc:
+                continue
+            try:
+                recv_time = utc_str_to_ns(soc[0])
+                data = bytes.fromhex(soc[1])
+            except (ValueError, IndexError):
+                skipped += 1
+                if quarantine is not None:
+                    quarantine.write_line(line, MALFORMED_LINE)
+                continue
+            writer.write(recv_time, data)
+    if skipped:
+        METRICS.inc('malformed_total', skipped, reason=MALFORMED_LINE)
+    return writer.count, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='二进制记录文件')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('convert', help='文本记录转换为二进制记录')
+    p.add_argument('src')
+    p.add_argument('dst', nargs='?', help=f'默认与src同名，扩展名{RECORDING_EXT}')
+    p.add_argument('--index-interval', type=int, default=INDEX_INTERVAL, help='每隔多少帧记录一次时间索引')
+    p.add_argument('--quarantine', help='无法解析的行追加到该文件')
+    p = sub.add_parser('info', help='查看二进制记录')
+    p.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        dst = args.dst or os.path.splitext(args.src)[0] + RECORDING_EXT
+        quarantine = Quarantine(args.quarantine) if args.quarantine else None
+        try:
+            count, skipped = convert_text(args.src, dst, args.index_interval, quarantine)
+        finally:
+            if quarantine is not None:
+                quarantine.close()
+        print(f'{args.src} -> {dst}: {count}帧, 跳过{skipped}行无法解析的数据, '
+              f'{os.path.getsize(args.src)} -> {os.path.getsize(dst)}字节')
+    else:
+        with RecordingReader(args.path) as reader:
+            count = 0
+            first = last = None
+            for recv_time, _ in reader:
+                first = recv_time if first is None else first
+                last = recv_time
+                count += 1
+            print(f'{count}帧, 索引{0 if reader.index is None else len(reader.index)}条, '
+                  f'时间 {np.datetime64(first, "ns") if first is not None else None} ~ '
+                  f'{np.datetime64(last, "ns") if last is not None else None}')
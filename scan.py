@@ -0,0 +1,177 @@
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
+import argparse
+
+import numpy as np
+
+from framing import Deduplicator, Quarantine
+from plot_batch import (empty_batch, NORTH_MARKER, PlotBatchBuilder, SECTOR_CROSSING, ServiceMessage, VALID_SECTOR,
+                        VALID_SOURCE)
+from sensors import source_key, source_keys, SensorRegistry
+
+# 分批的单位
+PER_SECTOR = 'sector'       # 每个扇区（正北与扇区消息之间）一批
+PER_SCAN = 'scan'           # 每圈（相邻两次正北消息之间）一批
+
+# 没有CAT034的数据源，点迹累积到这么多条时交出
+MAX_SCAN_PLOTS = 65536
+
+
+class ScanBatch:
+    """一个数据源在一个扫描或扇区内的点迹"""
+    __slots__ = ('key', 'plots', 'start', 'end', 'scan', 'sector')
+
+    def __init__(self, key: int, plots: np.ndarray, start: Optional[int], end: Optional[int],
+                 scan: int, sector: Optional[float]) -> None:
+        self.key = key                  # 数据源键
+        self.plots = plots              # 列式数组
+        self.start = start              # 开始的CAT034消息的接收时间 ns，未知为None
+        self.end = end                  # 结束的CAT034消息的接收时间 ns，点迹过多或数据结束时交出为None
+        self.scan = scan                # 第几圈（已收到的正北消息数）
+        self.sector = sector            # 扇区开始的方位 °，未知为None
+
+    def __len__(self) -> int:
+        return len(self.plots)
+
+    def __repr__(self) -> str:
+        return f'ScanBatch({self.key >> 8}/{self.key & 0xFF} 第{self.scan}圈 {self.sector}° {len(self.plots)}条)'
+
+
+class ScanBatcher:
+    """
+    按CAT034的正北、扇区消息把CAT048点迹切分为每个数据源每圈或每个扇区一批
+    作为PlotBatchBuilder的services: 解码时收到的CAT034消息记为边界，cut时交出边界之前的点迹
+    点迹按所在的帧归属，同一帧中CAT034之后的点迹仍属于前一个扇区
+    """
+    def __init__(self, per: str = PER_SECTOR, sensors: Optional[SensorRegistry] = None,
+                 max_plots: int = MAX_SCAN_PLOTS) -> None:
+        if per not in (PER_SECTOR, PER_SCAN):
+            raise ValueError(f'未知的分批单位: {per}')
+        self.per = per
+        self.sensors = sensors              # CAT034消息同时交给传感器登记表
+        self.max_plots = max_plots
+        self.pending: Dict[int, List[np.ndarray]] = {}      # 数据源 -> 未交出的点迹
+        self.counts: Dict[int, int] = {}                    # 数据源 -> 未交出的点迹数
+        self.starts: Dict[int, int] = {}                    # 数据源 -> 当前批开始的边界时间
+        self.scans: Dict[int, int] = {}                     # 数据源 -> 已收到的正北消息数
+        self.sectors: Dict[int, float] = {}                 # 数据源 -> 当前扇区的方位
+        self.boundaries: List[Tuple[int, int, int, Optional[float]]] = []  # (数据源, 接收时间, 消息类型, 方位)
+
+    def observe(self, recv_time: int, message: ServiceMessage) -> None:
+        """CAT034服务消息: 正北消息（按扇区分批时还有扇区消息）记为边界"""
+        if self.sensors is not None:
+            self.sensors.observe(recv_time, message)
+        if not message.flags & VALID_SOURCE:
+            return
+        if message.message_type == NORTH_MARKER or (message.message_type == SECTOR_CROSSING
+                                                     and self.per == PER_SECTOR):
+            sector = message.sector if message.flags & VALID_SECTOR else None
+            if message.message_type == NORTH_MARKER:
+                sector = 0.0
+            self.boundaries.append((source_key(message.SAC, message.SIC), recv_time, message.message_type, sector))
+
+    def add(self, plots: np.ndarray) -> None:
+        """加入一批点迹，按数据源暂存"""
+        if len(plots) == 0:
+            return
+        keys = source_keys(plots)
+        first = int(keys[0])
+        if np.all(keys == first):
+            groups = [(first, plots)]
+        else:
+            groups = [(int(key), plots[keys == key]) for key in np.unique(keys)]
+        for key, rows in groups:
+            self.pending.setdefault(key, []).append(rows)
+            self.counts[key] = self.counts.get(key, 0) + len(rows)
+
+    def __take(self, key: int, end: Optional[int]) -> ScanBatch:
+        datas = self.pending.pop(key, [])
+        self.counts.pop(key, None)
+        plots = datas[0] if len(datas) == 1 else np.concatenate(datas) if datas else empty_batch()
+        return ScanBatch(key, plots, self.starts.get(key), end, self.scans.get(key, 0), self.sectors.get(key))
+
+    def cut(self) -> List[ScanBatch]:
+        """
+        交出已收到边界的数据源的点迹（没有点迹的扇区也交出，用于推进时间），
+        以及累积超过max_plots条的数据源的点迹
+        """
+        result = []
+        for key, recv_time, message_type, sector in self.boundaries:
+            result.append(self.__take(key, recv_time))
+            self.starts[key] = recv_time
+            if message_type == NORTH_MARKER:
+                self.scans[key] = self.scans.get(key, 0) + 1
+            if sector is None:
+                self.sectors.pop(key, None)
+            else:
+                self.sectors[key] = sector
+        self.boundaries.clear()
+        for key in [key for key, count in self.counts.items() if count >= self.max_plots]:
+            result.append(self.__take(key, None))
+        return result
+
+    def feed(self, plots: np.ndarray) -> List[ScanBatch]:
+        """加入一批点迹并交出已完成的批"""
+        self.add(plots)
+        return self.cut()
+
+    def close(self) -> List[ScanBatch]:
+        """数据结束，交出所有未交出的点迹"""
+        result = self.cut()
+        for key in list(self.pending):
+            result.append(self.__take(key, None))
+        return result
+
+    def ready(self, builder: PlotBatchBuilder) -> bool:
+        """builder中的点迹是否需要交出: 收到了边界或点迹已够多"""
+        return bool(self.boundaries) or len(builder) >= self.max_plots
+
+
+def scan_lines(lines: Iterable[str], per: str = PER_SECTOR, sensors: Optional[SensorRegistry] = None,
+               max_plots: int = MAX_SCAN_PLOTS, quarantine: Optional[Quarantine] = None,
+               dedup: Optional[Deduplicator] = None) -> Generator[ScanBatch, None, None]:
+    """逐个扫描或扇区解码若干行原始数据中的CAT048"""
+    batcher = ScanBatcher(per, sensors, max_plots)
+    builder = PlotBatchBuilder(quarantine=quarantine, services=batcher, dedup=dedup)
+    for line in lines:
+        builder.append_line(line)
+        if batcher.ready(builder):
+            yield from batcher.feed(builder.flush())
+    yield from batcher.feed(builder.flush())
+    yield from batcher.close()
+
+
+def scan_frames(frames: Iterable[Tuple[int, memoryview]], per: str = PER_SECTOR,
+                sensors: Optional[SensorRegistry] = None, max_plots: int = MAX_SCAN_PLOTS,
+                quarantine: Optional[Quarantine] = None,
+                dedup: Optional[Deduplicator] = None) -> Generator[ScanBatch, None, None]:
+    """逐个扫描或扇区解码若干帧中的CAT048"""
+    batcher = ScanBatcher(per, sensors, max_plots)
+    builder = PlotBatchBuilder(quarantine=quarantine, services=batcher, dedup=dedup)
+    for recv_time, buffer in frames:
+        builder.append_frame(recv_time, buffer)
+        if batcher.ready(builder):
+            yield from batcher.feed(builder.flush())
+    yield from batcher.feed(builder.flush())
+    yield from batcher.close()
+
+
+if __name__ == '__main__':
+    from plane_data import scan_file
+
+    parser = argparse.ArgumentParser(description='按天线扫描分批')
+    parser.add_argument('path')
+    parser.add_argument('--per', choices=[PER_SECTOR, PER_SCAN], default=PER_SECTOR, help='每个扇区或每圈一批')
+    args = parser.parse_args()
+
+    stats: Dict[int, List[int]] = {}     # 数据源 -> [批数, 点迹数, 按边界交出的批数, 总时长ns]
+    for batch in scan_file(args.path, args.per):
+        item = stats.setdefault(batch.key, [0, 0, 0, 0])
+        item[0] += 1
+        item[1] += len(batch)
+        if batch.start is not None and batch.end is not None:
+            item[2] += 1
+            item[3] += batch.end - batch.start
+    for key, (count, plots, closed, duration) in sorted(stats.items()):
+        source = '无SAC/SIC' if key < 0 else f'SAC={key >> 8} SIC={key & 0xFF}'
+        span = f' 平均{duration / closed / 1e9:.3f}s' if closed else ''
+        print(f'{source}: {count}批 {plots}条点迹 每批平均{plots / count:.1f}条 {closed}批由CAT034切分{span}')
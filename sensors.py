@@ -0,0 +1,192 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import argparse
+import os
+
+import numpy as np
+
+from airport import get_airport
+from plot_batch import ServiceMessage, VALID_POLAR, VALID_ROTATION, VALID_SOURCE
+from projection import get_projection, RadarProjection
+
+SENSORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensors.txt')
+
+# 没有SAC/SIC的点迹的数据源键
+NO_SOURCE = -1
+
+
+def source_key(SAC: int, SIC: int) -> int:
+    """SAC/SIC组合为一个键"""
+    return (SAC << 8) | SIC
+
+
+def source_keys(batch: np.ndarray) -> np.ndarray:
+    """每条点迹的数据源键，没有SAC/SIC为NO_SOURCE"""
+    keys = (batch['SAC'].astype(np.int64) << 8) | batch['SIC']
+    return np.where((batch['valid'] & VALID_SOURCE) != 0, keys, NO_SOURCE)
+
+
+class Sensor:
+    """一部雷达: 站址、距离偏差与天线旋转周期"""
+    def __init__(self, SAC: int, SIC: int, longitude: float, latitude: float, height: float = 0.0,
+                 range_bias: float = 0.0, name: str = '', registered: bool = True) -> None:
+        self.SAC = SAC
+        self.SIC = SIC
+        self.longitude = longitude                  # 站址经度 °
+        self.latitude = latitude                    # 站址纬度 °
+        self.height = height                        # 天线高度 m
+        self.range_bias = range_bias                # 距离偏差 m，测量的斜距减去该值为实际斜距
+        self.name = name
+        self.registered = registered                # 是否在登记表中，否则站址取默认雷达
+        self.rotation_period: Optional[float] = None    # 天线旋转周期 s，由CAT034 I034/041得到
+        self.projection: RadarProjection = get_projection(longitude, latitude, height)
+
+    @property
+    def key(self) -> int:
+        return source_key(self.SAC, self.SIC)
+
+    def __repr__(self) -> str:
+        return f'Sensor({self.SAC}/{self.SIC} {self.name} ({self.longitude}, {self.latitude}))'
+
+
+class SensorRegistry:
+    """
+    (SAC, SIC)到雷达的登记表，未登记的数据源按默认雷达（paodao.txt中的雷达）的站址
+    投影时按数据源分组，每组用各自雷达的站址与距离偏差向量化转换
+    """
+    def __init__(self, default: Tuple[float, float], sensors: Iterable[Sensor] = ()) -> None:
+        self.default = default
+        self.sensors: Dict[int, Sensor] = {}
+        self.fallback = Sensor(0, 0, *default, name='默认', registered=False)   # 没有SAC/SIC的点迹
+        for sensor in sensors:
+            self.add(sensor)
+
+    def add(self, sensor: Sensor) -> None:
+        self.sensors[sensor.key] = sensor
+
+    def get(self, SAC: int, SIC: int) -> Sensor:
+        """数据源对应的雷达，未登记时按默认站址创建"""
+        key = source_key(SAC, SIC)
+        sensor = self.sensors.get(key)
+        if sensor is None:
+            sensor = self.sensors[key] = Sensor(SAC, SIC, *self.default, registered=False)
+        return sensor
+
+    def __getitem__(self, key: int) -> Sensor:
+        return self.fallback if key == NO_SOURCE else self.get(key >> 8, key & 0xFF)
+
+    def __iter__(self) -> Iterator[Sensor]:
+        return iter(sorted(self.sensors.values(), key=lambda sensor: sensor.key))
+
+    def __len__(self) -> int:
+        return len(self.sensors)
+
+    def observe(self, recv_time: int, message: ServiceMessage) -> None:
+        """CAT034服务消息: 记下数据源的天线旋转周期"""
+        if message.flags & VALID_SOURCE and message.flags & VALID_ROTATION:
+            self.get(message.SAC, message.SIC).rotation_period = message.rotation_period
+
+    def partition(self, batch: np.ndarray) -> List[Tuple[Sensor, Union[slice, np.ndarray]]]:
+        """按数据源分组，返回(雷达, 行号)，只有一个数据源时行号为整个切片"""
+        keys = source_keys(batch)
+        if len(keys) == 0:
+            return []
+        first = int(keys[0])
+        if np.all(keys == first):
+            return [(self[first], slice(None))]
+        return [(self[int(key)], np.flatnonzero(keys == key)) for key in np.unique(keys)]
+
+    def __rho(self, sensor: Sensor, rho: np.ndarray) -> np.ndarray:
+        return rho - sensor.range_bias if sensor.range_bias else rho
+
+    def to_geodetic(self, batch: np.ndarray, rho: Optional[np.ndarray] = None,
+                    FL: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """按各自雷达的站址与距离偏差把点迹换算为经纬度，rho、FL默认取batch中的列"""
+        rho = batch['rho'] if rho is None else rho
+        FL = batch['FL'] if FL is None else FL
+        longitudes, latitudes = np.full(len(batch), np.nan), np.full(len(batch), np.nan)
+        for sensor, rows in self.partition(batch):
+            longitudes[rows], latitudes[rows] = sensor.projection.to_geodetic(
+                self.__rho(sensor, rho[rows]), batch['theta'][rows], FL[rows])
+        return longitudes, latitudes
+
+    def to_enu(self, batch: np.ndarray, projection: RadarProjection, rho: Optional[np.ndarray] = None,
+               FL: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把点迹换算到projection的局部平面（东, 北） m
+        与projection同一站址的雷达直接转换，其它雷达先换算为经纬度
+        """
+        rho = batch['rho'] if rho is None else rho
+        FL = batch['FL'] if FL is None else FL
+        east, north = np.full(len(batch), np.nan), np.full(len(batch), np.nan)
+        for sensor, rows in self.partition(batch):
+            sensor_rho = self.__rho(sensor, rho[rows])
+            if sensor.projection is projection:
+                east[rows], north[rows] = projection.to_enu(sensor_rho, batch['theta'][rows], FL[rows])
+            else:
+                longitudes, latitudes = sensor.projection.to_geodetic(sensor_rho, batch['theta'][rows], FL[rows])
+                east[rows], north[rows] = projection.geodetic_to_enu(longitudes, latitudes)
+        return east, north
+
+
+def load_sensors(path: str = SENSORS_PATH, default: Optional[Tuple[float, float]] = None) -> SensorRegistry:
+    """
+    读取传感器登记表，每行: SAC SIC 经度 纬度 [天线高度m] [距离偏差m] [名称]，#之后为注释
+    SAC/SIC可以写作十进制或0x开头的十六进制；文件不存在时只有默认雷达
+    """
+    registry = SensorRegistry(default or get_airport().radar)
+    if not os.path.exists(path):
+        return registry
+    with open(path, 'r', encoding='UTF-8') as f:
+        for number, line in enumerate(f, 1):
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            if len(fields) < 4:
+                raise ValueError(f'{path}:{number} 至少需要 SAC SIC 经度 纬度')
+            numbers = [float(field) for field in fields[4:6]]
+            registry.add(Sensor(int(fields[0], 0), int(fields[1], 0), float(fields[2]), float(fields[3]),
+                                *numbers, name=' '.join(fields[6:])))
+    return registry
+
+
+_sensors: Optional[SensorRegistry] = None
+
+
+def get_sensors() -> SensorRegistry:
+    """默认的传感器登记表（sensors.txt），只读取一次"""
+    global _sensors
+    if _sensors is None:
+        _sensors = load_sensors()
+    return _sensors
+
+
+def set_sensors(registry: SensorRegistry) -> None:
+    """替换默认的传感器登记表，如命令行指定的登记表"""
+    global _sensors
+    _sensors = registry
+
+
+if __name__ == '__main__':
+    from plane_data import stream_file
+
+    parser = argparse.ArgumentParser(description='传感器登记表')
+    parser.add_argument('files', nargs='*', help='统计数据文件中各数据源的点迹数与天线旋转周期')
+    parser.add_argument('--path', default=SENSORS_PATH)
+    args = parser.parse_args()
+
+    sensors = load_sensors(args.path)
+    counts: Dict[int, int] = {}
+    for path in args.files:
+        for batch in stream_file(path, sensors=sensors):
+            keys, n = np.unique(source_keys(batch[(batch['valid'] & VALID_POLAR) != 0]), return_counts=True)
+            for key, count in zip(keys.tolist(), n.tolist()):
+                counts[key] = counts.get(key, 0) + count
+                if key != NO_SOURCE:
+                    sensors.get(key >> 8, key & 0xFF)   # 出现过的数据源都列出
+    print(f'默认雷达 {sensors.default}')
+    for sensor in sensors:
+        period = f'{sensor.rotation_period:.3f}s' if sensor.rotation_period else '未知'
+        state = '' if sensor.registered else '（未登记，按默认雷达）'
+        print(f'SAC={sensor.SAC} SIC={sensor.SIC} {sensor.name} ({sensor.longitude}, {sensor.latitude}) '
+              f'高度{sensor.height}m 距离偏差{sensor.range_bias}m 旋转周期{period} '
+              f'点迹{counts.get(sensor.key, 0)}{state}')
@@ -0,0 +1,301 @@
+from typing import Dict, Generator, List, Optional, Tuple
+import argparse
+import math
+import os
+
+import numpy as np
+
+from airport import AirportGeometry, get_airport
+from plot_batch import NORTH_MARKER, SECTOR_CROSSING
+from recording import RECORDING_EXT, RecordingWriter
+from timestamps import DAY_NS, ns_to_utc_str, SECOND_NS, TICK_NS, DAY_TICKS
+
+# 合成数据的HDLC地址、控制字段，与数据样例一致
+HDLC_HEADER = bytes([0x1c, 0x00])
+
+# 轨迹的类型
+APPROACH = 'approach'
+DEPARTURE = 'departure'
+OVERFLIGHT = 'overflight'
+
+# 航空公司代码，用于生成航班号
+AIRLINES = ['CCA', 'CES', 'CSN', 'CHH', 'CSZ', 'CXA', 'DKH', 'OKA', 'JOY', 'CSC', 'CQH', 'GCR']
+
+# 字符 -> 6位编码，空格为32
+_IA5_CODES = {chr(ord('A') + i): i + 1 for i in range(26)}
+_IA5_CODES.update({chr(c): c for c in range(ord('0'), ord('9') + 1)})
+_IA5_CODES[' '] = 32
+
+
+class TrafficConfig:
+    """合成交通的参数"""
+    def __init__(self, aircraft: int = 50, duration: float = 600.0, start: str = '20200801', rotation: float = 4.0,
+                 mix: Tuple[float, float, float] = (0.4, 0.4, 0.2), mode_s: float = 0.95, mb_blocks: int = 2,
+                 fx_extension: float = 0.1, sectors: int = 0, latency: float = 0.2, SAC: int = 0x14,
+                 SIC: int = 0x1c, seed: int = 0) -> None:
+        self.aircraft = aircraft            # 飞机数，在duration内均匀出现
+        self.duration = duration            # 时长 s
+        self.start = start                  # 起始日期 YYYYMMDD，从零点开始
+        self.rotation = rotation            # 天线旋转周期 s，每圈每架飞机一个点迹
+        self.mix = mix                      # 进近、离场、飞越的比例
+        self.mode_s = mode_s                # S模式飞机的比例，有ICAO码、航班号与MB数据
+        self.mb_blocks = mb_blocks          # 每个点迹最多的MB数据块数（I048/250）
+        self.fx_extension = fx_extension    # I048/020、I048/170带FX扩展字节的比例
+        self.sectors = sectors              # 每圈的CAT034扇区消息数，0为只有正北消息
+        self.latency = latency              # 最大传输延迟 s
+        self.SAC = SAC
+        self.SIC = SIC
+        self.seed = seed
+
+
+class Trajectory:
+    """一架飞机的轨迹: 折线航路点 (东, 北, 高度 m, 相对出现时间 s)"""
+    def __init__(self, kind: str, start: float, waypoints: np.ndarray) -> None:
+        self.kind = kind
+        self.start = start                  # 出现时间，相对数据起点 s
+        self.waypoints = waypoints          # 形状(n, 4)
+        self.ICAO = 0
+        self.callsign = ''
+        self.track_number = 0
+        self.mode_s = True
+
+    @property
+    def end(self) -> float:
+        return self.start + float(self.waypoints[-1, 3])
+
+    def position(self, t: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """各时刻的(东, 北, 高度)"""
+        rel = t - self.start
+        w = self.waypoints
+        return np.interp(rel, w[:, 3], w[:, 0]), np.interp(rel, w[:, 3], w[:, 1]), np.interp(rel, w[:, 3], w[:, 2])
+
+
+def _segments(points: List[Tuple[float, float, float]], speeds: List[float]) -> np.ndarray:
+    """由航路点与各段速度计算航路点时间"""
+    result = np.zeros((len(points), 4))
+    result[:, :3] = points
+    for i in range(1, len(points)):
+        distance = math.dist(points[i - 1], points[i])
+        result[i, 3] = result[i - 1, 3] + distance / speeds[i - 1]
+    return result
+
+
+def make_trajectory(kind: str, start: float, rng: np.random.Generator,
+                    airport: AirportGeometry, field_elevation: float = 479.0) -> Trajectory:
+    """生成一条进近、离场或飞越的轨迹"""
+    if kind == OVERFLIGHT:
+        heading = rng.uniform(0, 2 * math.pi)
+        offset = rng.uniform(-40000, 40000)
+        height = rng.uniform(7000, 11000)
+        ue, un = math.sin(heading), math.cos(heading)
+        ce, cn = offset * un, -offset * ue
+        a = (ce - 75000 * ue, cn - 75000 * un, height)
+        b = (ce + 75000 * ue, cn + 75000 * un, height)
+        return Trajectory(kind, start, _segments([a, b], [rng.uniform(200, 250)]))
+    runway = airport.runways[int(rng.integers(len(airport.runways)))]
+    reverse = bool(rng.integers(2))
+    first, second = runway.ends[::-1] if reverse else runway.ends
+    ue, un = runway.direction
+    if reverse:
+        ue, un = -ue, -un
+    ground = field_elevation
+    if kind == APPROACH:
+        # 3°下滑道进近，接地后滑跑减速
+        distance = 25000.0
+        glide = math.tan(math.radians(3.0))
+        points = [(first.east - distance * ue, first.north - distance * un, ground + 15 + distance * glide),
+                  (first.east, first.north, ground + 15),
+                  (first.east + 1500 * ue, first.north + 1500 * un, ground)]
+        return Trajectory(kind, start, _segments(points, [rng.uniform(70, 80), 40.0]))
+    # 起飞滑跑后按8%梯度爬升
+    roll = 1800.0
+    climb = 30000.0
+    points = [(first.east, first.north, ground),
+              (first.east + roll * ue, first.north + roll * un, ground),
+              (first.east + (roll + climb) * ue, first.north + (roll + climb) * un, ground + climb * 0.08)]
+    return Trajectory(kind, start, _segments(points, [40.0, rng.uniform(110, 140)]))
+
+
+def make_traffic(config: TrafficConfig, airport: Optional[AirportGeometry] = None) -> List[Trajectory]:
+    """按配置生成所有飞机的轨迹"""
+    airport = airport or get_airport()
+    rng = np.random.default_rng(config.seed)
+    kinds = rng.choice([APPROACH, DEPARTURE, OVERFLIGHT], size=config.aircraft, p=np.array(config.mix) / sum(config.mix))
+    result = []
+    for i, kind in enumerate(kinds):
+        trajectory = make_trajectory(str(kind), float(rng.uniform(0, config.duration)), rng, airport)
+        trajectory.ICAO = int(rng.integers(0x780000, 0x7bffff))
+        trajectory.callsign = f'{AIRLINES[int(rng.integers(len(AIRLINES)))]}{int(rng.integers(1, 9999))}'
+        trajectory.track_number = (i % 4095) + 1
+        trajectory.mode_s = bool(rng.random() < config.mode_s)
+        result.append(trajectory)
+    return result
+
+
+def encode_fspec(frns: List[int]) -> bytes:
+    """由存在的FRN生成FSPEC"""
+    size = (max(frns) + 6) // 7
+    result = bytearray(size)
+    for frn in frns:
+        result[(frn - 1) // 7] |= 0x80 >> ((frn - 1) % 7)
+    for i in range(size - 1):
+        result[i] |= 1
+    return bytes(result)
+
+
+def encode_record(CAT: int, items: Dict[int, bytes]) -> bytes:
+    """由FRN -> 数据项字节组装带HDLC字段的整帧数据"""
+    frns = sorted(items)
+    body = encode_fspec(frns) + b''.join(items[frn] for frn in frns)
+    return HDLC_HEADER + bytes([CAT]) + (len(body) + 3).to_bytes(2, 'big') + body
+
+
+def encode_callsign(callsign: str) -> bytes:
+    """航班号编码为8个6位字符，不足8位补空格"""
+    value = 0
+    for c in callsign[:8].upper().ljust(8):
+        value = (value << 6) | _IA5_CODES.get(c, 32)
+    return value.to_bytes(6, 'big')
+
+
+def _u16(value: float) -> bytes:
+    return (int(round(value)) & 0xffff).to_bytes(2, 'big')
+
+
+def _tod(plot_ns: int) -> bytes:
+    return ((plot_ns % DAY_NS) // TICK_NS % DAY_TICKS).to_bytes(3, 'big')
+
+
+def encode_plot(config: TrafficConfig, trajectory: Trajectory, plot_ns: int, rho: float, theta: float,
+                FL: float, east: float, north: float, speed: float, heading: float,
+                rng: np.random.Generator) -> bytes:
+    """组装一条CAT048点迹"""
+    extended = rng.random() < config.fx_extension
+    items = {
+        1: bytes([config.SAC, config.SIC]),                                     # I048/010
+        2: _tod(plot_ns),                                                       # I048/140
+        3: b'\xa1\x00' if extended else b'\xa0',                                # I048/020
+        4: _u16(rho / 1852 * 256) + _u16(theta / 360 * (1<<16)),                # I048/040
+        5: _u16(int(trajectory.ICAO) % 0o7777),                                 # I048/070
+        6: _u16(FL / 30.48 * 4),                                                # I048/090
+        11: _u16(trajectory.track_number),                                      # I048/161
+        12: _u16(east / 1852 * 128) + _u16(north / 1852 * 128),                 # I048/042
+        13: _u16(speed / 1852 * (1<<14)) + _u16(heading / 360 * (1<<16)),       # I048/200
+        14: b'\x41\x00' if extended else b'\x40',                               # I048/170
+        21: b'\x20\xfd',                                                        # I048/230
+    }
+    if trajectory.mode_s:
+        items[8] = trajectory.ICAO.to_bytes(3, 'big')                           # I048/220
+        items[9] = encode_callsign(trajectory.callsign)                         # I048/240
+        blocks = int(rng.integers(config.mb_blocks + 1)) if config.mb_blocks else 0
+        if blocks:
+            items[10] = bytes([blocks]) + rng.bytes(8 * blocks)                 # I048/250
+    return encode_record(48, items)
+
+
+def encode_service(config: TrafficConfig, plot_ns: int, message_type: int, sector: Optional[int] = None) -> bytes:
+    """组装一条CAT034服务消息（正北或扇区）"""
+    items = {
+        1: bytes([config.SAC, config.SIC]),                                     # I034/010
+        2: bytes([message_type]),                                               # I034/000
+        3: _tod(plot_ns),                                                       # I034/030
+        5: _u16(config.rotation * 128),                                         # I034/041
+    }
+    if sector is not None:
+        items[4] = bytes([sector])                                              # I034/020
+    return encode_record(34, items)
+
+
+def generate(config: TrafficConfig, airport: Optional[AirportGeometry] = None) -> Generator[Tuple[int, bytes], None, None]:
+    """
+    按接收时间顺序生成(接收时间 ns, 带HDLC字段的原始数据)
+    每圈天线扫过飞机所在方位时产生一个点迹，并在正北与各扇区产生CAT034消息
+    """
+    airport = airport or get_airport()
+    projection = airport.projection
+    rng = np.random.default_rng(config.seed + 1)
+    traffic = make_traffic(config, airport)
+    date = config.start
+    origin = (np.datetime64(f'{date[:4]}-{date[4:6]}-{date[6:]}') - np.datetime64('1970-01-01')).astype('timedelta64[D]')
+    origin_ns = int(origin.astype(np.int64)) * DAY_NS
+    scans = int(math.ceil(config.duration / config.rotation))
+    for scan in range(scans):
+        scan_start = scan * config.rotation
+        events: List[Tuple[int, bytes]] = []
+        # 正北与扇区消息
+        sectors = max(config.sectors, 1)
+        for sector in range(sectors):
+            t = scan_start + sector * config.rotation / sectors
+            plot_ns = origin_ns + int(t * SECOND_NS)
+            message = encode_service(config, plot_ns, NORTH_MARKER if sector == 0 else SECTOR_CROSSING,
+                                     sector * 256 // sectors if config.sectors else None)
+            events.append((plot_ns + int(rng.uniform(0, config.latency) * SECOND_NS), message))
+        for trajectory in traffic:
+            if not trajectory.start <= scan_start + config.rotation or trajectory.end < scan_start:
+                continue
+            # 先按圈起点的位置估计方位，再计算天线扫过的时刻
+            e0, n0, _ = trajectory.position(np.array([scan_start]))
+            azimuth = math.degrees(math.atan2(e0[0], n0[0])) % 360
+            t = scan_start + azimuth / 360 * config.rotation
+            if not trajectory.start <= t <= trajectory.end:
+                continue
+            e, n, h = trajectory.position(np.array([t, t + 1.0]))
+            distance = math.hypot(e[0], n[0])
+            theta = math.degrees(math.atan2(e[0], n[0])) % 360
+            # 由地心角反算斜距，与RadarProjection.ground_angle互逆
+            target_r = projection.radius + h[0]
+            c = distance / projection.radius
+            rho = math.sqrt(projection.radar_r ** 2 + target_r ** 2 - 2 * projection.radar_r * target_r * math.cos(c))
+            if rho / 1852 >= 255:
+                continue
+            speed = math.hypot(e[1] - e[0], n[1] - n[0])
+            heading = math.degrees(math.atan2(e[1] - e[0], n[1] - n[0])) % 360
+            plot_ns = origin_ns + int(t * SECOND_NS)
+            message = encode_plot(config, trajectory, plot_ns, rho, theta, h[0], e[0], n[0], speed, heading, rng)
+            events.append((plot_ns + int(rng.uniform(0, config.latency) * SECOND_NS), message))
+        events.sort(key=lambda event: event[0])
+        yield from events
+
+
+def format_line(recv_time: int, data: bytes) -> str:
+    """一帧转换为 YYYYMMDD:秒.毫秒 16进制串 格式的文本行"""
+    return f'{ns_to_utc_str(recv_time)} {data.hex()}'
+
+
+def write_traffic(path: str, config: TrafficConfig) -> int:
+    """写入合成数据，扩展名为.rec时写二进制记录，否则写文本，返回帧数"""
+    count = 0
+    if path.endswith(RECORDING_EXT):
+        with RecordingWriter(path) as writer:
+            for recv_time, data in generate(config):
+                # 与文本格式一致，接收时间精确到毫秒
+                writer.write(recv_time - recv_time % 10**6, data)
+                count += 1
+        return count
+    with open(path, 'w', encoding='UTF-8') as f:
+        for recv_time, data in generate(config):
+            f.write(format_line(recv_time, data) + '\n')
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成合成的CAT048/CAT034雷达数据')
+    parser.add_argument('output', help='输出文件，扩展名为.rec时写二进制记录，否则写文本')
+    parser.add_argument('-n', '--aircraft', type=int, default=50, help='飞机数')
+    parser.add_argument('-d', '--duration', type=float, default=600.0, help='时长 s')
+    parser.add_argument('--date', default='20200801', help='起始日期 YYYYMMDD')
+    parser.add_argument('--rotation', type=float, default=4.0, help='天线旋转周期 s')
+    parser.add_argument('--mix', type=float, nargs=3, default=[0.4, 0.4, 0.2], metavar=('APPROACH', 'DEPARTURE', 'OVERFLIGHT'),
+                        help='进近、离场、飞越的比例')
+    parser.add_argument('--mode-s', type=float, default=0.95, help='S模式飞机的比例')
+    parser.add_argument('--mb-blocks', type=int, default=2, help='每个点迹最多的MB数据块数')
+    parser.add_argument('--fx-extension', type=float, default=0.1, help='带FX扩展字节的比例')
+    parser.add_argument('--sectors', type=int, default=0, help='每圈的CAT034扇区消息数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = TrafficConfig(args.aircraft, args.duration, args.date, args.rotation, tuple(args.mix), args.mode_s,
+                           args.mb_blocks, args.fx_extension, args.sectors, seed=args.seed)
+    count = write_traffic(args.output, config)
+    print(f'{args.output}: {count}帧 {os.path.getsize(args.output) / 1e6:.1f}MB')
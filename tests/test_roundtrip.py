@@ -0,0 +1,204 @@
+from typing import List, Tuple
+import os
+
+import numpy as np
+import pytest
+
+from compressed import compress_file, GZIP, open_text, read_members, split_members
+from follow import follow
+from framing import HDLC_LEN, MALFORMED_LENGTH, MALFORMED_LINE, MALFORMED_OVERRUN
+from metrics import METRICS
+from plane_data import RECORD_FIELDS, SecondaryRadar
+from plot_batch import (ColumnProjector, decode_frames, decode_lines, PlotBatchBuilder, VALID_CALLSIGN,
+                        VALID_POLAR, VALID_SOURCE)
+from synthetic import encode_record, format_line, generate, TrafficConfig
+from timestamps import utc_str_to_ns
+
+# 投影列与对应的有效位
+PROJECTED_COLUMNS = ['SAC', 'SIC', 'rho', 'theta', 'callsign']
+PROJECTED_VALID = VALID_SOURCE | VALID_POLAR | VALID_CALLSIGN
+# valid的所有位
+ALL_VALID = 0xFFFF
+
+
+@pytest.fixture(scope='module')
+def frames() -> List[Tuple[int, bytes]]:
+    """合成的帧，接收时间与文本格式一致精确到毫秒"""
+    config = TrafficConfig(aircraft=20, duration=1200, sectors=4, seed=3)
+    return [(recv_time - recv_time % 10**6, data) for recv_time, data in generate(config)]
+
+
+@pytest.fixture(scope='module')
+def lines(frames: List[Tuple[int, bytes]]) -> List[str]:
+    return [format_line(recv_time, data) for recv_time, data in frames]
+
+
+def assert_same_columns(actual: np.ndarray, expected: np.ndarray, valid: int) -> None:
+    """有效位valid对应的列在各自有效的行上相等"""
+    assert len(actual) == len(expected)
+    assert np.array_equal(actual['recv_time'], expected['recv_time'])
+    assert np.array_equal(actual['valid'] & valid, expected['valid'] & valid)
+    for flag, fields in RECORD_FIELDS:
+        if not flag & valid:
+            continue
+        rows = (expected['valid'] & flag) != 0
+        for column, _ in fields:
+            assert np.array_equal(actual[column][rows], expected[column][rows]), column
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_builder_matches_records(lines: List[str], lazy: bool) -> None:
+    """批量解码与逐条解码（完整、按需）的各字段一致"""
+    batch = decode_lines(lines)
+    records = [record for record in (SecondaryRadar.parse(line, [48], lazy) for line in lines) if record is not None]
+    assert len(records) == len(batch) > 0
+    for record, row in zip(records, batch):
+        assert record.recv_ns == row['recv_time']
+        valid = int(row['valid'])
+        for flag, fields in RECORD_FIELDS:
+            for column, name in fields:
+                if valid & flag:
+                    value = row[column].item()
+                    assert getattr(record, name) == (value.decode() if isinstance(value, bytes) else value), name
+                else:
+                    assert not hasattr(record, name), name
+
+
+def test_frames_match_lines(frames: List[Tuple[int, bytes]], lines: List[str]) -> None:
+    """按帧解码与按文本行解码的结果一致"""
+    expected = decode_lines(lines)
+    assert_same_columns(decode_frames(frames), expected, ALL_VALID)
+
+
+@pytest.mark.parametrize('hdlc', [True, None])
+def test_projector_matches_builder(frames: List[Tuple[int, bytes]], hdlc: bool) -> None:
+    """只解码部分列时，这些列与完整解码一致，其余列缺失"""
+    expected = decode_frames(frames)
+    projector = ColumnProjector(PROJECTED_COLUMNS, hdlc=hdlc)
+    for recv_time, data in frames:
+        projector.append_frame(recv_time, data)
+    projected = projector.finish()
+    assert_same_columns(projected, expected, PROJECTED_VALID)
+    assert not np.any(projected['valid'] & (ALL_VALID ^ PROJECTED_VALID))
+
+
+def test_projector_without_hdlc(frames: List[Tuple[int, bytes]]) -> None:
+    """不带HDLC字段的帧自动识别，结果与带HDLC字段的帧一致"""
+    expected = decode_frames(frames)
+    projector = ColumnProjector(PROJECTED_COLUMNS)
+    for recv_time, data in frames:
+        projector.append_frame(recv_time, data[HDLC_LEN:])
+    assert_same_columns(projector.finish(), expected, PROJECTED_VALID)
+
+
+def test_multi_record_blocks(frames: List[Tuple[int, bytes]]) -> None:
+    """一帧多条记录、多个数据块时，与每帧一条记录的结果一致"""
+    plots = [(recv_time, data) for recv_time, data in frames if data[HDLC_LEN] == 48][:60]
+    recv_time = plots[0][0]
+    single = [(recv_time, data) for _, data in plots]
+    expected = decode_frames(single)
+    bodies = [data[HDLC_LEN + 3:] for _, data in plots]
+    # 每个数据块三条记录，每帧两个数据块
+    blocks = [bodies[i:i + 3] for i in range(0, len(bodies), 3)]
+    merged = []
+    for i in range(0, len(blocks), 2):
+        data = b''.join(bytes([48]) + (3 + sum(map(len, block))).to_bytes(2, 'big') + b''.join(block)
+                        for block in blocks[i:i + 2])
+        merged.append((recv_time, plots[0][1][:HDLC_LEN] + data))
+    assert_same_columns(decode_frames(merged), expected, ALL_VALID)
+    projector = ColumnProjector(PROJECTED_COLUMNS)
+    for recv_time, data in merged:
+        projector.append_frame(recv_time, data)
+    assert_same_columns(projector.finish(), expected, PROJECTED_VALID)
+
+
+def test_gzip_members_match_plain_read(tmp_path, lines: List[str]) -> None:
+    """多成员gzip按成员切分后逐段读取的行，与直接读取相同"""
+    src = str(tmp_path / 'traffic.txt')
+    with open(src, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    dst = src + '.gz'
+    assert compress_file(src, dst, GZIP, member_size=16 * 1024) > 1
+    segments = split_members(dst, 16 * 1024)
+    assert len(segments) > 1
+    split = [line for start, end in segments for line in read_members(dst, start, end)]
+    with open_text(dst) as f:
+        plain = [line.strip() for line in f if line.strip()]
+    assert split == plain == lines
+
+
+def test_malformed_counters() -> None:
+    """无法解析的行、LEN错误、数据项超出记录分别计数，其余记录照常解码"""
+    config = TrafficConfig(aircraft=1, duration=60, seed=5)
+    recv_time, data = next((recv_time, data) for recv_time, data in generate(config) if data[HDLC_LEN] == 48)
+    line = format_line(recv_time, data)
+    # LEN比实际数据多一个字节
+    length = int.from_bytes(data[HDLC_LEN + 1:HDLC_LEN + 3], 'big')
+    too_long = data[:HDLC_LEN + 1] + (length + 1).to_bytes(2, 'big') + data[HDLC_LEN + 3:]
+    # FSPEC中I048/010存在，但数据块在FSPEC之后结束
+    overrun = encode_record(48, {1: b''})
+    builder = PlotBatchBuilder()
+    builder.append_line(line)
+    builder.append_line('20200801:0.000 not-hex')
+    builder.append_line(format_line(recv_time, too_long))
+    builder.append_line(format_line(recv_time, overrun))
+    builder.append_line(line)
+    assert builder.malformed == {MALFORMED_LINE: 1, MALFORMED_LENGTH: 1, MALFORMED_OVERRUN: 1}
+    assert builder.rejected == 3
+    before = dict(METRICS.counters)
+    batch = builder.flush()
+    assert len(batch) == 2
+    assert np.all(batch['recv_time'] == utc_str_to_ns(line.split()[0]))
+    for reason in (MALFORMED_LINE, MALFORMED_LENGTH, MALFORMED_OVERRUN):
+        key = ('malformed_total', (('reason', reason),))
+        assert METRICS.counters.get(key, 0) - before.get(key, 0) == 1
+
+
+def read_outputs(path: str) -> List[str]:
+    base = os.path.splitext(path)[0]
+    with open(base + '-take.csv', encoding='UTF-8') as take, open(base + '-land.csv', encoding='UTF-8') as land:
+        return take.readlines() + land.readlines()
+
+
+def test_follow_resume(tmp_path, lines: List[str]) -> None:
+    """分两次用once从检查点继续处理，与一次处理完的输出相同"""
+    whole = str(tmp_path / 'whole.txt')
+    with open(whole, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    follow(whole, once=True)
+    expected = read_outputs(whole)
+    assert expected
+
+    parts = str(tmp_path / 'parts.txt')
+    half = len(lines) // 2
+    with open(parts, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines[:half]) + '\n')
+    follow(parts, once=True)
+    with open(parts, 'a', encoding='UTF-8') as f:
+        f.write('\n'.join(lines[half:]) + '\n')
+    follow(parts, once=True)
+    assert read_outputs(parts) == expected
+    # 没有新数据时再次运行不重复输出
+    follow(parts, once=True)
+    assert read_outputs(parts) == expected
+
+
+def test_follow_rotated_while_stopped(tmp_path, lines: List[str]) -> None:
+    """停止期间文件被轮转为 path.1 时先读完旧文件，输出与一次处理完的相同"""
+    whole = str(tmp_path / 'whole.txt')
+    with open(whole, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    follow(whole, once=True)
+
+    path = str(tmp_path / 'rotated.txt')
+    first, second = len(lines) // 3, 2 * len(lines) // 3
+    with open(path, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines[:first]) + '\n')
+    follow(path, once=True)
+    with open(path, 'a', encoding='UTF-8') as f:
+        f.write('\n'.join(lines[first:second]) + '\n')
+    os.rename(path, path + '.1')
+    with open(path, 'w', encoding='UTF-8') as f:
+        f.write('\n'.join(lines[second:]) + '\n')
+    follow(path, once=True)
+    assert read_outputs(path) == read_outputs(whole)
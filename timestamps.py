@@ -0,0 +1,87 @@
+from typing import Union
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+# 时间单位
+SECOND_NS = 10**9
+DAY_NS = 86400 * SECOND_NS
+TICK_NS = SECOND_NS // 128      # Time-of-Day 的最小单位 1/128 s
+DAY_TICKS = 86400 * 128
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+# 最近一次解析的日期，同一文件/同一天的数据只解析一次日期
+_last_date = ''
+_last_date_ns = 0
+
+
+def date_to_ns(date_str: str) -> int:
+    """日期串YYYYMMDD转换为当日零点的纳秒时间戳"""
+    global _last_date, _last_date_ns
+    if date_str != _last_date:
+        day = datetime(year=int(date_str[:-4]), month=int(date_str[-4:-2]), day=int(date_str[-2:]))
+        _last_date, _last_date_ns = date_str, (day.toordinal() - _EPOCH_ORDINAL) * DAY_NS
+    return _last_date_ns
+
+
+def utc_str_to_ns(utc: str) -> int:
+    """
+    解析 YYYYMMDD:秒.小数 格式的接收时间，返回纳秒时间戳
+    秒数超过一天时顺延到后面的日期
+    """
+    colon = utc.index(':')
+    sec_str = utc[colon + 1:]
+    dot = sec_str.find('.')
+    if dot < 0:
+        ns = int(sec_str) * SECOND_NS
+    else:
+        frac = sec_str[dot + 1:dot + 10]
+        ns = int(sec_str[:dot]) * SECOND_NS + int(frac) * 10**(9 - len(frac))
+    return date_to_ns(utc[:colon]) + ns
+
+
+def ns_to_utc_str(ns: int) -> str:
+    """纳秒时间戳转换为 YYYYMMDD:秒.毫秒 格式的接收时间，与utc_str_to_ns互逆（精确到毫秒）"""
+    day, rest = divmod(ns, DAY_NS)
+    date = (_EPOCH + timedelta(days=day)).strftime('%Y%m%d')
+    return f'{date}:{rest // SECOND_NS:06d}.{rest % SECOND_NS // 10**6:03d}'
+
+
+def ns_to_datetime(ns: int) -> datetime:
+    """纳秒时间戳转换为datetime（精确到微秒）"""
+    return _EPOCH + timedelta(microseconds=ns // 1000)
+
+
+def ticks_to_time(ticks: int) -> time:
+    """Time-of-Day（1/128 s）转换为time对象"""
+    ticks %= DAY_TICKS
+    sec, rest = divmod(ticks, 128)
+    minute, second = divmod(sec, 60)
+    hour, minute = divmod(minute, 60)
+    return time(hour=hour, minute=minute, second=second, microsecond=rest * 1000000 // 128)
+
+
+def resolve_tod(recv_time: Union[int, np.ndarray], ticks: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+    """
+    结合接收时间把Time-of-Day还原为纳秒时间戳
+    取离接收时间最近的那一天，处理跨零点的情况
+    """
+    day = recv_time - recv_time % DAY_NS
+    result = day + ticks * TICK_NS
+    diff = result - recv_time
+    half = DAY_NS // 2
+    if isinstance(diff, np.ndarray):
+        result = result - DAY_NS * (diff > half) + DAY_NS * (diff < -half)
+    elif diff > half:
+        result -= DAY_NS
+    elif diff < -half:
+        result += DAY_NS
+    return result
+
+
+def datetime_to_ns(value: datetime) -> int:
+    """datetime（不带时区，视为UTC）转换为纳秒时间戳"""
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * SECOND_NS + delta.microseconds * 1000
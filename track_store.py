@@ -0,0 +1,240 @@
+from typing import Dict, List, Optional
+from collections import OrderedDict
+
+import numpy as np
+
+from plot_batch import (empty_batch, plot_times, VALID_CALLSIGN, VALID_FL, VALID_ICAO, VALID_SOURCE,
+                        VALID_TRACK_NUMBER)
+
+# 航迹键的类型标记
+KEY_TRACK = 1 << 40     # (SAC, SIC, 航迹号)
+KEY_ICAO = 2 << 40      # (SAC, SIC, ICAO码)
+
+# 默认的航迹超时，超过这么久没有新点迹即结束航迹
+TRACK_TIMEOUT_NS = 120 * 10**9
+
+
+class PlaneTrackData:
+    """飞机的一条航迹数据，增量维护统计量"""
+    def __init__(self, ICAO: Optional[int], flight_num: Optional[str], key: int = 0) -> None:
+        self.plane_ICAO = ICAO              # 飞机的ICAO码
+        self.flight_num = flight_num          # 航班号
+        self.key = key                      # 航迹键
+        self.count = 0                      # 点迹数
+        self.first_time: Optional[int] = None   # 最早的点迹时间 ns
+        self.last_time: Optional[int] = None    # 最晚的点迹时间 ns
+        self.last_recv = 0                      # 最晚的接收时间 ns，用于判断航迹超时
+        self.first_FL: Optional[float] = None   # 时间上最早的飞行高度
+        self.last_FL: Optional[float] = None    # 时间上最晚的飞行高度
+        self.__first_FL_time = 0
+        self.__last_FL_time = 0
+        self.__min_FL = 99999999
+        self.__max_FL = -99999999
+        self.__chunks: List[np.ndarray] = []    # 尚未合并的数据
+        self.__data: Optional[np.ndarray] = None
+        self.__sorted = True                    # 数据是否已按时间排序
+
+    @property
+    def track_data(self) -> np.ndarray:
+        """该航迹的所有数据，按时间排序的列式数组"""
+        if self.__chunks:
+            if self.__data is not None:
+                self.__chunks.insert(0, self.__data)
+            self.__data = np.concatenate(self.__chunks)
+            self.__chunks = []
+        if self.__data is None:
+            self.__data = empty_batch()
+        if not self.__sorted:
+            self.__sort()
+        return self.__data
+
+    def add_data(self, data: np.ndarray) -> None:
+        """补充数据"""
+        if len(data) == 0:
+            return
+        times = plot_times(data)
+        t_min, t_max = int(times.min()), int(times.max())
+        # 新数据乱序或早于已有数据时，读取时再排序
+        unordered = len(times) > 1 and bool(np.any(np.diff(times) < 0))
+        if self.count == 0:
+            self.first_time, self.last_time = t_min, t_max
+        else:
+            unordered = unordered or t_min < self.last_time
+            self.first_time = min(self.first_time, t_min)
+            self.last_time = max(self.last_time, t_max)
+        if unordered:
+            self.__sorted = False
+        self.count += len(data)
+        self.last_recv = max(self.last_recv, int(data['recv_time'].max()))
+
+        valid = data['valid']
+        if self.plane_ICAO is None and np.any(valid & VALID_ICAO):
+            self.plane_ICAO = int(data['ICAO'][np.argmax((valid & VALID_ICAO) != 0)])
+        if self.flight_num is None and np.any(valid & VALID_CALLSIGN):
+            self.flight_num = data['callsign'][np.argmax((valid & VALID_CALLSIGN) != 0)].decode()
+
+        mask = (valid & VALID_FL) != 0
+        if np.any(mask):
+            fl, fl_times = data['FL'][mask], times[mask]
+            self.__min_FL = min(self.__min_FL, float(fl.min()))
+            self.__max_FL = max(self.__max_FL, float(fl.max()))
+            i = int(np.argmin(fl_times))                        # 时间相同取先出现的
+            j = len(fl_times) - 1 - int(np.argmax(fl_times[::-1]))  # 时间相同取后出现的
+            if self.first_FL is None or fl_times[i] < self.__first_FL_time:
+                self.first_FL, self.__first_FL_time = float(fl[i]), int(fl_times[i])
+            if self.last_FL is None or fl_times[j] >= self.__last_FL_time:
+                self.last_FL, self.__last_FL_time = float(fl[j]), int(fl_times[j])
+        self.__chunks.append(data)
+
+    def __sort(self) -> None:
+        data = self.__data
+        self.__data = data[np.argsort(plot_times(data), kind='stable')]
+        self.__sorted = True
+
+    def min_FL(self) -> float:
+        """飞机的最低飞行高度"""
+        return self.__min_FL
+
+    def max_FL(self) -> float:
+        """飞机的最高飞行高度"""
+        return self.__max_FL
+
+    def is_land(self) -> bool:
+        """飞机是否降落"""
+        if self.first_FL is None:
+            return False
+        return self.last_FL - self.first_FL < 0
+
+
+def _group(keys: np.ndarray) -> List[np.ndarray]:
+    """按键分组，返回每组的行号，组按首次出现的顺序排列、组内保持原顺序"""
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(uniq)))[:-1])
+    return [groups[k] for k in np.argsort(first, kind='stable')]
+
+
+def group_tracks(batch: np.ndarray) -> Dict[str, PlaneTrackData]:
+    """按航班号把点迹归类为航迹，航迹按首次出现的顺序排列"""
+    track_map: Dict[str, PlaneTrackData] = {}
+    mask = (batch['valid'] & (VALID_CALLSIGN | VALID_ICAO)) == (VALID_CALLSIGN | VALID_ICAO)
+    batch = batch[mask]
+    if len(batch) == 0:
+        return track_map
+    for rows in _group(batch['callsign']):
+        rows = batch[rows]
+        flight_num = rows['callsign'][0].decode()
+        track_map[flight_num] = plane_track_data = PlaneTrackData(int(rows['ICAO'][0]), flight_num)
+        plane_track_data.add_data(rows)
+    return track_map
+
+
+def track_keys(batch: np.ndarray) -> np.ndarray:
+    """计算每条点迹的航迹键: 优先(SAC, SIC, 航迹号)，其次(SAC, SIC, ICAO码)，都没有为0，不同雷达的点迹不会归入同一航迹"""
+    valid = batch['valid']
+    by_track = (valid & (VALID_SOURCE | VALID_TRACK_NUMBER)) == (VALID_SOURCE | VALID_TRACK_NUMBER)
+    by_icao = ~by_track & ((valid & VALID_ICAO) != 0)
+    keys = np.zeros(len(batch), dtype=np.int64)
+    keys[by_track] = (KEY_TRACK | (batch['SAC'][by_track].astype(np.int64) << 24)
+                      | (batch['SIC'][by_track].astype(np.int64) << 16)
+                      | batch['track_number'][by_track].astype(np.int64))
+    source = np.where((valid[by_icao] & VALID_SOURCE) != 0,
+                      (batch['SAC'][by_icao].astype(np.int64) << 32) | (batch['SIC'][by_icao].astype(np.int64) << 24), 0)
+    keys[by_icao] = KEY_ICAO | source | batch['ICAO'][by_icao].astype(np.int64)
+    return keys
+
+
+class TrackStore:
+    """
+    增量归类航迹，点迹到达时即归入对应航迹
+    超过timeout没有新点迹的航迹结束并返回，内存只与同时存在的航迹数有关
+    """
+    def __init__(self, timeout: int = TRACK_TIMEOUT_NS) -> None:
+        self.timeout = timeout          # 航迹超时 ns
+        self.tracks: 'OrderedDict[int, PlaneTrackData]' = OrderedDict()     # 按最近更新排序
+        self.watermark = 0              # 已见到的最晚接收时间 ns
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def add_batch(self, batch: np.ndarray) -> List[PlaneTrackData]:
+        """
+        归类一批点迹
+        :return 因超时而结束的航迹
+        """
+        keys = track_keys(batch)
+        mask = keys != 0
+        batch, keys = batch[mask], keys[mask]
+        if len(batch) == 0:
+            return []
+        tracks = self.tracks
+        recv_times = batch['recv_time']
+        closed = []
+        updated = []
+        for rows in _group(keys):
+            key = int(keys[rows[0]])
+            # 按接收时间切分，间隔超过timeout的点迹属于不同的航迹，与超时判断一致、与分批方式无关
+            rows = rows[np.argsort(recv_times[rows], kind='stable')]
+            row_times = recv_times[rows]
+            segments = np.split(rows, np.flatnonzero(np.diff(row_times) > self.timeout) + 1)
+            track = tracks.pop(key, None)
+            if track is not None and row_times[0] - track.last_recv > self.timeout:
+                closed.append(track)
+                track = None
+            for i, segment in enumerate(segments):
+                if i > 0:
+                    closed.append(track)    # 批内已结束的上一段
+                    track = None
+                if track is None:
+                    track = PlaneTrackData(None, None, key)
+                track.add_data(batch[segment])
+            updated.append((track.last_recv, key))
+            tracks[key] = track
+        # 按最后接收时间重新插入到末尾，保持队列按最近更新排序
+        for _, key in sorted(updated):
+            tracks.move_to_end(key)
+        # 用接收时间推进，避免个别异常的Time-of-Day使所有航迹提前结束
+        self.watermark = max(self.watermark, int(recv_times.max()))
+        return closed + self.expire(self.watermark)
+
+    def expire(self, now: int) -> List[PlaneTrackData]:
+        """结束在now之前已超时的航迹"""
+        result = []
+        tracks = self.tracks
+        deadline = now - self.timeout
+        # 按最近更新排序，只需检查队首
+        while tracks:
+            key, track = next(iter(tracks.items()))
+            if track.last_recv >= deadline:
+                break
+            tracks.popitem(last=False)
+            result.append(track)
+        return result
+
+    def advance(self, now: int) -> List[PlaneTrackData]:
+        """
+        没有点迹时用其它消息（如CAT034扇区消息）的接收时间推进，结束已超时的航迹
+        :return 结束的航迹
+        """
+        self.watermark = max(self.watermark, now)
+        return self.expire(self.watermark)
+
+    def snapshot(self) -> np.ndarray:
+        """未结束航迹的全部点迹，与watermark一起即可恢复航迹状态"""
+        datas = [track.track_data for track in self.tracks.values()]
+        return np.concatenate(datas) if datas else empty_batch()
+
+    def restore(self, plots: np.ndarray, watermark: int) -> None:
+        """由snapshot的点迹恢复未结束的航迹"""
+        self.tracks.clear()
+        self.add_batch(plots)
+        self.watermark = max(self.watermark, watermark)
+        # 按最后接收时间排序，与逐批到达时的顺序一致
+        for key, _ in sorted(self.tracks.items(), key=lambda item: item[1].last_recv):
+            self.tracks.move_to_end(key)
+
+    def close_all(self) -> List[PlaneTrackData]:
+        """结束所有航迹"""
+        result = list(self.tracks.values())
+        self.tracks.clear()
+        return result
@@ -0,0 +1,252 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import re
+
+# 数据项的长度类型
+FIXED = 'fixed'             # 定长 例: 2
+EXTENDED = 'extended'       # 依据FX位扩展 例: 1+
+REPETITIVE = 'repetitive'   # 重复项 例: 1+8*n
+COMPOUND = 'compound'       # 复合项 例: 1+1+
+EXPLICIT = 'explicit'       # 显式长度（SP/RE），首字节为总长度
+
+# 复合数据项各子字段的长度（按主字段从高到低的位序，'0'表示空闲位），未列出的数据项每个子字段按1字节
+COMPOUND_SUBFIELDS: Dict[str, Tuple[str, ...]] = {
+    'I048/120': ('2', '1+6*n'),
+    'I034/050': ('1', '0', '0', '1', '1', '2', '0'),
+    'I034/060': ('1', '0', '0', '1', '1', '1', '0'),
+}
+
+# 数据项解码函数: (记录对象, 数据, 数据项起始位置) -> None
+Decoder = Callable[[Any, memoryview, int], None]
+# 数据项长度函数: (数据, 数据项起始位置) -> 字节数
+Sizer = Callable[[memoryview, int], int]
+# 处理步骤: ((数据项, 相对本步起点的位置), ...), 定长部分的字节数, 之后变长数据项的长度函数
+Step = Tuple[Tuple[Tuple[str, int], ...], int, Optional[Sizer]]
+
+# 每个UAP表最多缓存的FSPEC种类
+PLAN_CACHE_SIZE = 4096
+
+_RE_FIXED = re.compile(r'^(\d+)$')
+_RE_EXTENDED = re.compile(r'^(\d+)\+$')
+_RE_REPETITIVE = re.compile(r'^\(?1\+(\d+)\*[nN]\)?$')
+_RE_COMPOUND = re.compile(r'^1\+1\+$')
+
+# FSPEC单个字节中置位的FRN偏移（1~7），FX位不计
+FSPEC_BITS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(i + 1 for i in range(7) if value & (0x80 >> i)) for value in range(256)
+)
+
+
+def size_fixed(length: int) -> Sizer:
+    """定长数据项"""
+    return lambda buffer, offset: length
+
+
+def size_extended(min: int = 1, step: int = 1) -> Sizer:
+    """依据FX位扩展的数据项"""
+    def sizer(buffer: memoryview, offset: int) -> int:
+        end = offset + min
+        while buffer[end - 1] & 1:
+            end += step
+        return end - offset
+    return sizer
+
+
+def size_repetitive(step: int) -> Sizer:
+    """重复数据项，首字节为重复次数"""
+    return lambda buffer, offset: 1 + buffer[offset] * step
+
+
+def size_explicit() -> Sizer:
+    """显式长度数据项，首字节为包含自身的总长度"""
+    return lambda buffer, offset: buffer[offset]
+
+
+def size_compound(subfields: Tuple[Sizer, ...]) -> Sizer:
+    """复合数据项，主字段依据FX位扩展，每个置位对应一个子字段"""
+    def sizer(buffer: memoryview, offset: int) -> int:
+        end = offset
+        indexes = []
+        base = 0
+        while True:
+            value = buffer[end]
+            end += 1
+            indexes.extend(base + i - 1 for i in FSPEC_BITS[value])
+            base += 7
+            if not value & 1:
+                break
+        for i in indexes:
+            if i < len(subfields):
+                end += subfields[i](buffer, end)
+            else:
+                end += 1
+        return end - offset
+    return sizer
+
+
+def parse_length(length: str) -> Tuple[str, Sizer]:
+    """解析UAP表中的长度描述"""
+    length = length.strip()
+    match = _RE_FIXED.match(length)
+    if match:
+        return FIXED, size_fixed(int(match.group(1)))
+    match = _RE_EXTENDED.match(length)
+    if match:
+        return EXTENDED, size_extended(int(match.group(1)))
+    match = _RE_REPETITIVE.match(length)
+    if match:
+        return REPETITIVE, size_repetitive(int(match.group(1)))
+    if _RE_COMPOUND.match(length):
+        return COMPOUND, size_compound(())
+    raise ValueError(f'无法识别的数据项长度: {length}')
+
+
+class UAPItem:
+    """UAP表中的一项"""
+    def __init__(self, FRN: int, DataItem: str, DataItemDescription: str, Length: str) -> None:
+        self.FRN = FRN
+        self.DataItem = DataItem
+        self.DataItemDescription = DataItemDescription
+        self.Length = Length
+        if DataItem.startswith(('SP-', 'RE-')):
+            self.kind, self.size = EXPLICIT, size_explicit()
+        elif DataItem in COMPOUND_SUBFIELDS:
+            subfields = tuple(parse_length(i)[1] for i in COMPOUND_SUBFIELDS[DataItem])
+            self.kind, self.size = COMPOUND, size_compound(subfields)
+        else:
+            self.kind, self.size = parse_length(Length)
+        # 定长数据项直接记录长度，省去函数调用
+        self.fixed: int = int(Length) if self.kind == FIXED else 0
+
+    def __repr__(self) -> str:
+        return f'UAPItem({self.FRN}, {self.DataItem!r}, {self.Length!r})'
+
+
+def load_UAP(path: str) -> List[UAPItem]:
+    """从文本文件中读取UAP表，每行格式: FRN 数据项 描述 长度"""
+    result = []
+    with open(path, 'r', encoding='UTF-8') as f:
+        for line in f:
+            soc = line.split()
+            if len(soc) < 3 or not soc[0].isdigit():
+                continue    # 空行与FX行
+            result.append(UAPItem(int(soc[0]), soc[1], ' '.join(soc[2:-1]), soc[-1]))
+    return result
+
+
+class CompiledUAP:
+    """
+    编译后的UAP表，按FRN直接索引长度与解码函数
+    decoders 数据项 -> 解码函数；CAT048按列解码时为(字节数, 转换函数)，只用于plan、locate定位，不能用decode
+    """
+    def __init__(self, CAT: int, items: List[UAPItem], decoders: Dict[str, Any]) -> None:
+        self.CAT = CAT
+        self.items = items
+        self.decoders = decoders
+        size = max([i.FRN for i in items] + [0]) + 1
+        # FRN -> (定长长度, 长度函数, 解码函数)，未定义的FRN为None
+        self.entries: List[Optional[Tuple[int, Sizer, Any]]] = [None] * size
+        self.items_by_FRN: List[str] = [''] * size     # FRN -> 数据项名
+        self.__plans: Dict[bytes, Tuple[Step, ...]] = {}    # FSPEC -> 处理步骤
+        self.__records: Dict[bytes, Tuple[Step, ...]] = {}  # FSPEC -> 处理到记录末尾的步骤
+        for item in items:
+            self.entries[item.FRN] = (item.fixed, item.size, decoders.get(item.DataItem))
+            self.items_by_FRN[item.FRN] = item.DataItem
+
+    @classmethod
+    def from_file(cls, CAT: int, path: str, decoders: Dict[str, Any]) -> 'CompiledUAP':
+        """从UAP文本文件编译"""
+        return cls(CAT, load_UAP(path), decoders)
+
+    def select(self, items: Iterable[str]) -> 'CompiledUAP':
+        """只保留指定数据项的解码函数，其余数据项按长度跳过"""
+        wanted = set(items)
+        return CompiledUAP(self.CAT, self.items,
+                           {k: v for k, v in self.decoders.items() if k in wanted})
+
+    def decode(self, record: Any, buffer: memoryview, fspec_offset: int, offset: int) -> int:
+        """
+        根据FSPEC依次处理数据项
+        fspec_offset FSPEC的起始位置，offset 第一个数据项的起始位置
+        :return 处理完成后的位置
+        """
+        entries = self.entries
+        count = len(entries)
+        base = 0
+        index = fspec_offset
+        fspec_end = offset
+        while index < fspec_end:
+            for bit in FSPEC_BITS[buffer[index]]:
+                frn = base + bit
+                entry = entries[frn] if frn < count else None
+                if entry is None:
+                    raise ValueError(f'CAT{self.CAT:03d} 未定义的FRN {frn}')
+                fixed, sizer, decoder = entry
+                if decoder is not None:
+                    decoder(record, buffer, offset)
+                offset += fixed or sizer(buffer, offset)
+            base += 7
+            index += 1
+        return offset
+
+    def plan(self, fspec: bytes, wanted: Optional[Iterable[str]] = None, whole: bool = False) -> Tuple[Step, ...]:
+        """
+        根据FSPEC编排处理步骤，相同的FSPEC结果相同，可以缓存
+        连续的定长数据项合并为一次跳过，只有变长数据项需要计算长度
+        wanted 需要位置的数据项，为None时为全部；指定时最后一个需要的数据项之后不再处理
+        whole 指定wanted时仍处理到记录末尾，用于定位同一数据块中的下一条记录
+        """
+        wanted = None if wanted is None else set(wanted)
+        entries = self.entries
+        count = len(entries)
+        steps: List[Step] = []
+        hits: List[Tuple[str, int]] = []
+        delta = 0
+        for i, value in enumerate(fspec):
+            for bit in FSPEC_BITS[value]:
+                frn = i * 7 + bit
+                entry = entries[frn] if frn < count else None
+                if entry is None:
+                    raise ValueError(f'CAT{self.CAT:03d} 未定义的FRN {frn}')
+                fixed, sizer, _ = entry
+                item = self.items_by_FRN[frn]
+                if wanted is None or item in wanted:
+                    hits.append((item, delta))
+                if fixed:
+                    delta += fixed
+                else:
+                    steps.append((tuple(hits), delta, sizer))
+                    hits, delta = [], 0
+        steps.append((tuple(hits), delta, None))
+        if wanted is not None and not whole:
+            while len(steps) > 1 and not steps[-1][0]:
+                steps.pop()
+            last_hits, last_delta, last_sizer = steps[-1]
+            # 最后一个需要的数据项是变长数据项（位于该步的末尾）时保留其长度计算，结束位置包含整个数据项
+            if not any(delta == last_delta for _, delta in last_hits):
+                last_sizer = None
+            steps[-1] = (last_hits, last_delta, last_sizer)
+        return tuple(steps)
+
+    def locate(self, buffer: memoryview, fspec_offset: int, offset: int,
+               whole: bool = False) -> Tuple[Dict[str, int], int]:
+        """
+        根据FSPEC计算有解码函数的数据项的起始位置，不做解码
+        fspec_offset FSPEC的起始位置，offset 第一个数据项的起始位置
+        whole 处理完整条记录
+        :return (数据项 -> 起始位置, 最后一个有解码函数的数据项的结束位置，whole时为记录的结束位置)
+        """
+        fspec = bytes(buffer[fspec_offset:offset])
+        plans = self.__records if whole else self.__plans
+        steps = plans.get(fspec)
+        if steps is None:
+            if len(plans) >= PLAN_CACHE_SIZE:
+                plans.clear()
+            steps = plans[fspec] = self.plan(fspec, self.decoders, whole)
+        result = {}
+        for hits, skip, sizer in steps:
+            for item, delta in hits:
+                result[item] = offset + delta
+            offset += skip
+            if sizer is not None:
+                offset += sizer(buffer, offset)
+        return result, offset